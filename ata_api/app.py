@@ -1,17 +1,72 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request, status
-from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from starlette.exceptions import ExceptionMiddleware
 
+from ata_api.cache import prescription_cache
+from ata_api.cors import CORSMiddleware, CORSPolicy
+from ata_api.db import dispose_engine, warm_up_engine
 from ata_api.monitoring.logging import logger
+from ata_api.monitoring.metrics import metric_aggregator
 from ata_api.routing import LoggerRouteHandler
-from ata_api.settings import settings
+from ata_api.settings import get_settings, settings
+from ata_api.stats import assignment_counts
+from ata_api.write_behind import write_behind_queue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Sets up per-container resources once on startup and releases them on shutdown, so that
+    requests don't pay for them. (See: https://fastapi.tiangolo.com/advanced/events/.)
+    """
+    # Populate the cache used by the get_settings dependency, and compile assignment configs
+    get_settings().assignments
+    logger.info("Starting up")
+    try:
+        # Long-lived workers will need their whole pool under load, so don't leave it to their first requests
+        await warm_up_engine(fill_pool=settings.aws_lambda_function_name is None)
+    except Exception:
+        # Don't fail startup: endpoints that don't need the DB should keep working
+        logger.exception("Failed to warm up DB engine")
+    await prescription_cache.warm_up()
+
+    # In Lambda, metrics are flushed at the end of each invocation instead (see ata_api.main.handler)
+    # So are the write-behind queue and assignment counts
+    periodic_tasks: list[asyncio.Task[None]] = []
+    if settings.aws_lambda_function_name is None:
+        periodic_tasks = [
+            asyncio.create_task(metric_aggregator.flush_periodically(settings.metrics_flush_interval)),
+            asyncio.create_task(write_behind_queue.flush_periodically(settings.write_behind_flush_interval)),
+            asyncio.create_task(assignment_counts.flush_periodically(settings.stats_flush_interval)),
+        ]
+
+    # See the readiness endpoint
+    app.state.ready = True
+    yield
+
+    app.state.ready = False
+    logger.info("Shutting down")
+    for task in periodic_tasks:
+        task.cancel()
+    await write_behind_queue.flush()
+    await assignment_counts.flush()
+    metric_aggregator.flush()
+    await dispose_engine()
+    await prescription_cache.close()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 # Add FastAPI context to logs
 app.router.route_class = LoggerRouteHandler
 # Add CORS whitelist
-app.add_middleware(CORSMiddleware, allow_origins=[*settings.cors_allowed_origins], allow_methods=["GET"])
+app.state.cors_policy = CORSPolicy(settings.cors_allowed_origins, max_age=settings.cors_max_age)
+# Whether the app is warmed up and not shutting down or draining (see ata_api.server)
+app.state.ready = False
+app.add_middleware(CORSMiddleware)
 # Add exception middleware to log unhandled exceptions
 app.add_middleware(ExceptionMiddleware, handlers=app.exception_handlers)
 
@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_right
+from collections.abc import Sequence
+from enum import auto
+from functools import lru_cache
+from itertools import accumulate
+from typing import Optional
+from uuid import UUID
+
+from ata_db_models.models import Group
+from pydantic import BaseModel, root_validator, validator
+
+from ata_api.helpers.enum import StrEnumKebab
+from ata_api.monitoring.logging import logger
+from ata_api.site import SiteName
+
+# Order of the groups that weights refer to
+GROUPS = [Group.A, Group.B, Group.C]
+
+
+class AssignmentStrategy(StrEnumKebab):
+    # Draw a group at random on a user's first visit. Needs to be persisted for the assignment to stick.
+    RANDOM = auto()
+    # Derive the group from a hash of the site name, user ID and salt. Sticks, and is the same on every node,
+    # without being persisted.
+    HASH = auto()
+
+
+class PersistenceMode(StrEnumKebab):
+    # Persist new assignments before responding
+    SYNC = auto()
+    # Persist new assignments after responding
+    BACKGROUND = auto()
+    # Queue new assignments and persist them in batches after responding. Until they're persisted, they only stick
+    # on the same container.
+    WRITE_BEHIND = auto()
+    # Don't persist new assignments
+    NONE = auto()
+
+
+class AssignmentConfig(BaseModel):
+    """
+    How users of a site are assigned to groups.
+
+    Hash-based assignments that aren't persisted synchronously are derived again on each visit until they're
+    persisted, if ever, so changing the strategy, salt, weights or whether the site is enabled would move returning
+    users to other groups. Such sites need weights, rather than taking each request's, and AssignmentRegistry keeps
+    their configs on reload (containers would otherwise disagree, as each also caches the groups it served).
+    """
+
+    strategy: AssignmentStrategy = AssignmentStrategy.RANDOM
+    salt: str = ""
+    persistence: PersistenceMode = PersistenceMode.SYNC
+    # Weight of each group (arm) new users are assigned to. If set, the weights requests send are ignored.
+    weights: Optional[dict[Group, int]] = None
+    # While disabled, all new users are assigned to the control group
+    enabled: bool = True
+    control_group: Group = Group.A
+
+    @root_validator(skip_on_failure=True)
+    def random_assignments_are_persisted(cls, values: dict[str, str]) -> dict[str, str]:
+        if values["strategy"] == AssignmentStrategy.RANDOM and values["persistence"] not in (
+            PersistenceMode.SYNC,
+            PersistenceMode.WRITE_BEHIND,
+        ):
+            raise ValueError("Random assignments must be persisted synchronously or written behind to stick")
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def unpersisted_hash_assignments_have_weights(cls, values: dict[str, str]) -> dict[str, str]:
+        if (
+            values["strategy"] == AssignmentStrategy.HASH
+            and values["persistence"] != PersistenceMode.SYNC
+            and values["weights"] is None
+        ):
+            raise ValueError("Hash-based assignments that aren't persisted synchronously need weights to stick")
+        return values
+
+    @property
+    def unpersisted_hash(self) -> bool:
+        """
+        Whether returning users may only keep their group by deriving it again from the hash.
+        """
+        return self.strategy == AssignmentStrategy.HASH and self.persistence != PersistenceMode.SYNC
+
+    def reassigns(self, config: "AssignmentConfig") -> bool:
+        """
+        Whether switching to the config would move returning users whose assignments weren't persisted to other
+        groups.
+        """
+        if not self.unpersisted_hash:
+            return False
+        if not self.enabled and not config.enabled:
+            return bool(self.control_group != config.control_group)
+        return (self.strategy, self.salt, self.weights, self.enabled) != (
+            config.strategy,
+            config.salt,
+            config.weights,
+            config.enabled,
+        )
+
+    @validator("weights")
+    def weights_are_valid(cls, weights: Optional[dict[Group, int]]) -> Optional[dict[Group, int]]:
+        if weights is not None:
+            WeightTable([weights.get(group, 0) for group in GROUPS])
+        return weights
+
+
+class WeightTable:
+    """
+    Cumulative weights of the groups, so that picking a group is a single bisect.
+    """
+
+    def __init__(self, weights: Sequence[int]) -> None:
+        if len(weights) != len(GROUPS) or any(weight < 0 for weight in weights):
+            raise ValueError(f"Expected {len(GROUPS)} non-negative weights")
+        self.cumulative_weights = list(accumulate(weights))
+        self.total = self.cumulative_weights[-1]
+        if self.total <= 0:
+            raise ValueError("At least one weight must be positive")
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def from_weights(weights: Sequence[int]) -> "WeightTable":
+        """
+        Compiles the weights once per distinct weights, e.g., as sent by requests.
+        """
+        return WeightTable(weights)
+
+    def pick(self, point: float) -> Group:
+        """
+        Returns the group whose range of weights contains the point, from [0, total).
+        """
+        return GROUPS[bisect_right(self.cumulative_weights, point)]
+
+
+def draw_group(table: WeightTable) -> Group:
+    """
+    Randomly draws a group with the table's weights.
+    """
+    return table.pick(random.random() * table.total)
+
+
+def hash_point(site_name: SiteName, user_id: UUID, salt: str, total: int) -> int:
+    digest = hashlib.sha256(f"{salt}:{site_name}:{user_id}".encode()).digest()
+    # Scale the first 64 bits of the hash down to [0, total)
+    return int.from_bytes(digest[:8], "big") * total >> 64
+
+
+def hash_group(site_name: SiteName, user_id: UUID, salt: str, table: WeightTable) -> Group:
+    """
+    Deterministically maps the user onto a group with the table's weights, using a stable hash.
+    """
+    return table.pick(hash_point(site_name, user_id, salt, table.total))
+
+
+class CompiledAssignment:
+    """
+    Assignment config of a site, with its weights compiled.
+    """
+
+    def __init__(self, config: AssignmentConfig) -> None:
+        self.config = config
+        self.table = (
+            WeightTable([config.weights.get(group, 0) for group in GROUPS]) if config.weights is not None else None
+        )
+
+    def assign(self, site_name: SiteName, user_id: UUID, weights: Sequence[int]) -> Group:
+        """
+        Assigns a new user to a group, with the site's weights if it has any, or else with the given weights.
+        """
+        if not self.config.enabled:
+            return self.config.control_group
+
+        table = self.table or WeightTable.from_weights(tuple(weights))
+        if self.config.strategy == AssignmentStrategy.HASH:
+            return hash_group(site_name, user_id, self.config.salt, table)
+        return draw_group(table)
+
+
+class AssignmentFile(BaseModel):
+    """
+    Assignment configs in a JSON file, e.g., {"version": "3", "sites": {"afro-la": {"weights": {"A": 1, "B": 1}}}}.
+    """
+
+    # Configs are only recompiled when the version changes
+    version: str
+    sites: dict[SiteName, AssignmentConfig] = {}
+
+
+class AssignmentRegistry:
+    """
+    Compiled assignment configs of all sites, from settings and, optionally, a file that overrides them. The file is
+    checked for a new version at most every reload_interval seconds, so that configs can change without a deploy.
+    """
+
+    def __init__(
+        self,
+        site_assignments: dict[SiteName, AssignmentConfig],
+        path: Optional[str] = None,
+        reload_interval: float = 30,
+    ) -> None:
+        self.site_assignments = site_assignments
+        self.path = path
+        self.reload_interval = reload_interval
+        self.version: Optional[str] = None
+        self.modified_at: Optional[float] = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+        self._default = CompiledAssignment(AssignmentConfig())
+        self._assignments = self.compile({})
+        self.reload()
+
+    def compile(self, file_assignments: dict[SiteName, AssignmentConfig]) -> dict[SiteName, CompiledAssignment]:
+        configs = {**self.site_assignments, **file_assignments}
+        return {site_name: CompiledAssignment(config) for site_name, config in configs.items()}
+
+    def keep_unpersisted_hash_assignments(
+        self, assignments: dict[SiteName, CompiledAssignment]
+    ) -> dict[SiteName, CompiledAssignment]:
+        """
+        Keeps the current configs of sites whose new ones would reassign returning users (see AssignmentConfig).
+        """
+        for site_name in SiteName:
+            current = self._assignments.get(site_name, self._default)
+            if current.config.reassigns(assignments.get(site_name, self._default).config):
+                logger.error(
+                    f"Kept the assignment config of {site_name}: changing it would reassign returning users whose "
+                    "hash-based assignments weren't persisted"
+                )
+                assignments[site_name] = current
+        return assignments
+
+    def reload(self) -> None:
+        """
+        Recompiles the configs if the file has a new version. Keeps the current ones if it can't be read.
+        """
+        self.checked_at = time.monotonic()
+        if self.path is None:
+            return
+
+        try:
+            modified_at = os.stat(self.path).st_mtime
+            if modified_at == self.modified_at:
+                return
+            with open(self.path) as file:
+                assignment_file = AssignmentFile.parse_obj(json.load(file))
+        except Exception:
+            logger.exception(f"Failed to read assignment configs from {self.path}")
+            return
+
+        self.modified_at = modified_at
+        if assignment_file.version != self.version:
+            assignments = self.compile(assignment_file.sites)
+            # The first version loaded is the one other containers serve, rather than those of settings
+            if self.version is not None:
+                assignments = self.keep_unpersisted_hash_assignments(assignments)
+            self._assignments = assignments
+            logger.info(f"Loaded version {assignment_file.version} of assignment configs")
+            self.version = assignment_file.version
+
+    def get(self, site_name: SiteName) -> CompiledAssignment:
+        if self.path is not None and time.monotonic() - self.checked_at >= self.reload_interval:
+            # Only one thread checks; the others keep using the current configs in the meantime
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.reload()
+                finally:
+                    self._lock.release()
+        return self._assignments.get(site_name, self._default)
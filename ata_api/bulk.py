@@ -0,0 +1,123 @@
+import csv
+import json
+from collections.abc import AsyncIterator, Sequence
+from enum import auto
+from typing import Any, Optional
+from uuid import UUID
+
+from ata_db_models.models import Group
+from sqlalchemy.engine import Row
+
+from ata_api.helpers.enum import StrEnumKebab
+from ata_api.site import SiteName
+
+
+class BulkFormat(StrEnumKebab):
+    # One JSON object per line
+    NDJSON = auto()
+    # With a header line
+    CSV = auto()
+
+
+MEDIA_TYPES = {
+    BulkFormat.NDJSON: "application/x-ndjson",
+    BulkFormat.CSV: "text/csv",
+}
+EXPORT_COLUMNS = ["site_name", "user_id", "group", "last_updated"]
+
+
+class InvalidRowError(ValueError):
+    """
+    A row of an import that can't be parsed into a prescription.
+    """
+
+    def __init__(self, line_number: int, reason: str) -> None:
+        super().__init__(f"Line {line_number}: {reason}")
+
+
+def format_header(format: BulkFormat) -> bytes:
+    return ",".join(EXPORT_COLUMNS).encode() + b"\n" if format == BulkFormat.CSV else b""
+
+
+def format_prescriptions(rows: Sequence[Row], format: BulkFormat) -> bytes:
+    """
+    Formats rows of PRESCRIPTION_COLUMNS. None of their values need quoting or escaping, so they're formatted
+    directly rather than through the json or csv modules.
+    """
+    if format == BulkFormat.CSV:
+        lines = (f"{r.site_name},{r.user_id},{r.group},{r.last_updated.isoformat()}\n" for r in rows)
+    else:
+        lines = (
+            f'{{"site_name":"{r.site_name}","user_id":"{r.user_id}","group":"{r.group}",'
+            + f'"last_updated":"{r.last_updated.isoformat()}"}}\n'
+            for r in rows
+        )
+    return "".join(lines).encode()
+
+
+def decode_line(line: bytes, line_number: int) -> str:
+    try:
+        return line.decode()
+    except UnicodeDecodeError as e:
+        raise InvalidRowError(line_number, "invalid UTF-8") from e
+
+
+async def iterate_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Splits a stream of chunks into lines, holding at most one chunk and one partial line in memory.
+    """
+    remainder = b""
+    line_number = 0
+    async for chunk in chunks:
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            line_number += 1
+            yield decode_line(line, line_number)
+    if remainder != b"":
+        yield decode_line(remainder, line_number + 1)
+
+
+def parse_prescription(values: dict[str, Any], site_name: SiteName, line_number: int) -> tuple[UUID, Group]:
+    if values.get("site_name", site_name) != site_name:
+        raise InvalidRowError(line_number, f"site_name must be {site_name}")
+    user_id, group = values.get("user_id"), values.get("group")
+    # JSON values may be of any type, which UUID doesn't reject with a ValueError
+    if isinstance(user_id, str) and isinstance(group, str):
+        try:
+            return UUID(user_id), Group(group)
+        except ValueError:
+            pass
+    raise InvalidRowError(line_number, "expected a user_id (UUID) and a group (A, B or C)")
+
+
+async def parse_prescriptions(
+    chunks: AsyncIterator[bytes], format: BulkFormat, site_name: SiteName
+) -> AsyncIterator[tuple[UUID, Group]]:
+    """
+    Parses a stream of prescriptions of the site, in the same format as exports, as (user_id, group). Columns other
+    than user_id and group are optional, and ignored, except that site_name must match if given.
+    """
+    header: Optional[list[str]] = None
+    line_number = 0
+    async for line in iterate_lines(chunks):
+        line_number += 1
+        if line.strip() == "":
+            continue
+
+        if format == BulkFormat.CSV:
+            values = next(csv.reader([line]))
+            # The first line that isn't blank
+            if header is None:
+                header = values
+                continue
+            row = dict(zip(header, values))
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise InvalidRowError(line_number, "invalid JSON") from e
+            if not isinstance(row, dict):
+                raise InvalidRowError(line_number, "expected a JSON object")
+
+        yield parse_prescription(row, site_name, line_number)
@@ -0,0 +1,219 @@
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Optional
+from uuid import UUID
+
+from ata_db_models.models import Group
+from aws_lambda_powertools.metrics import MetricUnit
+
+from ata_api.helpers.cache import LRUCache
+from ata_api.monitoring.logging import logger
+from ata_api.monitoring.metrics import CloudWatchMetric, metric_aggregator, metrics
+from ata_api.settings import Settings, settings
+from ata_api.site import SiteName
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+PrescriptionKey = tuple[SiteName, UUID]
+
+
+class SharedPrescriptionCache(ABC):
+    """
+    Cache of prescriptions shared by all containers and workers.
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[PrescriptionKey]) -> list[Optional[Group]]:
+        """
+        Returns the cached group of each key, or None where it's missing.
+        """
+
+    @abstractmethod
+    async def set_many(self, items: Sequence[tuple[PrescriptionKey, Group]]) -> None:
+        ...
+
+    async def warm_up(self) -> None:
+        """
+        Opens a first pooled connection, if any, so that the first request doesn't have to.
+        """
+
+    async def close(self) -> None:
+        """
+        Releases pooled connections, if any.
+        """
+
+
+class RedisPrescriptionCache(SharedPrescriptionCache):
+    """
+    Shared cache on any server that speaks the Redis protocol (e.g., ElastiCache).
+
+    Errors never propagate, so that callers fall back to the DB: they're logged and treated as misses,
+    and the server is left alone for retry_after seconds, so that requests don't all wait on timeouts
+    while it's down.
+    """
+
+    def __init__(self, client: "Redis", ttl: Optional[int] = None, retry_after: float = 30) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.unavailable_until = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RedisPrescriptionCache":
+        # Optional dependency, only needed when a shared cache is configured
+        from redis.asyncio import BlockingConnectionPool, Redis
+
+        pool = BlockingConnectionPool.from_url(
+            settings.shared_cache_url,
+            max_connections=settings.shared_cache_max_connections,
+            timeout=settings.shared_cache_timeout,
+            socket_timeout=settings.shared_cache_timeout,
+            socket_connect_timeout=settings.shared_cache_timeout,
+        )
+        return cls(
+            client=Redis(connection_pool=pool),
+            ttl=settings.shared_cache_ttl,
+            retry_after=settings.shared_cache_retry_after,
+        )
+
+    @staticmethod
+    def format_key(key: PrescriptionKey) -> str:
+        site_name, user_id = key
+        return f"ata:prescription:{site_name}:{user_id.hex}"
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.unavailable_until
+
+    def handle_error(self, action: str) -> None:
+        logger.warning(f"Shared cache unavailable while trying to {action}", exc_info=True)
+        self.unavailable_until = time.monotonic() + self.retry_after
+
+    async def get_many(self, keys: Sequence[PrescriptionKey]) -> list[Optional[Group]]:
+        if len(keys) == 0 or not self.available:
+            return [None] * len(keys)
+
+        try:
+            values: list[Optional[bytes]] = await self.client.mget([self.format_key(key) for key in keys])
+        except Exception:
+            self.handle_error("get prescriptions")
+            return [None] * len(keys)
+
+        return [self.parse_group(value) if value is not None else None for value in values]
+
+    @staticmethod
+    def parse_group(value: bytes) -> Optional[Group]:
+        # Values that aren't groups (e.g., written by something else) are treated as misses, and overwritten on set
+        try:
+            return Group(value.decode())
+        except ValueError:
+            logger.warning("Invalid group %r in shared cache, treating it as a miss", value)
+            return None
+
+    async def set_many(self, items: Sequence[tuple[PrescriptionKey, Group]]) -> None:
+        if len(items) == 0 or not self.available:
+            return
+
+        try:
+            # Send all commands in a single round trip
+            async with self.client.pipeline(transaction=False) as pipeline:
+                for key, group in items:
+                    pipeline.set(self.format_key(key), group.value, ex=self.ttl)
+                await pipeline.execute()
+        except Exception:
+            self.handle_error("set prescriptions")
+
+    async def warm_up(self) -> None:
+        try:
+            await self.client.ping()
+        except Exception:
+            self.handle_error("warm up")
+
+    async def close(self) -> None:
+        await self.client.close(close_connection_pool=True)
+
+
+class PrescriptionCache:
+    """
+    Two-tier cache of prescriptions: an in-process LRU cache, in front of an optional shared cache.
+    Reads go through both tiers (a shared hit also populates the local tier), and writes go to both.
+    """
+
+    def __init__(self, local: LRUCache[PrescriptionKey, Group], shared: Optional[SharedPrescriptionCache] = None):
+        self.local = local
+        self.shared = shared
+
+    async def get(self, key: PrescriptionKey) -> Optional[Group]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: Sequence[PrescriptionKey]) -> list[Optional[Group]]:
+        groups = [self.local.get(key) for key in keys]
+        if self.shared is None:
+            return groups
+
+        missing = [i for i, group in enumerate(groups) if group is None]
+        shared_groups = await self.shared.get_many([keys[i] for i in missing])
+        for i, group in zip(missing, shared_groups):
+            if group is not None:
+                self.local.set(keys[i], group)
+                groups[i] = group
+
+        return groups
+
+    async def set(self, key: PrescriptionKey, group: Group) -> None:
+        await self.set_many([(key, group)])
+
+    async def set_many(self, items: Sequence[tuple[PrescriptionKey, Group]]) -> None:
+        for key, group in items:
+            self.local.set(key, group)
+        if self.shared is not None:
+            await self.shared.set_many(items)
+
+    def clear(self) -> None:
+        """
+        Clears the local tier.
+        """
+        self.local.clear()
+
+    async def warm_up(self) -> None:
+        if self.shared is not None:
+            await self.shared.warm_up()
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+
+def create_prescription_cache(settings: Settings) -> PrescriptionCache:
+    shared: Optional[SharedPrescriptionCache] = None
+    if settings.shared_cache_url is not None:
+        shared = RedisPrescriptionCache.from_settings(settings)
+
+    # Assignments never change once written, so repeat visitors can be served from memory by warm containers
+    local: LRUCache[PrescriptionKey, Group] = LRUCache(
+        max_size=settings.prescription_cache_size, ttl=settings.prescription_cache_ttl
+    )
+    return PrescriptionCache(local=local, shared=shared)
+
+
+prescription_cache = create_prescription_cache(settings)
+
+
+def add_cache_metrics() -> None:
+    """
+    Adds the local tier's statistics since the last call to metric_aggregator. Called on each flush.
+    """
+    stats = prescription_cache.local.reset_stats()
+    dimensions = tuple(metrics.default_dimensions.items())
+    for name, value in (
+        (CloudWatchMetric.PRESCRIPTION_CACHE_HITS, stats.hits),
+        (CloudWatchMetric.PRESCRIPTION_CACHE_MISSES, stats.misses),
+        (CloudWatchMetric.PRESCRIPTION_CACHE_EVICTIONS, stats.evictions),
+        (CloudWatchMetric.PRESCRIPTION_CACHE_EXPIRATIONS, stats.expirations),
+    ):
+        metric_aggregator.add(name, MetricUnit.Count, value, dimensions)
+
+
+metric_aggregator.add_flush_callback(add_cache_metrics)
@@ -1,17 +1,151 @@
+from collections.abc import Iterable
 from typing import Optional
 
-from fastapi import Response
-from pydantic import HttpUrl
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from ata_api.helpers.cache import LRUCache
 
-def evaluate_cors(response: Response, origin: Optional[HttpUrl], cors_allowed_origins: set[HttpUrl]) -> None:
+Headers = list[tuple[bytes, bytes]]
+
+
+def normalize_origin(origin: str) -> str:
+    """
+    Normalizes a configured origin to how browsers send it in the Origin header: lowercase, without a trailing slash.
+    """
+    normalized = origin.strip().rstrip("/").lower()
+    scheme, separator, host = normalized.partition("://")
+    if separator == "" or scheme == "" or host == "" or "/" in host:
+        raise ValueError(f"Invalid origin {origin}, expected scheme://host[:port]")
+    return normalized
+
+
+class CORSPolicy:
+    """
+    Origins allowed to make cross-origin requests, normalized once into a set of exact origins and a set of parent
+    domains for wildcard subdomain patterns (e.g., https://*.example.com). Matching an origin costs a set lookup,
+    plus one per label of its host if there are wildcard patterns.
+    """
+
+    def __init__(self, allowed_origins: Iterable[str], allow_methods: Iterable[str] = ("GET",), max_age: int = 600):
+        self.origins: set[str] = set()
+        # (scheme, parent domain[:port]) of wildcard patterns
+        self.wildcards: set[tuple[str, str]] = set()
+        for origin in map(normalize_origin, allowed_origins):
+            scheme, _, host = origin.partition("://")
+            if host.startswith("*."):
+                self.wildcards.add((scheme, host[2:]))
+            else:
+                self.origins.add(origin)
+
+        self.allow_methods = {method.upper() for method in allow_methods}
+        self.max_age = max_age
+        self._preflight_headers: LRUCache[bytes, Headers] = LRUCache(max_size=1024)
+
+    def is_allowed(self, origin: str) -> bool:
+        if origin in self.origins:
+            return True
+        if len(self.wildcards) == 0:
+            return False
+
+        scheme, _, host = origin.partition("://")
+        # Try each parent domain, e.g., b.example.com then example.com for a.b.example.com
+        dot = host.find(".")
+        while dot != -1:
+            if (scheme, host[dot + 1 :]) in self.wildcards:
+                return True
+            dot = host.find(".", dot + 1)
+        return False
+
+    def preflight_headers(self, origin: bytes) -> Headers:
+        """
+        Headers of the preflight response to an allowed origin, cached per origin.
+        """
+        headers = self._preflight_headers.get(origin)
+        if headers is None:
+            headers = [
+                (b"access-control-allow-origin", origin),
+                (b"access-control-allow-methods", ", ".join(sorted(self.allow_methods)).encode()),
+                (b"access-control-max-age", str(self.max_age).encode()),
+                (b"vary", b"Origin"),
+            ]
+            self._preflight_headers.set(origin, headers)
+        return headers
+
+
+class CORSMiddleware:
     """
-    Evaluates the origin of a request and updates the response headers accordingly.
+    The app's only CORS layer. Answers preflight requests itself, with responses cached per origin, and adds
+    Access-Control-Allow-Origin to the responses of allowed origins. The origin is only ever handled as a string.
+
+    The policy is read from app.state.cors_policy on each request, so that it can be replaced (e.g., in tests).
     """
-    if origin is not None and origin in cors_allowed_origins:
-        response.headers.update(
-            {
-                "Access-Control-Allow-Origin": str(origin),
-                "Vary": "Origin",
-            }
-        )
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin: Optional[bytes] = None
+        request_method: Optional[bytes] = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        policy: CORSPolicy = scope["app"].state.cors_policy
+        allowed = policy.is_allowed(origin.decode("latin-1"))
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self.preflight(policy, origin, allowed, request_method, send)
+            return
+
+        if not allowed:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cors_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"access-control-allow-origin", origin))
+                add_vary_origin(headers)
+                message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors_headers)
+
+    @staticmethod
+    async def preflight(policy: CORSPolicy, origin: bytes, allowed: bool, request_method: bytes, send: Send) -> None:
+        if not allowed or request_method.decode("latin-1") not in policy.allow_methods:
+            await send_response(
+                send, 400, [(b"content-type", b"text/plain; charset=utf-8")], b"Disallowed CORS request"
+            )
+            return
+
+        await send_response(send, 200, policy.preflight_headers(origin), b"")
+
+
+def add_vary_origin(headers: Headers) -> None:
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"origin" not in (field.strip().lower() for field in value.split(b",")):
+                headers[i] = (name, value + b", Origin")
+            return
+    headers.append((b"vary", b"Origin"))
+
+
+async def send_response(send: Send, status: int, headers: Headers, body: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [*headers, (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -1,20 +1,29 @@
-from typing import Optional
+from collections import Counter
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Sequence
+from datetime import datetime
+from typing import NamedTuple, Optional, Union, cast
 from uuid import UUID
 
 from ata_db_models.models import Group, UserGroup
 from aws_lambda_powertools.metrics import MetricUnit
 from fastapi import HTTPException, status
+from sqlalchemy import exists, func, literal, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import CursorResult, Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
 from sqlmodel import select
 
-from ata_api.helpers.functools import raise_exception
-from ata_api.monitoring.logging import logger
+from ata_api.monitoring.instrumentation import instrument
 from ata_api.monitoring.metrics import (
     CloudWatchMetric,
     CloudWatchMetricDimension,
-    log_cloudwatch_metric,
+    metric_aggregator,
+    metrics,
 )
 from ata_api.site import SiteName
+from ata_api.stats import AssignmentKey, assignment_counts
 
 
 def get_usergroup_site_name(usergroup: UserGroup) -> SiteName:
@@ -25,49 +34,178 @@ def get_usergroup_group(usergroup: UserGroup) -> Group:
     return usergroup.group
 
 
-@log_cloudwatch_metric(
+class PrescriptionResult(NamedTuple):
+    usergroup: UserGroup
+    # Whether the prescription was created (rather than read) by the call
+    created: bool
+
+
+def get_result_metric_name(result: PrescriptionResult) -> str:
+    return CloudWatchMetric.PRESCRIPTIONS_CREATED if result.created else CloudWatchMetric.PRESCRIPTIONS_READ
+
+
+def get_result_site_name(result: PrescriptionResult) -> SiteName:
+    return get_usergroup_site_name(result.usergroup)
+
+
+def get_result_group(result: PrescriptionResult) -> Group:
+    return get_usergroup_group(result.usergroup)
+
+
+USERGROUP_DIMENSIONS: dict[str, Union[str, Callable[[UserGroup], str]]] = {
+    CloudWatchMetricDimension.SITE_NAME: get_usergroup_site_name,
+    CloudWatchMetricDimension.GROUP: get_usergroup_group,
+}
+RESULT_DIMENSIONS: dict[str, Union[str, Callable[[PrescriptionResult], str]]] = {
+    CloudWatchMetricDimension.SITE_NAME: get_result_site_name,
+    CloudWatchMetricDimension.GROUP: get_result_group,
+}
+
+# Decorators shared by the sync and async versions of each CRUD function. Each logs a metric on success, and raises
+# an HTTP exception on failure.
+instrument_read_prescription = instrument(
     name=CloudWatchMetric.PRESCRIPTIONS_READ,
     value=1,
     unit=MetricUnit.Count,
-    dimensions={
-        CloudWatchMetricDimension.SITE_NAME: get_usergroup_site_name,
-        CloudWatchMetricDimension.GROUP: get_usergroup_group,
-    },
-)
-@raise_exception(
+    dimensions=USERGROUP_DIMENSIONS,
     exception=HTTPException(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         detail="An exception occurred while fetching the prescription.",
     ),
-    logger=logger,
 )
-def read_prescription(session: Session, site_name: SiteName, user_id: UUID) -> Optional[UserGroup]:
-    """
-    Returns the prescription for the given user_id and site_name, or None if it doesn't exist.
-    The read metric is logged only if the prescription exists.
-    """
-    result = session.execute(
-        select(UserGroup).where(UserGroup.user_id == user_id, UserGroup.site_name == site_name)
-    ).one_or_none()
-    return result[0] if result is not None else None
-
-
-@log_cloudwatch_metric(
-    name=CloudWatchMetric.PRESCRIPTIONS_CREATED,
+instrument_read_prescriptions = instrument(
+    name=CloudWatchMetric.PRESCRIPTIONS_READ,
     value=1,
     unit=MetricUnit.Count,
-    dimensions={
-        CloudWatchMetricDimension.SITE_NAME: get_usergroup_site_name,
-        CloudWatchMetricDimension.GROUP: get_usergroup_group,
-    },
+    dimensions=USERGROUP_DIMENSIONS,
+    exception=HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="An exception occurred while fetching the prescriptions.",
+    ),
+    per_item=True,
 )
-@raise_exception(
+instrument_create_prescription = instrument(
+    name=CloudWatchMetric.PRESCRIPTIONS_CREATED,
+    value=1,
+    unit=MetricUnit.Count,
+    dimensions=USERGROUP_DIMENSIONS,
     exception=HTTPException(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         detail="An exception occurred while creating the prescription.",
     ),
-    logger=logger,
 )
+instrument_get_or_create_prescription = instrument(
+    name=get_result_metric_name,
+    value=1,
+    unit=MetricUnit.Count,
+    dimensions=RESULT_DIMENSIONS,
+    exception=HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="An exception occurred while fetching or creating the prescription.",
+    ),
+)
+instrument_get_or_create_prescriptions = instrument(
+    name=get_result_metric_name,
+    value=1,
+    unit=MetricUnit.Count,
+    dimensions=RESULT_DIMENSIONS,
+    exception=HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="An exception occurred while fetching or creating the prescriptions.",
+    ),
+    per_item=True,
+)
+
+
+def add_read_metric(site_name: SiteName, group: Group) -> None:
+    """
+    Adds the same metric as instrument_read_prescription, for a prescription read from elsewhere (e.g., a cache).
+    """
+    metric_aggregator.add(
+        CloudWatchMetric.PRESCRIPTIONS_READ,
+        MetricUnit.Count,
+        1,
+        (
+            *metrics.default_dimensions.items(),
+            (CloudWatchMetricDimension.SITE_NAME, site_name),
+            (CloudWatchMetricDimension.GROUP, group),
+        ),
+    )
+
+
+PRESCRIPTION_COLUMNS = [UserGroup.user_id, UserGroup.site_name, UserGroup.group, UserGroup.last_updated]
+
+
+def select_prescription(site_name: SiteName, user_id: UUID) -> Select:
+    return select(UserGroup).where(UserGroup.user_id == user_id, UserGroup.site_name == site_name)
+
+
+def insert_or_select_prescription(site_name: SiteName, user_id: UUID, group: Group) -> Select:
+    """
+    Builds a single statement that inserts the prescription unless it already exists, and returns
+    either the inserted or the existing row, along with whether it was inserted.
+
+    The statement can return no row if a concurrent transaction inserts the prescription after this
+    statement's snapshot is taken: the insert then conflicts, but the select can't see the other
+    transaction's row yet. Callers must fall back to a plain read in that case.
+    """
+    inserted = (
+        insert(UserGroup)
+        .values(site_name=site_name, user_id=user_id, group=group)
+        .on_conflict_do_nothing(index_elements=[UserGroup.user_id, UserGroup.site_name])
+        .returning(*PRESCRIPTION_COLUMNS, literal(True).label("created"))
+        .cte("inserted")
+    )
+    existing = select(*PRESCRIPTION_COLUMNS, literal(False).label("created")).where(  # type: ignore
+        UserGroup.user_id == user_id,
+        UserGroup.site_name == site_name,
+        ~exists(select(inserted.c.user_id)),
+    )
+    return select(inserted).union_all(existing)  # type: ignore
+
+
+def select_prescriptions(keys: Sequence[tuple[SiteName, UUID]]) -> Select:
+    return select(UserGroup).where(
+        tuple_(UserGroup.user_id, UserGroup.site_name).in_([(user_id, site_name) for site_name, user_id in keys])
+    )
+
+
+def to_prescription_result(row: Optional[Row]) -> Optional[PrescriptionResult]:
+    if row is None:
+        return None
+
+    usergroup = UserGroup(user_id=row.user_id, site_name=row.site_name, group=row.group, last_updated=row.last_updated)
+    return PrescriptionResult(usergroup=usergroup, created=row.created)
+
+
+@instrument_read_prescription
+def read_prescription(session: Session, site_name: SiteName, user_id: UUID) -> Optional[UserGroup]:
+    """
+    Returns the prescription for the given user_id and site_name, or None if it doesn't exist.
+    The read metric is logged only if the prescription exists.
+    """
+    result = session.execute(select_prescription(site_name, user_id)).one_or_none()
+    return result[0] if result is not None else None
+
+
+@instrument_read_prescription
+async def read_prescription_async(session: AsyncSession, site_name: SiteName, user_id: UUID) -> Optional[UserGroup]:
+    """
+    Async version of read_prescription.
+    """
+    result = (await session.execute(select_prescription(site_name, user_id))).one_or_none()
+    return result[0] if result is not None else None
+
+
+@instrument_read_prescriptions
+async def read_prescriptions_async(session: AsyncSession, keys: Sequence[tuple[SiteName, UUID]]) -> Sequence[UserGroup]:
+    """
+    Batch version of read_prescription_async. Returns the prescriptions that exist, in no particular order.
+    """
+    return (await session.execute(select_prescriptions(keys))).scalars().all()
+
+
+@instrument_create_prescription
 def create_prescription(session: Session, site_name: SiteName, user_id: UUID, group: Group) -> UserGroup:
     """
     Creates a prescription for the given user_id and site_name.
@@ -79,4 +217,169 @@ def create_prescription(session: Session, site_name: SiteName, user_id: UUID, gr
     )
     session.add(usergroup)
     session.commit()
+    assignment_counts.add(site_name, group)
     return usergroup
+
+
+@instrument_get_or_create_prescription
+def get_or_create_prescription(
+    session: Session, site_name: SiteName, user_id: UUID, group: Group
+) -> PrescriptionResult:
+    """
+    Atomically returns the existing prescription for the given user_id and site_name, or creates it
+    with the given group. Costs a single statement, and a commit, unless a concurrent request created
+    the same prescription, and never fails because of one. Logs the created or read metric accordingly.
+
+    Commits the session's transaction, including anything the caller ran on it before (e.g., a read), so
+    that the prescription is persisted whether or not the session already had a connection.
+    """
+    result = to_prescription_result(
+        session.execute(insert_or_select_prescription(site_name, user_id, group)).one_or_none()
+    )
+    session.commit()
+
+    if result is None:
+        # Lost a race with a concurrent insert, which is visible by now
+        existing = session.execute(select_prescription(site_name, user_id)).one()
+        result = PrescriptionResult(usergroup=existing[0], created=False)
+    elif result.created:
+        assignment_counts.add(site_name, result.usergroup.group)
+
+    return result
+
+
+@instrument_get_or_create_prescription
+async def get_or_create_prescription_async(
+    session: AsyncSession, site_name: SiteName, user_id: UUID, group: Group
+) -> PrescriptionResult:
+    """
+    Async version of get_or_create_prescription.
+    """
+    result = to_prescription_result(
+        (await session.execute(insert_or_select_prescription(site_name, user_id, group))).one_or_none()
+    )
+    await session.commit()
+
+    if result is None:
+        existing = (await session.execute(select_prescription(site_name, user_id))).one()
+        result = PrescriptionResult(usergroup=existing[0], created=False)
+    elif result.created:
+        assignment_counts.add(site_name, result.usergroup.group)
+
+    return result
+
+
+@instrument_get_or_create_prescriptions
+async def get_or_create_prescriptions_async(
+    session: AsyncSession, prescriptions: Sequence[tuple[SiteName, UUID, Group]]
+) -> list[PrescriptionResult]:
+    """
+    Batch version of get_or_create_prescription_async. Returns a result for each (site_name, user_id, group)
+    given, in order. Costs one round trip to read existing prescriptions, then one to insert all missing ones.
+    If a (site_name, user_id) is given more than once, its first group is used and only its first result can
+    be marked as created. Commits the session's transaction, as get_or_create_prescription does.
+    """
+    # Iterate in reverse so that the first group given for a key wins
+    groups = {(site_name, user_id): group for site_name, user_id, group in reversed(prescriptions)}
+    results: dict[tuple[SiteName, UUID], PrescriptionResult] = {}
+
+    def add_results(usergroups: Sequence[UserGroup], created: bool) -> None:
+        for usergroup in usergroups:
+            site_name = SiteName.parse(usergroup.site_name)
+            results[(site_name, usergroup.user_id)] = PrescriptionResult(usergroup, created)
+            if created:
+                assignment_counts.add(site_name, usergroup.group)
+
+    add_results((await session.execute(select_prescriptions(list(groups)))).scalars().all(), created=False)
+
+    missing = [key for key in groups if key not in results]
+    if len(missing) > 0:
+        statement = (
+            insert(UserGroup)
+            .values([dict(site_name=key[0], user_id=key[1], group=groups[key]) for key in missing])
+            .on_conflict_do_nothing(index_elements=[UserGroup.user_id, UserGroup.site_name])
+            .returning(*PRESCRIPTION_COLUMNS)
+        )
+        rows = (await session.execute(statement)).all()
+        await session.commit()
+        add_results(
+            [
+                UserGroup(user_id=r.user_id, site_name=r.site_name, group=r.group, last_updated=r.last_updated)
+                for r in rows
+            ],
+            created=True,
+        )
+
+    # Prescriptions that concurrent requests inserted in the meantime
+    missing = [key for key in groups if key not in results]
+    if len(missing) > 0:
+        add_results((await session.execute(select_prescriptions(missing))).scalars().all(), created=False)
+
+    output = []
+    seen = set()
+    for site_name, user_id, _ in prescriptions:
+        key = (site_name, user_id)
+        result = results[key]
+        output.append(result if key not in seen else result._replace(created=False))
+        seen.add(key)
+
+    return output
+
+
+async def stream_prescriptions_async(
+    session: AsyncSession, site_name: SiteName, chunk_size: int = 10_000
+) -> AsyncIterator[Sequence[Row]]:
+    """
+    Yields all prescriptions of the site as rows of PRESCRIPTION_COLUMNS, chunk_size rows at a time. Rows are
+    fetched through a server-side cursor, so only one chunk is held in memory at a time.
+    """
+    statement = select(*PRESCRIPTION_COLUMNS).where(UserGroup.site_name == site_name)
+    result = await session.stream(statement.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions(chunk_size):  # type: ignore  # An async generator, not a coroutine
+        yield rows
+
+
+async def copy_prescriptions_async(
+    session: AsyncSession, site_name: SiteName, prescriptions: AsyncIterable[tuple[UUID, Group]]
+) -> int:
+    """
+    Bulk-loads prescriptions of the site, given as (user_id, group), and commits them. Returns the number of
+    prescriptions created; those that already exist are left as they are.
+
+    Prescriptions are streamed with COPY into a temporary table, which, unlike COPY into the table itself, allows
+    skipping existing prescriptions when inserting from it. Exceptions raised while iterating over prescriptions
+    roll the whole load back.
+    """
+    table = UserGroup.__tablename__
+    await session.execute(text(f"CREATE TEMPORARY TABLE {table}_import (LIKE {table}) ON COMMIT DROP"))
+
+    connection = await (await session.connection()).get_raw_connection()
+    last_updated = datetime.utcnow()
+
+    async def records() -> AsyncIterator[tuple[UUID, str, str, datetime]]:
+        async for user_id, group in prescriptions:
+            yield user_id, site_name.value, group.value, last_updated
+
+    await connection.driver_connection.copy_records_to_table(
+        f"{table}_import", records=records(), columns=["user_id", "site_name", "group", "last_updated"]
+    )
+    result = await session.execute(text(f"INSERT INTO {table} SELECT * FROM {table}_import ON CONFLICT DO NOTHING"))
+    await session.commit()
+
+    created: int = cast(CursorResult, result).rowcount
+    if created > 0:
+        # Imported prescriptions aren't counted one by one
+        assignment_counts.invalidate()
+    return created
+
+
+async def count_prescriptions_async(session: AsyncSession) -> Counter[AssignmentKey]:
+    """
+    Returns the number of prescriptions per site and group. Scans the whole table, so it's only meant to reconcile
+    assignment_counts now and then.
+    """
+    statement = select(UserGroup.site_name, UserGroup.group, func.count()).group_by(  # type: ignore
+        UserGroup.site_name, UserGroup.group
+    )
+    rows = (await session.execute(statement)).all()
+    return Counter({(site_name, group): count for site_name, group, count in rows})
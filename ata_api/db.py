@@ -1,11 +1,164 @@
-from typing import Generator
+import os
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import lru_cache
+from typing import Annotated, Any, Generator, Optional, Union
 
-from ata_db_models.helpers import get_conn_string
+from aws_lambda_powertools.metrics import MetricUnit
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlmodel import create_engine
 
-engine = create_engine(url=get_conn_string())
-session_factory = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+from ata_api.monitoring.metrics import CloudWatchMetric, metric_aggregator, metrics
+from ata_api.pool import (
+    DBPoolClass,
+    TimedNullPool,
+    TimedQueuePool,
+    pool_stats,
+    resolve_pool_class,
+)
+from ata_api.replicas import ReplicaSet
+from ata_api.settings import settings
+
+
+def get_conn_string(host: Optional[str] = None) -> str:
+    """
+    Reads the same environment variables as ata_db_models.helpers.get_conn_string, without importing that module,
+    which pulls in boto3 and adds about 100ms to cold starts. The host can be overridden, e.g., for a read replica.
+    """
+    host = host or os.getenv("HOST", "localhost")
+    port = os.getenv("PORT", "5432")
+    user = os.getenv("USERNAME", "postgres")
+    password = os.getenv("PASSWORD", "postgres")
+    db_name = os.getenv("DB_NAME", "postgres")
+
+    return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
+
+
+def get_async_conn_string(host: Optional[str] = None) -> str:
+    """
+    Same DB as get_conn_string, but through the asyncpg driver.
+    """
+    return get_conn_string(host).replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+# Engines and session factories are created on first use, rather than on import, to keep them off the cold start of
+# containers that don't need them. In particular, endpoints only use the async engine.
+
+
+@lru_cache
+def get_engine() -> Engine:
+    return create_engine(url=get_conn_string())
+
+
+@lru_cache
+def get_session_factory() -> "sessionmaker[Session]":
+    return sessionmaker(autoflush=False, autocommit=False, bind=get_engine())
+
+
+def get_pool_options() -> dict[str, Any]:
+    """
+    Options of the async engine's connection pool, from settings.
+    """
+    pool_class = resolve_pool_class(
+        settings.db_pool_class, settings.aws_lambda_function_name is not None, settings.db_rds_proxy
+    )
+    options: dict[str, Any] = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if settings.db_rds_proxy:
+        # Cached prepared statements pin the proxy's connections to this client
+        options["connect_args"] = {"prepared_statement_cache_size": 0}
+
+    if pool_class == DBPoolClass.NULL:
+        return {**options, "poolclass": TimedNullPool}
+    pool_size, max_overflow = (
+        (1, 0) if pool_class == DBPoolClass.SINGLE else (settings.db_pool_size, settings.db_max_overflow)
+    )
+    return {
+        **options,
+        "poolclass": TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+
+
+def create_instrumented_async_engine(host: Optional[str] = None) -> AsyncEngine:
+    engine = create_async_engine(url=get_async_conn_string(host), **get_pool_options())
+    event.listen(engine.sync_engine.pool, "checkout", pool_stats.on_checkout)
+    event.listen(engine.sync_engine.pool, "checkin", pool_stats.on_checkin)
+    return engine
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    return create_instrumented_async_engine()
+
+
+@lru_cache
+def get_replica_set() -> Optional[ReplicaSet]:
+    """
+    Engines of the read replicas, each with its own pool, or None if there are none.
+    """
+    if len(settings.db_replica_hosts) == 0:
+        return None
+    engines = [create_instrumented_async_engine(host) for host in settings.db_replica_hosts]
+    return ReplicaSet(engines, settings.db_replica_selection)
+
+
+def get_pool_status() -> dict[str, Union[int, float]]:
+    """
+    Statistics of the async engines' connection pools, as log keys. Empty if the engine wasn't created. The size and
+    overflow are the primary's.
+    """
+    if get_async_engine.cache_info().currsize == 0:
+        return {}
+
+    status = pool_stats.snapshot()
+    pool = get_async_engine().sync_engine.pool
+    if isinstance(pool, QueuePool):
+        status["size"] = pool.size()  # type: ignore
+        # Negative while fewer connections than the pool's size are open
+        status["overflow"] = max(pool.overflow(), 0)  # type: ignore
+    return status
+
+
+def add_pool_metrics() -> None:
+    """
+    Adds the async engines' pool statistics since the last call to metric_aggregator. Called on each flush, so that
+    point-in-time values (e.g., connections checked out) are added once per flush.
+    """
+    if get_async_engine.cache_info().currsize == 0:
+        return
+
+    status = get_pool_status()
+    stats = pool_stats.reset()
+    dimensions = tuple(metrics.default_dimensions.items())
+    for name, unit, value in (
+        (CloudWatchMetric.DB_POOL_CHECKED_OUT, MetricUnit.Count, status["checked_out"]),
+        (CloudWatchMetric.DB_POOL_OVERFLOW, MetricUnit.Count, status.get("overflow", 0)),
+        (CloudWatchMetric.DB_POOL_CHECKOUTS, MetricUnit.Count, stats["checkouts"]),
+        (CloudWatchMetric.DB_POOL_WAIT_DURATION, MetricUnit.Milliseconds, stats["wait_duration"]),
+        (CloudWatchMetric.DB_POOL_MAX_WAIT_DURATION, MetricUnit.Milliseconds, stats["max_wait_duration"]),
+        (CloudWatchMetric.DB_POOL_TIMEOUTS, MetricUnit.Count, stats["timeouts"]),
+    ):
+        metric_aggregator.add(name, unit, value, dimensions)
+
+
+metric_aggregator.add_flush_callback(add_pool_metrics)
+
+
+@lru_cache
+def get_async_session_factory() -> "sessionmaker[AsyncSession]":
+    # Don't expire objects on commit: with an async session, reading an expired attribute would need an implicit
+    # (and therefore disallowed) DB round trip.
+    return sessionmaker(
+        autoflush=False, autocommit=False, expire_on_commit=False, bind=get_async_engine(), class_=AsyncSession
+    )
 
 
 def create_db_session() -> Generator[Session, None, None]:
@@ -13,8 +166,101 @@ def create_db_session() -> Generator[Session, None, None]:
     FastAPI dependency that opens and closes a DB session.
     (See: https://fastapi.tiangolo.com/tutorial/dependencies/dependencies-with-yield/.)
     """
-    session = session_factory()
+    session = get_session_factory()()
     try:
         yield session
     finally:
         session.close()
+
+
+async def create_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    FastAPI dependency that opens and closes an async DB session, so that endpoints waiting on the DB don't hold on
+    to a threadpool slot.
+    """
+    session = get_async_session_factory()()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+def get_read_engine() -> Optional[AsyncEngine]:
+    """
+    FastAPI dependency that picks the engine of the read replica the request reads from, or None without replicas.
+    """
+    replica_set = get_replica_set()
+    return replica_set.pick() if replica_set is not None else None
+
+
+async def create_async_read_session(
+    session: Annotated[AsyncSession, Depends(create_async_db_session)],
+    read_engine: Annotated[Optional[AsyncEngine], Depends(get_read_engine)],
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    FastAPI dependency that opens and closes an async DB session on a read replica. Without replicas, it's the
+    same session as create_async_db_session's, so endpoints can tell whether reads are routed by comparing them.
+    """
+    if read_engine is None:
+        yield session
+        return
+
+    read_session = get_async_session_factory()(bind=read_engine)
+    try:
+        yield read_session
+    finally:
+        await read_session.close()
+
+
+@asynccontextmanager
+async def open_async_sessions(
+    read_engine: Optional[AsyncEngine],
+) -> AsyncIterator[tuple[AsyncSession, AsyncSession]]:
+    """
+    Opens and closes an async DB session on the primary and one on the read replica, if given its engine (otherwise
+    the same session), as create_async_db_session and create_async_read_session do, but outside of a request's
+    dependencies, e.g., for work shared by several requests.
+    """
+    session = get_async_session_factory()()
+    try:
+        if read_engine is None:
+            yield session, session
+            return
+
+        read_session = get_async_session_factory()(bind=read_engine)
+        try:
+            yield session, read_session
+        finally:
+            await read_session.close()
+    finally:
+        await session.close()
+
+
+async def warm_up_engine(fill_pool: bool = False) -> None:
+    """
+    Opens a first connection on each async engine and returns it to the pool, so that the first request doesn't
+    have to. If fill_pool, opens as many as the pool keeps instead, e.g., for long-lived workers that will need
+    them all under load.
+    """
+    replica_set = get_replica_set()
+    for engine in [get_async_engine(), *(replica_set.engines if replica_set is not None else [])]:
+        pool = engine.sync_engine.pool
+        connections = pool.size() if fill_pool and isinstance(pool, QueuePool) else 1  # type: ignore
+        # Hold them all at once, so that the pool doesn't hand the same one out again
+        async with AsyncExitStack() as stack:
+            for _ in range(connections):
+                await stack.enter_async_context(engine.connect())
+
+
+async def dispose_engine() -> None:
+    """
+    Closes all pooled DB connections, of the engines that were created.
+    """
+    if get_engine.cache_info().currsize > 0:
+        get_engine().dispose()
+    if get_async_engine.cache_info().currsize > 0:
+        await get_async_engine().dispose()
+    if get_replica_set.cache_info().currsize > 0:
+        replica_set = get_replica_set()
+        for engine in replica_set.engines if replica_set is not None else []:
+            await engine.dispose()
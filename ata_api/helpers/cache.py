@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Generic, Optional, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe, size-bounded cache that evicts the least recently used entry when full and, if given a TTL,
+    expires entries that many seconds after they were set. A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        if max_size < 0:
+            raise ValueError("max_size must be non-negative")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be positive")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        # Values are stored along with their expiry time
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.max_size == 0:
+            return
+
+        expires_at = self.clock() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def reset_stats(self) -> CacheStats:
+        """
+        Returns the statistics, and resets them.
+        """
+        with self._lock:
+            stats, self.stats = self.stats, CacheStats()
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,10 +1,41 @@
-from enum import Enum
-from typing import Any
+from collections.abc import Callable, Iterator
+from enum import Enum, EnumMeta
+from typing import Any, TypeVar, cast
 
-from caseconverter import kebabcase, pascalcase, snakecase
+from pydantic import errors
 
+E = TypeVar("E", bound="StrEnum")
 
-class StrEnum(str, Enum):
+
+# Enum values are generated from member names, which are UPPER_SNAKE_CASE, so they only need splitting on underscores.
+# This matches caseconverter for such names (see tests/test_enum.py), without importing it at runtime.
+def kebabcase(name: str) -> str:
+    return name.lower().replace("_", "-")
+
+
+def pascalcase(name: str) -> str:
+    return "".join(word.capitalize() for word in name.split("_"))
+
+
+def snakecase(name: str) -> str:
+    return name.lower()
+
+
+class StrEnumMeta(EnumMeta):
+    """
+    Enum metaclass that precomputes the value→member lookup table of each StrEnum, once members are created.
+    """
+
+    _members_by_value: dict[str, Any]
+
+    def __new__(metacls, cls, bases, classdict, **kwargs):  # type: ignore
+        enum_class = super().__new__(metacls, cls, bases, classdict, **kwargs)
+        # A copy of the table EnumMeta.__call__ looks values up in, but without the call overhead
+        enum_class._members_by_value = dict(enum_class._value2member_map_)
+        return enum_class
+
+
+class StrEnum(str, Enum, metaclass=StrEnumMeta):
     """
     StrEnum class. Replace with built-in version after upgrading to Python 3.10.
     """
@@ -12,8 +43,23 @@ class StrEnum(str, Enum):
     def __str__(self) -> str:
         return f"{self.value}"
 
+    @classmethod
+    def parse(cls: type[E], value: Any) -> E:
+        """
+        Returns the member with the value, with a single lookup, rather than going through EnumMeta.__call__. Raises
+        the same error pydantic does for an invalid enum value.
+        """
+        try:
+            return cast(E, cls._members_by_value[value])
+        except (KeyError, TypeError):
+            raise errors.EnumMemberError(enum_values=list(cls))
+
+    @classmethod
+    def __get_validators__(cls: type[E]) -> Iterator[Callable[[Any], E]]:
+        # Used by pydantic, and so FastAPI (e.g., for path parameters), instead of its generic enum validation
+        yield cls.parse
+
 
-# There's probably a metaclass way to make these cleaner
 class StrEnumKebab(StrEnum):
     """
     StrEnum class where the value is kebab-case.
@@ -21,7 +67,7 @@ class StrEnumKebab(StrEnum):
 
     @staticmethod
     def _generate_next_value_(name: str, *args: Any, **kwargs: Any) -> str:
-        return kebabcase(name)  # type: ignore
+        return kebabcase(name)
 
 
 class StrEnumPascal(StrEnum):
@@ -31,7 +77,7 @@ class StrEnumPascal(StrEnum):
 
     @staticmethod
     def _generate_next_value_(name: str, *args: Any, **kwargs: Any) -> str:
-        return pascalcase(name)  # type: ignore
+        return pascalcase(name)
 
 
 class StrEnumSnake(StrEnum):
@@ -41,4 +87,4 @@ class StrEnumSnake(StrEnum):
 
     @staticmethod
     def _generate_next_value_(name: str, *args: Any, **kwargs: Any) -> str:
-        return snakecase(name)  # type: ignore
+        return snakecase(name)
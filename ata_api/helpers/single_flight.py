@@ -0,0 +1,66 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Generic, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    # Calls that shared the result of one already in flight
+    coalesced: int = 0
+    # Calls that gave up waiting on the one in flight, and ran their own
+    timeouts: int = 0
+
+
+class SingleFlight(Generic[K, V]):
+    """
+    Coalesces concurrent calls with the same key: the first one runs, and the others, until it completes, wait for
+    its result (or exception) instead of running their own. Completed calls are forgotten, so a later call runs
+    again. Calls run in their own task, so that cancelling any one caller (e.g., on disconnect) doesn't cancel the
+    call for the others.
+
+    If given a timeout, callers that have waited that many seconds on a call in flight run their own instead.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        if timeout is not None and timeout <= 0:
+            raise ValueError("timeout must be positive")
+
+        self.timeout = timeout
+        self.stats = SingleFlightStats()
+        self._calls: dict[K, "asyncio.Task[V]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: K, call: Callable[[], Awaitable[V]]) -> V:
+        self.stats.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            return await asyncio.shield(self._start(key, call))
+
+        self.stats.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            return await call()
+
+    def _start(self, key: K, call: Callable[[], Awaitable[V]]) -> "asyncio.Task[V]":
+        async def run_call() -> V:
+            return await call()
+
+        task = asyncio.ensure_future(run_call())
+        self._calls[key] = task
+
+        def forget(_: "asyncio.Task[V]") -> None:
+            # Unless a call with the same key started since
+            if self._calls.get(key) is task:
+                del self._calls[key]
+
+        task.add_done_callback(forget)
+        return task
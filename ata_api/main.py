@@ -1,72 +1,487 @@
-import random
-from typing import Annotated, Any, Union
+import asyncio
+import atexit
+import functools
+import secrets
+from collections import Counter
+from collections.abc import AsyncIterator, Callable
+from dataclasses import dataclass
+from typing import Annotated, Any, Optional, cast
 from uuid import UUID
 
-import lambdawarmer
 from ata_db_models.models import Group
-from fastapi import Depends, Header, Path, Query, Response
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
 from mangum import Mangum
+from mangum.protocols import LifespanCycle
 from mangum.types import LambdaContext
-from pydantic import HttpUrl
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 from ata_api.app import app
-from ata_api.cors import evaluate_cors
-from ata_api.crud import create_prescription, read_prescription
-from ata_api.db import create_db_session
-from ata_api.models import PrescriptionResponse
-from ata_api.monitoring.logging import logger
-from ata_api.monitoring.metrics import metrics
+from ata_api.assignment import CompiledAssignment, PersistenceMode
+from ata_api.bulk import (
+    MEDIA_TYPES,
+    BulkFormat,
+    InvalidRowError,
+    format_header,
+    format_prescriptions,
+    parse_prescriptions,
+)
+from ata_api.cache import PrescriptionKey, prescription_cache
+from ata_api.crud import (
+    add_read_metric,
+    copy_prescriptions_async,
+    count_prescriptions_async,
+    get_or_create_prescription_async,
+    get_or_create_prescriptions_async,
+    read_prescription_async,
+    read_prescriptions_async,
+    stream_prescriptions_async,
+)
+from ata_api.db import (
+    create_async_db_session,
+    create_async_read_session,
+    get_async_session_factory,
+    get_read_engine,
+    open_async_sessions,
+)
+from ata_api.helpers.single_flight import SingleFlight
+from ata_api.models import (
+    BatchPrescriptionRequest,
+    BatchPrescriptionResponse,
+    ImportPrescriptionsResponse,
+    PrescriptionResponse,
+    StatsResponse,
+)
+from ata_api.monitoring.logging import log_debug, logger
+from ata_api.monitoring.metrics import metric_aggregator, metrics
+from ata_api.monitoring.timing import timed_stage
+from ata_api.responses import (
+    PRESCRIPTION_ETAGS,
+    ROOT_BODY,
+    PrecomputedJSONResponse,
+    etag_matches,
+    render_prescription,
+    render_prescriptions,
+)
 from ata_api.settings import Settings, get_settings
 from ata_api.site import SiteName
+from ata_api.stats import AssignmentKey, assignment_counts, get_stats
+from ata_api.write_behind import write_behind_queue
 
-AnnotatedOrigin = Annotated[Union[HttpUrl, None], Header(title="Origin of request")]
 AnnotatedSettings = Annotated[Settings, Depends(get_settings)]
 
 
+async def persist_prescription(site_name: SiteName, user_id: UUID, group: Group) -> None:
+    """
+    Persists a prescription in a session of its own, e.g., after the response was sent.
+    """
+    session = get_async_session_factory()()
+    try:
+        await get_or_create_prescription_async(session, site_name, user_id, group)
+    except HTTPException:
+        # Already logged, and there's no response left to fail
+        pass
+    finally:
+        await session.close()
+
+
+async def read_group(
+    session: AsyncSession, read_session: AsyncSession, site_name: SiteName, user_id: UUID
+) -> Optional[Group]:
+    """
+    Reads the group the user is assigned to at the site, from a replica if there are any, falling back to the
+    primary if the replica fails.
+    """
+    try:
+        usergroup = await read_prescription_async(read_session, site_name, user_id)
+    except HTTPException:
+        if read_session is session:
+            raise
+        logger.warning("Failed to read prescription from replica, reading it from primary")
+        usergroup = await read_prescription_async(session, site_name, user_id)
+    return usergroup.group if usergroup is not None else None
+
+
+async def read_groups(
+    session: AsyncSession, read_session: AsyncSession, keys: list[PrescriptionKey]
+) -> dict[PrescriptionKey, Group]:
+    """
+    Batch version of read_group. Returns the groups of the prescriptions that exist.
+    """
+    try:
+        usergroups = await read_prescriptions_async(read_session, keys)
+    except HTTPException:
+        if read_session is session:
+            raise
+        logger.warning("Failed to read prescriptions from replica, reading them from primary")
+        usergroups = await read_prescriptions_async(session, keys)
+    return {(SiteName.parse(usergroup.site_name), usergroup.user_id): usergroup.group for usergroup in usergroups}
+
+
+@dataclass
+class GroupLookup:
+    group: Group
+    # Whether the group was just assigned, and is to be persisted after responding (with background persistence)
+    unpersisted: bool = False
+
+    def claim_persistence(self) -> bool:
+        """
+        Returns whether the group is to be persisted, only to the first of the requests that share the lookup, so
+        that it's persisted once.
+        """
+        unpersisted, self.unpersisted = self.unpersisted, False
+        return unpersisted
+
+
+# Prescriptions being looked up in the DB. When the same user loads several widgets at once, their requests share
+# a single lookup, rather than each reading and racing to create the prescription.
+prescription_lookups: SingleFlight[PrescriptionKey, GroupLookup] = SingleFlight(
+    timeout=get_settings().prescription_lookup_timeout
+)
+
+
+async def get_or_assign_group(
+    session: AsyncSession,
+    read_session: AsyncSession,
+    assignment: CompiledAssignment,
+    site_name: SiteName,
+    user_id: UUID,
+    weights: tuple[int, int, int],
+) -> GroupLookup:
+    """
+    Returns the group the user is assigned to at the site, assigning them to one if they aren't yet.
+    """
+    config = assignment.config
+    group = assignment.assign(site_name, user_id, weights)
+
+    if config.persistence == PersistenceMode.WRITE_BEHIND:
+        queued_group = write_behind_queue.get((site_name, user_id))
+        if queued_group is not None:
+            return GroupLookup(queued_group)
+
+    if config.persistence != PersistenceMode.SYNC:
+        # Hash-based assignments stick without being persisted, but assignments persisted before the site switched
+        # strategy still win, so read them. So do random assignments persisted before switching to write-behind.
+        existing_group = await read_group(session, read_session, site_name, user_id)
+        if existing_group is not None:
+            return GroupLookup(existing_group)
+
+        if config.persistence == PersistenceMode.BACKGROUND:
+            return GroupLookup(group, unpersisted=True)
+        if config.persistence == PersistenceMode.NONE:
+            assignment_counts.add_unpersisted(site_name, group, user_id)
+            return GroupLookup(group)
+        # A full queue flushes on a connection of its own: release this one first, or with a small pool (e.g., a single
+        # connection in Lambda), the flush waits for it until the pool times out
+        await session.close()
+        if await write_behind_queue.put((site_name, user_id), group):
+            return GroupLookup(group)
+        logger.warning("Write-behind queue is full, persisting prescription synchronously")
+    elif read_session is not session:
+        # Most users were assigned on an earlier visit, so read from a replica first to spare the primary. A miss may
+        # only mean that the replica lags behind: the insert on the primary then conflicts and returns the existing
+        # prescription, so that users always read their own writes.
+        existing_group = await read_group(session, read_session, site_name, user_id)
+        if existing_group is not None:
+            return GroupLookup(existing_group)
+
+    usergroup, created = await get_or_create_prescription_async(session, site_name, user_id, group)
+    if created:
+        logger.info("Prescription not found. Created prescription for user %s at site %s", user_id, site_name)
+    return GroupLookup(usergroup.group)
+
+
+async def look_up_group(
+    read_engine: Optional[AsyncEngine],
+    assignment: CompiledAssignment,
+    site_name: SiteName,
+    user_id: UUID,
+    weights: tuple[int, int, int],
+) -> GroupLookup:
+    """
+    get_or_assign_group, in DB sessions of its own rather than a request's: the lookup is shared by concurrent
+    requests (see prescription_lookups), and outlives any of them that's cancelled.
+    """
+    async with open_async_sessions(read_engine) as (session, read_session):
+        return await get_or_assign_group(session, read_session, assignment, site_name, user_id, weights)
+
+
 @app.get("/")
-def get_root(
-    response: Response,
-    settings: AnnotatedSettings,
-    origin: AnnotatedOrigin = None,
-) -> dict[str, str]:
-    # Evaluate CORS
-    evaluate_cors(response, origin, settings.cors_allowed_origins)
+def get_root() -> Response:
+    return PrecomputedJSONResponse(ROOT_BODY)
 
-    return {"message": "This is the root endpoint for the AtA API."}
+
+@app.get("/health/live")
+async def get_liveness() -> JSONResponse:
+    """
+    Liveness check for long-lived workers (see ata_api.server). Workers only accept requests once warmed up, and
+    keep responding while they drain.
+    """
+    return JSONResponse({"status": "live"})
+
+
+@app.get("/health/ready")
+async def get_readiness(request: Request) -> JSONResponse:
+    """
+    Readiness check for long-lived workers: fails until the worker is warmed up, and again once it starts draining
+    or shutting down, so that load balancers only route requests to it in between.
+    """
+    if not request.app.state.ready:
+        return JSONResponse({"status": "not ready"}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return JSONResponse({"status": "ready"})
 
 
 @app.get("/prescription/{site_name}/{user_id}", response_model=PrescriptionResponse)
-def get_prescription(
-    response: Response,
+async def get_prescription(
+    background_tasks: BackgroundTasks,
     settings: AnnotatedSettings,
-    session: Annotated[Session, Depends(create_db_session)],
+    read_engine: Annotated[Optional[AsyncEngine], Depends(get_read_engine)],
     site_name: Annotated[SiteName, Path(title="Site name")],
     user_id: Annotated[UUID, Path(title="Snowplow user ID")],
     wa: Annotated[int, Query(title="Weight of assignment to A", ge=0)] = 1,
     wb: Annotated[int, Query(title="Weight of assignment to B", ge=0)] = 1,
     wc: Annotated[int, Query(title="Weight of assignment to C", ge=0)] = 1,
-    origin: AnnotatedOrigin = None,
-) -> PrescriptionResponse:
-    # Get group assignment. If it doesn't exist, create it.
-    logger.info(f"Reading prescription for user {user_id} at site {site_name}")
-    usergroup = read_prescription(session, site_name, user_id)
-
-    if usergroup is None:
-        logger.info(f"Prescription not found. Creating prescription for user {user_id} at site {site_name}")
-        usergroup = create_prescription(
-            session, site_name, user_id, group=random.choices([Group.A, Group.B, Group.C], weights=[wa, wb, wc], k=1)[0]
+    if_none_match: Annotated[Optional[str], Header(title="ETags of cached prescriptions")] = None,
+) -> Response:
+    # Get group assignment, from the cache if possible. If it doesn't exist, create it.
+    with timed_stage("cache"):
+        group = await prescription_cache.get((site_name, user_id))
+
+    if group is None:
+        log_debug("Getting prescription for user %s at site %s", user_id, site_name)
+        with timed_stage("db"):
+            lookup = await prescription_lookups.run(
+                (site_name, user_id),
+                lambda: look_up_group(
+                    read_engine, settings.assignments.get(site_name), site_name, user_id, (wa, wb, wc)
+                ),
+            )
+        group = lookup.group
+        if lookup.claim_persistence():
+            background_tasks.add_task(persist_prescription, site_name, user_id, group)
+        with timed_stage("cache"):
+            await prescription_cache.set((site_name, user_id), group)
+    else:
+        add_read_metric(site_name, group)
+
+    headers = {"ETag": PRESCRIPTION_ETAGS[group]}
+    cache_control = settings.get_cache_control(site_name)
+    if cache_control is not None:
+        headers["Cache-Control"] = cache_control
+        # Whether CORS headers are sent depends on the Origin, so shared caches mustn't serve a response cached for
+        # one origin (or none) to another
+        headers["Vary"] = "Origin"
+
+    if if_none_match is not None and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    # Returning a response skips FastAPI's validation and serialization of the response model
+    return PrecomputedJSONResponse(render_prescription(site_name, user_id, group), headers=headers)
+
+
+@app.post("/prescriptions:batch", response_model=BatchPrescriptionResponse)
+async def get_prescriptions_batch(
+    settings: AnnotatedSettings,
+    session: Annotated[AsyncSession, Depends(create_async_db_session)],
+    read_session: Annotated[AsyncSession, Depends(create_async_read_session)],
+    request: BatchPrescriptionRequest,
+) -> Response:
+    """
+    Batch version of get_prescription, for server-side callers (e.g., edge workers and backfill jobs).
+    """
+    keys = [(prescription.site_name, prescription.user_id) for prescription in request.prescriptions]
+    with timed_stage("cache"):
+        groups = await prescription_cache.get_many(keys)
+    for (site_name, _), group in zip(keys, groups):
+        if group is not None:
+            add_read_metric(site_name, group)
+
+    missing = [i for i, group in enumerate(groups) if group is None]
+    if len(missing) > 0 and read_session is not session:
+        # As in get_or_assign_group, read from a replica first, and only get or create the rest on the primary
+        with timed_stage("db"):
+            existing_groups = await read_groups(session, read_session, [keys[i] for i in missing])
+        for i in missing:
+            groups[i] = existing_groups.get(keys[i])
+        with timed_stage("cache"):
+            await prescription_cache.set_many(list(existing_groups.items()))
+        missing = [i for i, group in enumerate(groups) if group is None]
+
+    if len(missing) > 0:
+        log_debug("Getting %d of %d prescriptions", len(missing), len(keys))
+        requested = [request.prescriptions[i] for i in missing]
+        with timed_stage("db"):
+            results = await get_or_create_prescriptions_async(
+                session,
+                [
+                    (
+                        p.site_name,
+                        p.user_id,
+                        settings.assignments.get(p.site_name).assign(p.site_name, p.user_id, (p.wa, p.wb, p.wc)),
+                    )
+                    for p in requested
+                ],
+            )
+        for i, result in zip(missing, results):
+            groups[i] = result.usergroup.group
+        with timed_stage("cache"):
+            await prescription_cache.set_many(
+                [(keys[i], result.usergroup.group) for i, result in zip(missing, results)]
+            )
+
+    # Every group is known by now
+    prescriptions = [
+        (site_name, user_id, group) for (site_name, user_id), group in zip(keys, cast(list[Group], groups))
+    ]
+    return PrecomputedJSONResponse(render_prescriptions(prescriptions))
+
+
+def verify_bulk_api_key(
+    settings: AnnotatedSettings,
+    x_api_key: Annotated[Optional[str], Header(title="Key of the bulk endpoints")] = None,
+) -> None:
+    """
+    FastAPI dependency that only lets requests with the bulk API key through.
+    """
+    if settings.bulk_api_key is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_api_key is None or not secrets.compare_digest(x_api_key, settings.bulk_api_key):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+
+
+AnnotatedBulkFormat = Annotated[BulkFormat, Query(title="Format of the prescriptions")]
+
+
+@app.get("/prescriptions/{site_name}/export", dependencies=[Depends(verify_bulk_api_key)])
+async def export_prescriptions(
+    # Exports don't need to include prescriptions created in the last moments, so spare the primary
+    session: Annotated[AsyncSession, Depends(create_async_read_session)],
+    site_name: Annotated[SiteName, Path(title="Site name")],
+    format: AnnotatedBulkFormat = BulkFormat.NDJSON,
+) -> StreamingResponse:
+    """
+    Streams all prescriptions of the site, e.g., to join them against Snowplow events.
+    """
+
+    async def content() -> AsyncIterator[bytes]:
+        yield format_header(format)
+        async for rows in stream_prescriptions_async(session, site_name):
+            yield format_prescriptions(rows, format)
+
+    return StreamingResponse(content(), media_type=MEDIA_TYPES[format])
+
+
+@app.post(
+    "/prescriptions/{site_name}/import",
+    response_model=ImportPrescriptionsResponse,
+    dependencies=[Depends(verify_bulk_api_key)],
+)
+async def import_prescriptions(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(create_async_db_session)],
+    site_name: Annotated[SiteName, Path(title="Site name")],
+    format: AnnotatedBulkFormat = BulkFormat.NDJSON,
+) -> ImportPrescriptionsResponse:
+    """
+    Loads prescriptions of the site, streamed in the same format as exports, all or nothing.
+    """
+    try:
+        created = await copy_prescriptions_async(
+            session, site_name, parse_prescriptions(request.stream(), format, site_name)
         )
+    except InvalidRowError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+
+    logger.info("Imported %d prescriptions at site %s", created, site_name)
+    return ImportPrescriptionsResponse(created=created)
+
+
+@app.get("/stats", response_model=StatsResponse, dependencies=[Depends(verify_bulk_api_key)])
+async def get_assignment_stats(
+    settings: AnnotatedSettings,
+    read_engine: Annotated[Optional[AsyncEngine], Depends(get_read_engine)],
+) -> StatsResponse:
+    """
+    Assignments per site and group, and their ratios against the site's weights, e.g., to monitor the balance of
+    experiments. Served from counts maintained as users are assigned, rather than by scanning prescriptions.
+    """
+    await assignment_counts.refresh(lambda: count_prescriptions(read_engine))
+    return get_stats(assignment_counts, settings.assignments)
+
+
+async def count_prescriptions(read_engine: Optional[AsyncEngine]) -> Counter[AssignmentKey]:
+    """
+    count_prescriptions_async, in a DB session of its own, since it outlives the request that started it.
+    Reconciliations don't need to count prescriptions created in the last moments, so spare the primary.
+    """
+    async with open_async_sessions(read_engine) as (_, read_session):
+        return await count_prescriptions_async(read_session)
+
+
+# Created once per Lambda container and reused across invocations. Lifespan is turned off here because Mangum would
+# otherwise run the app's startup and shutdown around every single invocation; see start_lifespan instead.
+asgi_handler = Mangum(app, lifespan="off")
+lifespan_cycle: Optional[LifespanCycle] = None
+
+
+def start_lifespan() -> None:
+    """
+    Runs the app's lifespan startup once per Lambda container, on its first invocation. Shutdown runs when the
+    container's Python process exits.
+    """
+    global lifespan_cycle
+
+    if lifespan_cycle is None:
+        lifespan_cycle = LifespanCycle(app, "auto")
+        lifespan_cycle.__enter__()
+        atexit.register(lifespan_cycle.__exit__, None, None, None)
+
+
+LambdaHandler = Callable[[dict[str, Any], LambdaContext], Optional[dict[str, Any]]]
+
+
+def warmer(func: LambdaHandler) -> LambdaHandler:
+    """
+    Same as lambdawarmer.warmer, except that lambdawarmer, and boto3 with it, is only imported on warmer pings
+    rather than on every cold start.
+    """
+
+    @functools.wraps(func)
+    def wrapper(event: dict[str, Any], context: LambdaContext) -> Optional[dict[str, Any]]:
+        if event.get("warmer"):
+            import lambdawarmer
 
-    # Evaluate CORS
-    evaluate_cors(response, origin, settings.cors_allowed_origins)
+            response: Optional[dict[str, Any]] = lambdawarmer.warmer(func)(event, context)
+            return response
+        return func(event, context)
 
-    return PrescriptionResponse(site_name=usergroup.site_name, user_id=usergroup.user_id, group=usergroup.group)
+    return wrapper
 
 
 @metrics.log_metrics(capture_cold_start_metric=True)  # type: ignore  # Add metrics last to properly flush metrics
 @logger.inject_lambda_context(clear_state=True)  # Add logging
-@lambdawarmer.warmer  # type: ignore  # Keep the lambda warm (in addition, need to set up CloudWatch event to ping every 5 minutes)
+# Keep the lambda warm (in addition, need to set up CloudWatch event to ping every 5 minutes). Pings return before the
+# app's lifespan is started, i.e., before any ASGI or DB setup.
+@warmer
 def handler(event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
-    asgi_handler = Mangum(app)
-    return asgi_handler(event, context)
+    start_lifespan()
+    try:
+        return asgi_handler(event, context)
+    finally:
+        # The container may be frozen, or never thawed, once the invocation returns. Run on the loop Mangum uses,
+        # which DB connections are attached to.
+        if len(write_behind_queue) > 0:
+            asyncio.get_event_loop().run_until_complete(write_behind_queue.flush())
+        if assignment_counts.needs_flush:
+            asyncio.get_event_loop().run_until_complete(assignment_counts.flush())
+        metric_aggregator.flush()
@@ -1,7 +1,9 @@
+from datetime import datetime
+from typing import Optional
 from uuid import UUID
 
 from ata_db_models.models import Group
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from ata_api.site import SiteName
 
@@ -10,3 +12,47 @@ class PrescriptionResponse(BaseModel):
     site_name: SiteName
     user_id: UUID
     group: Group
+
+
+class PrescriptionRequest(BaseModel):
+    site_name: SiteName
+    user_id: UUID
+    wa: int = Field(default=1, title="Weight of assignment to A", ge=0)
+    wb: int = Field(default=1, title="Weight of assignment to B", ge=0)
+    wc: int = Field(default=1, title="Weight of assignment to C", ge=0)
+
+
+class BatchPrescriptionRequest(BaseModel):
+    prescriptions: list[PrescriptionRequest] = Field(min_items=1, max_items=1000)
+
+
+class BatchPrescriptionResponse(BaseModel):
+    # In the same order as the request's prescriptions
+    prescriptions: list[PrescriptionResponse]
+
+
+class ImportPrescriptionsResponse(BaseModel):
+    # Prescriptions that already existed are left as they are, and not counted
+    created: int
+
+
+class GroupStats(BaseModel):
+    group: Group
+    count: int
+    # Share of the site's prescriptions in the group
+    ratio: float
+    # Share of new users the site's assignment config assigns to the group; None if it uses each request's weights
+    expected_ratio: Optional[float]
+
+
+class SiteStats(BaseModel):
+    site_name: SiteName
+    total: int
+    groups: list[GroupStats]
+
+
+class StatsResponse(BaseModel):
+    # When counts were last reconciled with the DB, or None if they haven't been yet. Without a shared cache,
+    # prescriptions created since by other containers or workers aren't counted yet.
+    reconciled_at: Optional[datetime]
+    sites: list[SiteStats]
@@ -1,3 +1,36 @@
+import logging
+import sys
+from contextvars import ContextVar
+
 from aws_lambda_powertools import Logger
 
 logger = Logger()
+# The standard library logger behind logger, whose handlers and formatter are powertools'
+_std_logger = logging.getLogger(logger.name)
+
+# Whether the request being handled was sampled to emit debug logs, whatever the log level
+debug_sampled: ContextVar[bool] = ContextVar("debug_sampled", default=False)
+
+
+def log_debug(msg: str, *args: object) -> None:
+    """
+    Logs a debug message, %-formatted with args only if it's emitted: when the log level is DEBUG, or the request
+    was sampled (see LoggerRouteHandler). Otherwise, it only costs a level check and a context variable lookup,
+    without formatting the message or building a record, which is what makes it fit for the hot path.
+    """
+    if _std_logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args, stacklevel=3)
+    elif debug_sampled.get():
+        # The logger's level would drop a debug record, so hand it to the handlers directly
+        caller = sys._getframe(1)
+        record = _std_logger.makeRecord(
+            _std_logger.name,
+            logging.DEBUG,
+            caller.f_code.co_filename,
+            caller.f_lineno,
+            msg,
+            args,
+            None,
+            caller.f_code.co_name,
+        )
+        _std_logger.handle(record)
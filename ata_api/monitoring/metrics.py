@@ -1,27 +1,41 @@
-import functools
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
 from collections.abc import Callable
 from enum import auto
-from typing import TypeVar, Union
+from typing import Any, Optional
 
-from aws_lambda_powertools import Metrics, single_metric
+from aws_lambda_powertools import Metrics
 from aws_lambda_powertools.metrics import MetricUnit
-from typing_extensions import ParamSpec
 
 from ata_api.helpers.enum import StrEnumPascal, StrEnumSnake
 from ata_api.monitoring.logging import logger
 from ata_api.settings import settings
 
-P = ParamSpec("P")
-R = TypeVar("R")
-
 
 class CloudWatchMetric(StrEnumPascal):
+    DB_POOL_CHECKED_OUT = auto()
+    DB_POOL_CHECKOUTS = auto()
+    DB_POOL_MAX_WAIT_DURATION = auto()
+    DB_POOL_OVERFLOW = auto()
+    DB_POOL_TIMEOUTS = auto()
+    DB_POOL_WAIT_DURATION = auto()
+    PRESCRIPTION_CACHE_EVICTIONS = auto()
+    PRESCRIPTION_CACHE_EXPIRATIONS = auto()
+    PRESCRIPTION_CACHE_HITS = auto()
+    PRESCRIPTION_CACHE_MISSES = auto()
     PRESCRIPTIONS_CREATED = auto()
     PRESCRIPTIONS_READ = auto()
+    REQUEST_STAGE_COUNT = auto()
+    REQUEST_STAGE_DURATION = auto()
 
 
 class CloudWatchMetricDimension(StrEnumSnake):
     GROUP = auto()
+    REQUEST_STAGE = auto()
+    ROUTE = auto()
     SITE_NAME = auto()
     STAGE = auto()
 
@@ -32,45 +46,87 @@ metrics = Metrics()
 if settings.stage is not None:
     metrics.set_default_dimensions(**{CloudWatchMetricDimension.STAGE: settings.stage})  # type: ignore
 
+# Dimensions as (name, value) pairs, in the order they were added
+Dimensions = tuple[tuple[str, str], ...]
 
-def log_cloudwatch_metric(
-    name: str,
-    value: float,
-    unit: MetricUnit,
-    dimensions: dict[str, Union[str, Callable[[R], str]]],
-    log_if_output_is_none: bool = False,
-    default_dimensions: dict[str, str] = metrics.default_dimensions,
-) -> Callable[[Callable[P, R]], Callable[P, R]]:
-    """
-    Wraps a function to log a CloudWatch metric.
-    """
 
-    def decorator(func: Callable[P, R]) -> Callable[P, R]:
-        @functools.wraps(func)
-        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-            # First, call the function
-            output = func(*args, **kwargs)
+class MetricAggregator:
+    """
+    Buffers metrics in memory, summing the values of metrics with the same name, unit and dimensions, and
+    logs them on flush in Embedded Metric Format (EMF), as one document per set of dimensions. Compared to
+    logging a document per metric with single_metric, this cuts both CPU time and log volume.
+    (See: https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html.)
 
-            # If func returns None and we don't want to log any metric in this case,
-            # we're good to go
-            if output is None and not log_if_output_is_none:
-                return output
+    In Lambda, flush at the end of each invocation. In a long-running server, flush periodically.
+    """
 
-            # Log the metric
+    def __init__(self, namespace: Optional[str], service: Optional[str] = None) -> None:
+        self.namespace = namespace
+        # Like powertools, add the service as a dimension
+        self.service = service
+        self._totals: dict[Dimensions, dict[tuple[str, str], float]] = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self._flush_callbacks: list[Callable[[], None]] = []
+
+    def add_flush_callback(self, callback: Callable[[], None]) -> None:
+        """
+        Registers a function to call at the start of each flush, e.g., to add point-in-time values once per flush.
+        """
+        self._flush_callbacks.append(callback)
+
+    def add(self, name: str, unit: MetricUnit, value: float, dimensions: Dimensions = ()) -> None:
+        with self._lock:
+            self._totals[dimensions][(name, unit.value)] += value
+
+    def flush(self) -> None:
+        for callback in self._flush_callbacks:
             try:
-                with single_metric(name=name, unit=unit, value=value, default_dimensions=default_dimensions) as metric:
-                    for dimension_name, dimension_value in dimensions.items():
-                        # If the dimension value is a constant, use it as-is
-                        if isinstance(dimension_value, str):
-                            metric.add_dimension(name=dimension_name, value=dimension_value)
-                        # If the dimension value is a function, it needs to be called with the output of the func.
-                        else:
-                            metric.add_dimension(name=dimension_name, value=dimension_value(output))
+                callback()
             except Exception:
-                logger.exception("Failed to log metric")
-            finally:
-                return output
-
-        return wrapper
-
-    return decorator
+                logger.exception("Failed to run metric flush callback")
+
+        with self._lock:
+            totals, self._totals = self._totals, defaultdict(lambda: defaultdict(float))
+
+        if len(totals) == 0:
+            return
+
+        if self.namespace is None:
+            logger.warning(f"Metric namespace not set, dropping {len(totals)} metric sets")
+            return
+
+        timestamp = int(time.time() * 1000)
+        for dimensions, values in totals.items():
+            print(json.dumps(self.serialize(dimensions, values, timestamp), separators=(",", ":")))
+
+    def serialize(self, dimensions: Dimensions, values: dict[tuple[str, str], float], timestamp: int) -> dict[str, Any]:
+        all_dimensions = dict(dimensions)
+        if self.service and "service" not in all_dimensions:
+            all_dimensions["service"] = self.service
+
+        return {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(all_dimensions.keys())],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, unit in values],
+                    }
+                ],
+            },
+            **all_dimensions,
+            **{name: value for (name, _), value in values.items()},
+        }
+
+    async def flush_periodically(self, interval: float) -> None:
+        """
+        Flushes every interval seconds, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+
+# Namespace and service are shared with powertools' metrics
+metric_aggregator = MetricAggregator(namespace=metrics.namespace, service=metrics.service)
@@ -0,0 +1,76 @@
+import time
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+from aws_lambda_powertools.metrics import MetricUnit
+
+from ata_api.monitoring.metrics import (
+    CloudWatchMetric,
+    CloudWatchMetricDimension,
+    metric_aggregator,
+    metrics,
+)
+
+
+class RequestTimer:
+    """
+    Durations, in milliseconds, of the stages of a request. A stage entered more than once adds up.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.durations: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def finish(self) -> None:
+        """
+        Records the time since the timer started as the "total" stage.
+        """
+        self.durations["total"] = (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self) -> str:
+        """
+        Formats the durations as a Server-Timing header value.
+        (See: https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing.)
+        """
+        return ", ".join(f"{name};dur={duration:.2f}" for name, duration in self.durations.items())
+
+    def add_metrics(self, route: str) -> None:
+        """
+        Adds each stage's duration, and a count to average it by, to metric_aggregator.
+        """
+        for name, duration in self.durations.items():
+            dimensions = (
+                *metrics.default_dimensions.items(),
+                (CloudWatchMetricDimension.ROUTE.value, route),
+                (CloudWatchMetricDimension.REQUEST_STAGE.value, name),
+            )
+            metric_aggregator.add(
+                CloudWatchMetric.REQUEST_STAGE_DURATION, MetricUnit.Milliseconds, duration, dimensions
+            )
+            metric_aggregator.add(CloudWatchMetric.REQUEST_STAGE_COUNT, MetricUnit.Count, 1, dimensions)
+
+
+# Timer of the request being handled, if it was sampled for timing
+request_timer: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+_untimed = nullcontext()
+
+
+def timed_stage(name: str) -> AbstractContextManager[None]:
+    """
+    Times the enclosed block as a stage of the current request. Does nothing if the request isn't being timed.
+    """
+    timer = request_timer.get()
+    if timer is None:
+        return _untimed
+    return timer.stage(name)
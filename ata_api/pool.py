@@ -0,0 +1,107 @@
+import threading
+import time
+from enum import auto
+from typing import Any, Union
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, Pool
+
+from ata_api.helpers.enum import StrEnumKebab
+
+
+class DBPoolClass(StrEnumKebab):
+    # QUEUE in a long-running server. In Lambda, SINGLE, or NULL if connecting through RDS Proxy.
+    AUTO = auto()
+    # Keep up to db_pool_size connections open, and open up to db_max_overflow more under load
+    QUEUE = auto()
+    # Keep a single connection open. Lambda containers only handle one request at a time, so each only needs one.
+    SINGLE = auto()
+    # Open a connection per checkout and close it on checkin, leaving pooling to a proxy (e.g., RDS Proxy)
+    NULL = auto()
+
+
+def resolve_pool_class(pool_class: DBPoolClass, in_lambda: bool, rds_proxy: bool) -> DBPoolClass:
+    if pool_class != DBPoolClass.AUTO:
+        return pool_class
+    if not in_lambda:
+        return DBPoolClass.QUEUE
+    return DBPoolClass.NULL if rds_proxy else DBPoolClass.SINGLE
+
+
+class PoolStats:
+    """
+    Statistics of a connection pool, to size it from: connections checked out, and checkouts and the time they
+    waited for a connection (including to open one, or to ping it with pre-ping) since the last reset.
+    """
+
+    def __init__(self) -> None:
+        self.checked_out = 0
+        self.checkouts = 0
+        # In milliseconds
+        self.wait_duration = 0.0
+        self.max_wait_duration = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_duration: float, timed_out: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_duration += wait_duration
+            self.max_wait_duration = max(self.max_wait_duration, wait_duration)
+            self.timeouts += timed_out
+
+    def reset(self) -> dict[str, Union[int, float]]:
+        """
+        Returns the statistics, and resets those since the last reset.
+        """
+        with self._lock:
+            snapshot = self.snapshot()
+            self.checkouts = 0
+            self.wait_duration = 0.0
+            self.max_wait_duration = 0.0
+            self.timeouts = 0
+        return snapshot
+
+    def snapshot(self) -> dict[str, Union[int, float]]:
+        return {
+            "checked_out": self.checked_out,
+            "checkouts": self.checkouts,
+            "wait_duration": round(self.wait_duration, 3),
+            "max_wait_duration": round(self.max_wait_duration, 3),
+            "timeouts": self.timeouts,
+        }
+
+    def on_checkout(self, *args: Any) -> None:
+        self.checked_out += 1
+
+    def on_checkin(self, *args: Any) -> None:
+        self.checked_out -= 1
+
+
+# Statistics of the pools of the async engines, the primary's and the replicas', which are the only ones endpoints use
+pool_stats = PoolStats()
+
+
+class TimedPool(Pool):
+    """
+    Pool that records the time each checkout waits for a connection in pool_stats.
+    """
+
+    def connect(self) -> Any:
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()  # type: ignore
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_stats.record_checkout((time.perf_counter() - start) * 1000, timed_out)
+
+
+class TimedQueuePool(TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(TimedPool, NullPool):
+    pass
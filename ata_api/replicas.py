@@ -0,0 +1,56 @@
+import itertools
+from collections.abc import Callable, Sequence
+from enum import auto
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ata_api.helpers.enum import StrEnumKebab
+
+
+class ReplicaSelection(StrEnumKebab):
+    # Each replica in turn
+    ROUND_ROBIN = auto()
+    # The replica with the fewest connections checked out by this container or worker, in turn among ties
+    LEAST_CONNECTIONS = auto()
+
+
+class ReplicaSet:
+    """
+    Engines of the read replicas, one of which is picked for each read session.
+    """
+
+    def __init__(self, engines: Sequence[AsyncEngine], selection: ReplicaSelection = ReplicaSelection.ROUND_ROBIN):
+        if len(engines) == 0:
+            raise ValueError("Expected at least one replica engine")
+
+        self.engines = list(engines)
+        self.selection = selection
+        # Per engine
+        self.checked_out = [0] * len(engines)
+        self._turns = itertools.count()
+        for i, engine in enumerate(self.engines):
+            event.listen(engine.sync_engine.pool, "checkout", self._on_checkout(i))
+            event.listen(engine.sync_engine.pool, "checkin", self._on_checkin(i))
+
+    def _on_checkout(self, i: int) -> Callable[..., None]:
+        def on_checkout(*args: Any) -> None:
+            self.checked_out[i] += 1
+
+        return on_checkout
+
+    def _on_checkin(self, i: int) -> Callable[..., None]:
+        def on_checkin(*args: Any) -> None:
+            self.checked_out[i] -= 1
+
+        return on_checkin
+
+    def pick(self) -> AsyncEngine:
+        start = next(self._turns) % len(self.engines)
+        if self.selection == ReplicaSelection.ROUND_ROBIN:
+            return self.engines[start]
+
+        # min returns the first of ties, so starting from each replica in turn spreads ties evenly
+        indices = [(start + offset) % len(self.engines) for offset in range(len(self.engines))]
+        return self.engines[min(indices, key=self.checked_out.__getitem__)]
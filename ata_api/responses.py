@@ -0,0 +1,50 @@
+from collections.abc import Sequence
+from uuid import UUID
+
+from ata_db_models.models import Group
+from fastapi import Response
+
+from ata_api.site import SiteName
+
+# Bodies are rendered from precomputed fragments, skipping validation and JSON encoding. Since site names, user IDs
+# and groups never need escaping, the output is byte-for-byte what JSONResponse would render for the same models.
+_PRESCRIPTION_PREFIXES = {
+    site_name: f'{{"site_name":"{site_name.value}","user_id":"'.encode() for site_name in SiteName
+}
+_PRESCRIPTION_SUFFIXES = {group: f'","group":"{group.value}"}}'.encode() for group in Group}
+# A prescription's group never changes, so it's the only part of the body an ETag needs to be derived from. Bump the
+# version whenever the body's format changes, so that clients don't keep stale bodies.
+PRESCRIPTION_ETAGS = {group: f'"v1-{group.value}"' for group in Group}
+
+ROOT_BODY = b'{"message":"This is the root endpoint for the AtA API."}'
+
+
+class PrecomputedJSONResponse(Response):
+    """
+    Response whose content is already rendered JSON.
+    """
+
+    media_type = "application/json"
+
+
+def render_prescription(site_name: SiteName, user_id: UUID, group: Group) -> bytes:
+    """
+    Renders a PrescriptionResponse.
+    """
+    return _PRESCRIPTION_PREFIXES[site_name] + str(user_id).encode() + _PRESCRIPTION_SUFFIXES[group]
+
+
+def render_prescriptions(prescriptions: Sequence[tuple[SiteName, UUID, Group]]) -> bytes:
+    """
+    Renders a BatchPrescriptionResponse.
+    """
+    return b'{"prescriptions":[' + b",".join(render_prescription(*p) for p in prescriptions) + b"]}"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag, using weak comparison as RFC 9110 requires for If-None-Match.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
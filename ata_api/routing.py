@@ -1,27 +1,60 @@
 # adapted from https://www.eliasbrange.dev/posts/observability-with-fastapi-aws-lambda-powertools/
+import random
 from collections.abc import Callable, Coroutine
 from typing import Any
 
 from fastapi import Request, Response
 from fastapi.routing import APIRoute
 
-from ata_api.monitoring.logging import logger
+from ata_api.db import get_pool_status
+from ata_api.monitoring.logging import debug_sampled, log_debug, logger
+from ata_api.monitoring.timing import RequestTimer, request_timer
+from ata_api.settings import settings
 
 
 class LoggerRouteHandler(APIRoute):
     def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
         original_route_handler = super().get_route_handler()
+        debug_log_sample_rate = settings.debug_log_sample_rates.get(self.path, 0.0)
 
         async def route_handler(request: Request) -> Response:
-            # Add fastapi context to logs
+            # Add fastapi context to logs. The path is read from the scope, since request.url parses the whole URL.
             context = {
-                "path": request.url.path,
+                "path": request.scope["path"],
                 "route": self.path,
                 "method": request.method,
             }
             logger.append_keys(fastapi=context)  # type: ignore
-            logger.info("Received request")
 
-            return await original_route_handler(request)
+            # Only emit the debug logs of a sample of requests, whatever the log level
+            if debug_log_sample_rate > 0 and random.random() < debug_log_sample_rate:
+                token = debug_sampled.set(True)
+                try:
+                    return await handle(request)
+                finally:
+                    debug_sampled.reset(token)
+            return await handle(request)
+
+        async def handle(request: Request) -> Response:
+            log_debug("Received request")
+
+            # Only time a sample of requests, so that the rest don't pay for it
+            if random.random() >= settings.request_timing_sample_rate:
+                return await original_route_handler(request)
+
+            timer = RequestTimer()
+            token = request_timer.set(timer)
+            try:
+                response = await original_route_handler(request)
+            finally:
+                request_timer.reset(token)
+
+            timer.finish()
+            response.headers["Server-Timing"] = timer.server_timing()
+            logger.info("Timed request", extra={"timing": timer.durations, "db_pool": get_pool_status()})
+            if settings.request_timing_metrics:
+                timer.add_metrics(self.path)
+
+            return response
 
         return route_handler
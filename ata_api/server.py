@@ -0,0 +1,84 @@
+"""
+Runs the app as a long-lived server with multiple worker processes, e.g., behind a load balancer, as an alternative
+to Lambda for sites with steady traffic. Requires the server extra.
+
+Each worker runs the app's lifespan, so it warms up its own DB pool and caches before accepting requests, and flushes
+metrics and the write-behind queue periodically rather than per request. On SIGTERM, workers drain (see
+DrainingServer) before shutting down.
+
+Usage: python -m ata_api.server
+"""
+import asyncio
+import signal
+from types import FrameType
+from typing import Optional
+
+from uvicorn import Config, Server
+from uvicorn.supervisors import Multiprocess
+
+from ata_api.app import app
+from ata_api.monitoring.logging import logger
+from ata_api.settings import settings
+
+# Imported by each worker. ata_api.main registers the routes on ata_api.app.app.
+APP = "ata_api.main:app"
+
+
+class DrainingServer(Server):
+    """
+    Uvicorn server that, on SIGTERM, keeps serving for drain_delay seconds while failing readiness checks, so that
+    load balancers stop routing requests to it before it stops accepting them. It then shuts down as uvicorn does:
+    it waits for requests in flight, then runs the app's lifespan shutdown. A second signal, or SIGINT, skips the
+    drain.
+    """
+
+    def __init__(self, config: Config, drain_delay: float = 0) -> None:
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self.draining = False
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]) -> None:
+        if sig != signal.SIGTERM or self.draining or self.drain_delay <= 0:
+            super().handle_exit(sig, frame)
+            return
+
+        logger.info("Draining for %s seconds before shutting down", self.drain_delay)
+        self.draining = True
+        app.state.ready = False
+        asyncio.get_running_loop().call_later(self.drain_delay, super().handle_exit, sig, frame)
+
+
+class DrainingMultiprocess(Multiprocess):
+    """
+    Uvicorn's supervisor of worker processes, except that on shutdown, it signals all workers before waiting on any,
+    so that they drain at the same time rather than one after the other.
+    """
+
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        logger.info("Stopped parent process [%d]", self.pid)
+
+
+def main() -> None:
+    config = Config(
+        APP,
+        host=settings.server_host,
+        port=settings.server_port,
+        workers=settings.server_workers,
+        # Fail the worker if the app fails to start, rather than serving without it
+        lifespan="on",
+    )
+    server = DrainingServer(config, drain_delay=settings.server_drain_delay)
+
+    # As uvicorn.run does, with DrainingServer and DrainingMultiprocess instead
+    if config.workers > 1:
+        DrainingMultiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == "__main__":
+    main()
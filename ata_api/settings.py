@@ -1,10 +1,25 @@
-from functools import lru_cache
+from enum import auto
+from functools import cached_property, lru_cache
 from typing import Optional
 
-from ata_db_models.helpers import Stage
-from pydantic import BaseSettings, HttpUrl
+from pydantic import BaseSettings, validator
 
+from ata_api.assignment import AssignmentConfig, AssignmentRegistry
+from ata_api.cors import normalize_origin
+from ata_api.helpers.enum import StrEnumSnake
 from ata_api.monitoring.logging import logger
+from ata_api.pool import DBPoolClass
+from ata_api.replicas import ReplicaSelection
+from ata_api.site import SiteName
+
+
+class Stage(StrEnumSnake):
+    """
+    Same as ata_db_models.helpers.Stage, which isn't imported since that module pulls in boto3 (see ata_api.db).
+    """
+
+    DEV = auto()
+    PROD = auto()
 
 
 class Settings(BaseSettings):
@@ -15,7 +30,118 @@ class Settings(BaseSettings):
 
     # If you want to use an environment variable, add it here.
     stage: Optional[Stage] = None
-    cors_allowed_origins: set[HttpUrl] = set()
+    # Set by the Lambda runtime; None when running as a long-lived server
+    aws_lambda_function_name: Optional[str] = None
+    # Origins allowed to make cross-origin requests, e.g., https://example.com. Subdomains can be allowed with a
+    # wildcard, e.g., https://*.example.com.
+    cors_allowed_origins: set[str] = set()
+    # Seconds for which browsers may cache preflight responses
+    cors_max_age: int = 600
+    # How users are assigned to groups, per site, e.g., {"afro-la": {"strategy": "hash", "persistence": "none",
+    # "weights": {"A": 1, "B": 1}}}.
+    # Sites not listed use the defaults of AssignmentConfig.
+    site_assignments: dict[SiteName, AssignmentConfig] = {}
+    # JSON file of assignment configs that override site_assignments, with a version, e.g.,
+    # {"version": "2", "sites": {"afro-la": {"weights": {"A": 1, "B": 1, "C": 0}}}}. Reloaded when the version changes.
+    assignment_config_path: Optional[str] = None
+    # Seconds between checks of assignment_config_path for a new version
+    assignment_config_reload_interval: float = 30
+    # Cache-Control header of prescriptions, e.g., "public, max-age=86400, s-maxage=604800". None to send none.
+    # Prescriptions sent with it also get Vary: Origin, since CORS headers depend on the Origin.
+    prescription_cache_control: Optional[str] = None
+    # Per site, overriding prescription_cache_control
+    site_cache_control: dict[SiteName, str] = {}
+    # Key that requests to the bulk export and import endpoints, and the stats endpoint, must send in the X-API-Key
+    # header. The endpoints are disabled if unset.
+    bulk_api_key: Optional[str] = None
+    # Connection pool of the async DB engine (see: https://docs.sqlalchemy.org/en/14/core/pooling.html). Every
+    # container or worker has its own, so the DB needs to accept (db_pool_size + db_max_overflow) connections per
+    # container or worker.
+    db_pool_class: DBPoolClass = DBPoolClass.AUTO
+    # Only apply to the queue pool
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    # Seconds to wait for a connection when the pool is exhausted, before failing the request
+    db_pool_timeout: float = 30
+    db_pool_pre_ping: bool = True
+    # Seconds after which a pooled connection is replaced; -1 to never replace
+    db_pool_recycle: int = 1800
+    # Whether the DB is reached through RDS Proxy, which pools connections itself. Prepared statements aren't
+    # cached then, since they pin the proxy's connections to a client.
+    db_rds_proxy: bool = False
+    # Hosts of read replicas, with the same port, credentials and DB name as the primary (HOST). If set,
+    # prescriptions are read from a replica first, and only created on (or, if the replica lags, read from) the
+    # primary.
+    db_replica_hosts: list[str] = []
+    # How a replica is picked for each request
+    db_replica_selection: ReplicaSelection = ReplicaSelection.ROUND_ROBIN
+    # In-process cache of prescriptions, per container or worker; 0 to disable
+    prescription_cache_size: int = 10_000
+    # Seconds after which a cached prescription expires; None to never expire
+    prescription_cache_ttl: Optional[float] = None
+    # Seconds that concurrent requests for the same prescription wait on the first one's DB lookup, rather than
+    # making their own, before giving up and making their own
+    prescription_lookup_timeout: float = 5
+    # Cache of prescriptions shared across containers and workers, on a server that speaks the Redis protocol,
+    # e.g., redis://host:6379/0. Requires the redis extra. Not used if unset.
+    shared_cache_url: Optional[str] = None
+    shared_cache_max_connections: int = 10
+    # Seconds to wait on the shared cache, including for a pooled connection, before falling back to the DB
+    shared_cache_timeout: float = 0.1
+    # Seconds to leave the shared cache alone after an error
+    shared_cache_retry_after: float = 30
+    # Seconds after which a prescription expires from the shared cache; None to never expire
+    shared_cache_ttl: Optional[int] = None
+    # Worker processes when running as a long-lived server (see ata_api.server). Each has its own DB pool and caches.
+    server_workers: int = 1
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    # Seconds that a worker keeps serving after SIGTERM while failing readiness checks, so that load balancers stop
+    # routing requests to it before it stops accepting them
+    server_drain_delay: float = 5
+    # Seconds between metric flushes when running as a long-lived server. (In Lambda, metrics are flushed at
+    # the end of each invocation.)
+    metrics_flush_interval: float = 60
+    # Share of requests, from 0 to 1, per route (e.g., {"/prescription/{site_name}/{user_id}": 0.001}), whose debug
+    # logs are emitted even if LOG_LEVEL is above DEBUG
+    debug_log_sample_rates: dict[str, float] = {}
+    # Share of requests, from 0 to 1, whose stages are timed. Timed requests get a Server-Timing header and a log.
+    request_timing_sample_rate: float = 0.01
+    # Also add the stage durations of timed requests to metrics
+    request_timing_metrics: bool = False
+    # Seconds after which the assignment counts of the stats endpoint are reconciled with the DB, in the background
+    # of the next request
+    stats_reconcile_interval: float = 300
+    # Seconds between additions of assignment counts to the shared cache's server, if set. In Lambda, they're added
+    # at the end of each invocation instead.
+    stats_flush_interval: float = 10
+    # Buffer of new prescriptions for sites with write-behind persistence. Once full, requests wait for it to flush.
+    write_behind_max_size: int = 10_000
+    # Max prescriptions per insert
+    write_behind_batch_size: int = 500
+    # In seconds. In Lambda, the buffer is flushed at the end of each invocation instead.
+    write_behind_flush_interval: float = 1
+    # Attempts to persist a prescription before dropping it
+    write_behind_max_attempts: int = 3
+
+    class Config:
+        keep_untouched = (cached_property,)
+
+    @validator("cors_allowed_origins", each_item=True)
+    def normalize_cors_allowed_origin(cls, origin: str) -> str:
+        return normalize_origin(origin)
+
+    @cached_property
+    def assignments(self) -> AssignmentRegistry:
+        """
+        Assignment configs of all sites, compiled once.
+        """
+        return AssignmentRegistry(
+            self.site_assignments, self.assignment_config_path, self.assignment_config_reload_interval
+        )
+
+    def get_cache_control(self, site_name: SiteName) -> Optional[str]:
+        return self.site_cache_control.get(site_name, self.prescription_cache_control)
 
 
 @lru_cache
@@ -0,0 +1,257 @@
+import asyncio
+import time
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, cast
+from uuid import UUID
+
+from ata_db_models.models import Group
+
+from ata_api.assignment import GROUPS, AssignmentConfig, AssignmentRegistry
+from ata_api.cache import PrescriptionCache, RedisPrescriptionCache, prescription_cache
+from ata_api.models import GroupStats, SiteStats, StatsResponse
+from ata_api.monitoring.logging import logger
+from ata_api.settings import Settings, settings
+from ata_api.site import SiteName
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+# Prescriptions per (site_name, group)
+AssignmentKey = tuple[str, Group]
+ASSIGNMENT_KEYS: list[AssignmentKey] = [(site_name, group) for site_name in SiteName for group in GROUPS]
+
+
+class RedisAssignmentCounts:
+    """
+    Assignment counts kept on the shared cache's server, so that every container counts the assignments made by the
+    others. Counts of persisted prescriptions are fields of a hash, incremented with HINCRBY and replaced on
+    reconciliation, along with its time. Unpersisted assignments are counted with a HyperLogLog per site and group,
+    so that users who are assigned again on each visit are only counted once (with a standard error of 0.81%).
+    """
+
+    KEY = "ata:assignment-counts"
+    RECONCILED_AT = "reconciled-at"
+
+    def __init__(self, client: "Redis") -> None:
+        self.client = client
+        self.fields = {self.format_field(key): key for key in ASSIGNMENT_KEYS}
+
+    @staticmethod
+    def format_field(key: AssignmentKey) -> str:
+        site_name, group = key
+        return f"{site_name}:{group.value}"
+
+    @staticmethod
+    def format_unpersisted_key(key: AssignmentKey) -> str:
+        site_name, group = key
+        return f"ata:unpersisted-assignments:{site_name}:{group.value}"
+
+    async def add(self, counts: Counter[AssignmentKey], unpersisted: dict[AssignmentKey, list[UUID]]) -> None:
+        # Send all commands in a single round trip
+        async with self.client.pipeline(transaction=False) as pipeline:
+            for key, count in counts.items():
+                pipeline.hincrby(self.KEY, self.format_field(key), count)
+            for key, user_ids in unpersisted.items():
+                pipeline.pfadd(self.format_unpersisted_key(key), *(user_id.hex for user_id in user_ids))
+            await pipeline.execute()
+
+    async def get(self) -> tuple[Counter[AssignmentKey], Counter[AssignmentKey], Optional[float]]:
+        """
+        Returns the counts of persisted prescriptions, those of unpersisted assignments, and when the former were
+        last reconciled, as a Unix time.
+        """
+        async with self.client.pipeline(transaction=False) as pipeline:
+            pipeline.hgetall(self.KEY)
+            for key in ASSIGNMENT_KEYS:
+                pipeline.pfcount(self.format_unpersisted_key(key))
+            values, *unpersisted_counts = await pipeline.execute()
+
+        counts: Counter[AssignmentKey] = Counter()
+        reconciled_at = None
+        for field, value in values.items():
+            if field.decode() == self.RECONCILED_AT:
+                reconciled_at = float(value)
+            elif field.decode() in self.fields:
+                counts[self.fields[field.decode()]] = int(value)
+        return counts, Counter(dict(zip(ASSIGNMENT_KEYS, unpersisted_counts))), reconciled_at
+
+    async def reconcile(self, counts: Counter[AssignmentKey], reconciled_at: float) -> None:
+        async with self.client.pipeline(transaction=True) as pipeline:
+            pipeline.delete(self.KEY)
+            mapping = {self.format_field(key): count for key, count in counts.items()}
+            pipeline.hset(self.KEY, mapping={**mapping, self.RECONCILED_AT: reconciled_at})
+            await pipeline.execute()
+
+
+class AssignmentCounts:
+    """
+    Counts of assignments per site and group, so that stats are served without scanning the UserGroup table.
+
+    Prescriptions created here are counted as they're created, and assignments that aren't persisted (see
+    PersistenceMode.NONE) as they're made. With shared storage, counts are added to it on flush, and read from it,
+    so that assignments made by other containers or workers are counted too. Otherwise, prescriptions created
+    elsewhere are only counted when the counts are reconciled with the DB, and unpersisted assignments are counted
+    by each container that makes them, again once they're evicted from its cache.
+
+    Counts of prescriptions are reconciled with the DB, with a single GROUP BY, in the background once they're more
+    than reconcile_interval seconds old (or invalidated, e.g., by imports), and requests are served the last counts
+    in the meantime. Creations that race with a reconciliation may be counted twice or not at all, until the next
+    one.
+    """
+
+    def __init__(self, reconcile_interval: float = 300, shared: Optional[RedisAssignmentCounts] = None) -> None:
+        self.reconcile_interval = reconcile_interval
+        self.shared = shared
+        self.counts: Counter[AssignmentKey] = Counter()
+        self.unpersisted: Counter[AssignmentKey] = Counter()
+        # As a Unix time, since it may come from another container
+        self.reconciled_at_time: Optional[float] = None
+        self.invalidated = False
+        # Counts not yet added to shared storage
+        self.pending: Counter[AssignmentKey] = Counter()
+        self.pending_unpersisted: defaultdict[AssignmentKey, list[UUID]] = defaultdict(list)
+        self.reconciliation: Optional[asyncio.Task[None]] = None
+
+    @property
+    def reconciled_at(self) -> Optional[datetime]:
+        return datetime.utcfromtimestamp(self.reconciled_at_time) if self.reconciled_at_time is not None else None
+
+    @property
+    def stale(self) -> bool:
+        return (
+            self.invalidated
+            or self.reconciled_at_time is None
+            or time.time() - self.reconciled_at_time >= self.reconcile_interval
+        )
+
+    @property
+    def needs_flush(self) -> bool:
+        return len(self.pending) > 0 or len(self.pending_unpersisted) > 0
+
+    def add(self, site_name: SiteName, group: Group, count: int = 1) -> None:
+        self.counts[(site_name, group)] += count
+        if self.shared is not None:
+            self.pending[(site_name, group)] += count
+
+    def add_unpersisted(self, site_name: SiteName, group: Group, user_id: UUID) -> None:
+        self.unpersisted[(site_name, group)] += 1
+        if self.shared is not None:
+            self.pending_unpersisted[(site_name, group)].append(user_id)
+
+    def total(self, key: AssignmentKey) -> int:
+        return self.counts[key] + self.unpersisted[key]
+
+    def invalidate(self) -> None:
+        """
+        Reconciles the counts on the next request, e.g., after prescriptions were created without counting them.
+        """
+        self.invalidated = True
+
+    def reconcile(self, counts: Counter[AssignmentKey]) -> None:
+        """
+        Replaces the counts of prescriptions with those of the DB.
+        """
+        drift = sum(((counts - self.counts) + (self.counts - counts)).values())
+        self.counts = counts
+        self.reconciled_at_time = time.time()
+        self.invalidated = False
+        logger.info("Reconciled assignment counts with the DB, correcting a drift of %d prescriptions", drift)
+
+    async def flush(self) -> None:
+        """
+        Adds the counts made since the last flush to shared storage, if any. Counts of prescriptions that fail to be
+        added are kept for the next flush; unpersisted assignments are dropped, to bound memory.
+        """
+        if self.shared is None or not self.needs_flush:
+            return
+
+        pending, self.pending = self.pending, Counter()
+        pending_unpersisted, self.pending_unpersisted = self.pending_unpersisted, defaultdict(list)
+        try:
+            await self.shared.add(pending, pending_unpersisted)
+        except Exception:
+            logger.warning("Failed to add assignment counts to shared storage", exc_info=True)
+            self.pending.update(pending)
+
+    async def refresh(self, count: Callable[[], Awaitable[Counter[AssignmentKey]]]) -> None:
+        """
+        Reads the counts from shared storage, if any, and if they're stale, starts reconciling them with those returned
+        by count in the background.
+        """
+        if self.shared is not None:
+            await self.flush()
+            try:
+                self.counts, self.unpersisted, self.reconciled_at_time = await self.shared.get()
+            except Exception:
+                logger.warning(
+                    "Failed to read assignment counts from shared storage, serving local ones", exc_info=True
+                )
+
+        if self.stale and (self.reconciliation is None or self.reconciliation.done()):
+            self.reconciliation = asyncio.create_task(self._reconcile(count))
+
+    async def _reconcile(self, count: Callable[[], Awaitable[Counter[AssignmentKey]]]) -> None:
+        try:
+            counts = await count()
+        except Exception:
+            logger.exception("Failed to count prescriptions")
+            return
+
+        self.reconcile(counts)
+        if self.shared is not None:
+            try:
+                await self.shared.reconcile(counts, cast(float, self.reconciled_at_time))
+            except Exception:
+                logger.warning("Failed to reconcile assignment counts in shared storage", exc_info=True)
+
+    async def flush_periodically(self, interval: float) -> None:
+        """
+        Flushes every interval seconds, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+def get_expected_ratios(config: AssignmentConfig) -> Optional[dict[Group, float]]:
+    """
+    Returns the share of new users the config assigns to each group, or None if it depends on each request's weights.
+    """
+    if not config.enabled:
+        return {group: float(group == config.control_group) for group in GROUPS}
+    if config.weights is None:
+        return None
+    total = sum(config.weights.values())
+    return {group: config.weights.get(group, 0) / total for group in GROUPS}
+
+
+def get_stats(counts: AssignmentCounts, assignments: AssignmentRegistry) -> StatsResponse:
+    sites = []
+    for site_name in SiteName:
+        site_counts = {group: counts.total((site_name, group)) for group in GROUPS}
+        total = sum(site_counts.values())
+        expected_ratios = get_expected_ratios(assignments.get(site_name).config)
+        groups = [
+            GroupStats(
+                group=group,
+                count=count,
+                ratio=count / total if total > 0 else 0.0,
+                expected_ratio=expected_ratios[group] if expected_ratios is not None else None,
+            )
+            for group, count in site_counts.items()
+        ]
+        sites.append(SiteStats(site_name=site_name, total=total, groups=groups))
+    return StatsResponse(reconciled_at=counts.reconciled_at, sites=sites)
+
+
+def create_assignment_counts(settings: Settings, cache: PrescriptionCache) -> AssignmentCounts:
+    shared = None
+    if isinstance(cache.shared, RedisPrescriptionCache):
+        # On the same server, through the same connection pool
+        shared = RedisAssignmentCounts(cache.shared.client)
+    return AssignmentCounts(reconcile_interval=settings.stats_reconcile_interval, shared=shared)
+
+
+assignment_counts = create_assignment_counts(settings, prescription_cache)
@@ -0,0 +1,150 @@
+import asyncio
+from collections import OrderedDict
+from itertools import islice
+from typing import Optional
+
+from ata_db_models.models import Group
+
+from ata_api.cache import PrescriptionCache, PrescriptionKey, prescription_cache
+from ata_api.crud import get_or_create_prescriptions_async
+from ata_api.db import get_async_session_factory
+from ata_api.monitoring.logging import logger
+from ata_api.settings import Settings, settings
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process buffer of new prescriptions, persisted in micro-batches after responding.
+
+    Each flush inserts up to batch_size prescriptions per round trip. Prescriptions that fail to persist are put
+    back at the front of the buffer and retried on the next flush, up to max_attempts times. Where another
+    request persisted a different group first (e.g., on another container), that group wins and is written to
+    the cache, so that this container converges on it.
+    """
+
+    def __init__(
+        self,
+        cache: PrescriptionCache,
+        max_size: int = 10_000,
+        batch_size: int = 500,
+        max_attempts: int = 3,
+    ) -> None:
+        self.cache = cache
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.pending: OrderedDict[PrescriptionKey, Group] = OrderedDict()
+        # Prescriptions taken out of pending by a flush that hasn't finished yet
+        self.in_flight: dict[PrescriptionKey, Group] = {}
+        self.attempts: dict[PrescriptionKey, int] = {}
+        # Keeps references to flushes started by put, so that they aren't garbage collected before finishing
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self.pending) + len(self.in_flight)
+
+    def get(self, key: PrescriptionKey) -> Optional[Group]:
+        """
+        Returns the group of a prescription that's waiting to be persisted, if any.
+        """
+        return self.pending.get(key, self.in_flight.get(key))
+
+    async def put(self, key: PrescriptionKey, group: Group) -> bool:
+        """
+        Queues a new prescription. If the buffer is full, flushes it first, which slows callers down to the
+        rate the DB can take. Returns False if it's still full, e.g., because the DB is down, in which case
+        the caller should persist the prescription itself.
+        """
+        if key in self.pending or key in self.in_flight:
+            return True
+        if len(self.pending) >= self.max_size:
+            await self.flush()
+            if len(self.pending) >= self.max_size:
+                return False
+
+        self.pending[key] = group
+        if len(self.pending) >= self.batch_size:
+            # Don't wait for the next periodic flush when a full batch is ready
+            task = asyncio.create_task(self.flush())
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def flush(self) -> None:
+        """
+        Persists everything queued so far, in batches. Stops at the first batch that fails, which is left to
+        the next flush.
+        """
+        remaining = len(self.pending)
+        while remaining > 0 and len(self.pending) > 0:
+            batch = dict(islice(self.pending.items(), min(remaining, self.batch_size)))
+            remaining -= len(batch)
+            for key in batch:
+                del self.pending[key]
+            self.in_flight.update(batch)
+            try:
+                persisted = await self.persist(batch)
+            finally:
+                for key in batch:
+                    self.in_flight.pop(key, None)
+            if not persisted:
+                break
+
+    async def persist(self, batch: dict[PrescriptionKey, Group]) -> bool:
+        session = get_async_session_factory()()
+        try:
+            results = await get_or_create_prescriptions_async(
+                session, [(site_name, user_id, group) for (site_name, user_id), group in batch.items()]
+            )
+        except Exception:
+            # get_or_create_prescriptions_async logs its own exceptions
+            self.retry(batch)
+            return False
+        finally:
+            await session.close()
+
+        conflicts = []
+        for key, result in zip(batch, results):
+            self.attempts.pop(key, None)
+            if result.usergroup.group != batch[key]:
+                conflicts.append((key, result.usergroup.group))
+        if len(conflicts) > 0:
+            logger.info(f"{len(conflicts)} queued prescriptions were already persisted with another group")
+            await self.cache.set_many(conflicts)
+        return True
+
+    def retry(self, batch: dict[PrescriptionKey, Group]) -> None:
+        """
+        Puts a failed batch back at the front of the buffer, dropping prescriptions out of attempts.
+        """
+        dropped = 0
+        for key in reversed(batch):
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if self.attempts[key] >= self.max_attempts:
+                del self.attempts[key]
+                dropped += 1
+            elif key not in self.pending:
+                self.pending[key] = batch[key]
+                self.pending.move_to_end(key, last=False)
+        if dropped > 0:
+            logger.error(f"Dropped {dropped} queued prescriptions after {self.max_attempts} attempts")
+
+    async def flush_periodically(self, interval: float) -> None:
+        """
+        Flushes every interval seconds, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+def create_write_behind_queue(settings: Settings) -> WriteBehindQueue:
+    return WriteBehindQueue(
+        prescription_cache,
+        max_size=settings.write_behind_max_size,
+        batch_size=settings.write_behind_batch_size,
+        max_attempts=settings.write_behind_max_attempts,
+    )
+
+
+write_behind_queue = create_write_behind_queue(settings)
@@ -0,0 +1,101 @@
+"""
+Cold- vs. warm-invocation latency of the Lambda entry point, ata_api.main.handler.
+
+Cold invocations are measured in fresh interpreters (import + first invocation), warm invocations in this process.
+For comparison, warm invocations are also measured with a Mangum adapter built on every invocation, which is what
+the handler used to do.
+
+Usage: python -m benchmarks.handler_latency [--path /] [--warm 500] [--cold 5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Any
+
+from benchmarks.lambda_events import (
+    FakeLambdaContext,
+    api_gateway_event,
+    set_up_lambda_environment,
+)
+from benchmarks.stats import LatencySummary
+
+
+def measure_cold_start(path: str) -> dict[str, float]:
+    """
+    Imports the handler and invokes it once, returning both durations in milliseconds.
+    Meant to run in a fresh interpreter (see run_cold_child).
+    """
+    set_up_lambda_environment()
+
+    start = time.perf_counter()
+    from ata_api.main import handler
+
+    imported = time.perf_counter()
+    handler(api_gateway_event(path), FakeLambdaContext())
+    invoked = time.perf_counter()
+
+    return {"import_ms": (imported - start) * 1000, "first_invocation_ms": (invoked - imported) * 1000}
+
+
+def run_cold_child(path: str) -> dict[str, float]:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.handler_latency", "--path", path, "--cold-child"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    # The child prints its result as the last line, after anything the app itself printed (e.g., EMF metrics)
+    result: dict[str, float] = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result
+
+
+def time_invocations(invoke: Any, event: dict[str, Any], n: int) -> list[float]:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        invoke(event, FakeLambdaContext())
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/", help="Request path to invoke (default: the root endpoint)")
+    parser.add_argument("--warm", type=int, default=500, help="Number of warm invocations")
+    parser.add_argument("--cold", type=int, default=5, help="Number of cold starts, each in a fresh interpreter")
+    parser.add_argument("--cold-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_child:
+        print(json.dumps(measure_cold_start(args.path)))
+        return
+
+    cold = [run_cold_child(args.path) for _ in range(args.cold)]
+
+    set_up_lambda_environment()
+    from mangum import Mangum
+
+    from ata_api.main import app, handler
+
+    event = api_gateway_event(args.path)
+    # Let the container "start" before timing warm invocations
+    handler(event, FakeLambdaContext())
+
+    def per_invocation_adapter(event: dict[str, Any], context: FakeLambdaContext) -> dict[str, Any]:
+        return Mangum(app)(event, context)  # type: ignore
+
+    reused = time_invocations(handler, event, args.warm)
+    rebuilt = time_invocations(per_invocation_adapter, event, args.warm)
+
+    print(f"path={args.path}")
+    if len(cold) > 0:
+        print(LatencySummary.from_samples([c["import_ms"] for c in cold]).format("cold: import"))
+        print(LatencySummary.from_samples([c["first_invocation_ms"] for c in cold]).format("cold: first invocation"))
+    print(LatencySummary.from_samples(reused).format("warm: handler (adapter reused)"))
+    print(LatencySummary.from_samples(rebuilt).format("warm: adapter built per invocation"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Import-time profile of the Lambda entry point, ata_api.main, which is what every cold start pays for before the
+first invocation.
+
+Runs the import with python -X importtime in fresh interpreters, and reports the total time, the time spent per
+top-level package (summing the self time of its modules), and the slowest direct imports of ata_api.
+
+Usage: python -m benchmarks.import_time [--module ata_api.main] [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+from benchmarks.stats import LatencySummary
+
+
+@dataclass
+class ImportRecord:
+    module: str
+    self_us: int
+    cumulative_us: int
+    # Nesting level in the import tree, 0 being the module imported
+    depth: int
+
+
+def parse_importtime(stderr: str) -> list[ImportRecord]:
+    """
+    Parses the output of -X importtime, e.g., "import time:       270 |      55290 |   mangum".
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        module = name.strip()
+        # Each level of nesting is indented by two more spaces, after the separator's own space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        records.append(ImportRecord(module, int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def profile_import(module: str) -> list[ImportRecord]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    return parse_importtime(completed.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="ata_api.main", help="Module to import (default: ata_api.main)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to import in")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages and imports to list")
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.runs)]
+
+    # The module itself is imported last, and its cumulative time covers everything it imports
+    totals = [next(r.cumulative_us for r in reversed(records) if r.module == args.module) / 1000 for records in runs]
+    print(LatencySummary.from_samples(totals).format(f"import {args.module}"))
+
+    # Use the median run for the breakdowns
+    median = sorted(range(len(runs)), key=lambda i: totals[i])[len(runs) // 2]
+    records = runs[median]
+
+    per_package: dict[str, int] = defaultdict(int)
+    for record in records:
+        per_package[record.module.split(".")[0]] += record.self_us
+    print(f"\nSlowest packages (self time of all their modules), top {args.top}:")
+    for package, self_us in sorted(per_package.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"  {package:<40} {self_us / 1000:8.1f}ms")
+
+    # Modules imported by ata_api, outside of ata_api, are what lazy imports can save
+    package = args.module.split(".")[0]
+    first_imports = []
+    for i, record in enumerate(records):
+        if record.module.split(".")[0] == package:
+            continue
+        # Find the importer: the next record at a lower depth
+        importer = next((r for r in records[i + 1 :] if r.depth < record.depth), None)
+        if importer is not None and importer.module.split(".")[0] == package:
+            first_imports.append((record, importer))
+    print(f"\nSlowest imports by {package} (cumulative), top {args.top}:")
+    for record, importer in sorted(first_imports, key=lambda item: -item[0].cumulative_us)[: args.top]:
+        print(f"  {record.module:<40} {record.cumulative_us / 1000:8.1f}ms  (imported by {importer.module})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Per-call overhead of the instrumentation of CRUD functions: the metric and exception decorators as they used to be
+stacked (log_cloudwatch_metric on top of raise_exception, kept here as the baseline), against the composed
+instrument decorator.
+
+Decorates a no-op async function returning a prescription result, as get_or_create_prescription_async does, and
+reports the time per call of each variant, and its overhead over the undecorated function. Metrics are buffered by
+metric_aggregator, as in production, and never flushed.
+
+Usage: python -m benchmarks.instrumentation [--calls 100000] [--batch 1000]
+"""
+import argparse
+import asyncio
+import functools
+import inspect
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+from typing import Any, TypeVar, Union, cast
+from uuid import uuid4
+
+from ata_db_models.models import Group, UserGroup
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.metrics import MetricUnit
+from fastapi import HTTPException
+
+from ata_api.crud import RESULT_DIMENSIONS, PrescriptionResult, get_result_metric_name
+from ata_api.helpers.functools import log_call_exception
+from ata_api.monitoring.instrumentation import instrument
+from ata_api.monitoring.logging import logger
+from ata_api.monitoring.metrics import Dimensions, metric_aggregator, metrics
+from benchmarks.stats import LatencySummary
+
+F = TypeVar("F", bound=Callable[..., Any])
+R = TypeVar("R")
+
+
+def raise_exception(exception: Exception, logger: Logger) -> Callable[[F], F]:
+    """
+    Accepts an Exception as an argument and wraps around a function (sync or async).
+    When the function short-circuits, the exception is raised.
+    """
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as exception_internal:
+                    log_call_exception(logger, func, args, kwargs)
+                    raise exception from exception_internal
+
+            return cast(F, async_wrapper)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return func(*args, **kwargs)
+            except Exception as exception_internal:
+                log_call_exception(logger, func, args, kwargs)
+                raise exception from exception_internal
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def call_with_output(func: F, handle_output: Callable[[Any], None]) -> F:
+    """
+    Wraps a function (sync or async) to pass its output to handle_output before returning it.
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            output = await func(*args, **kwargs)
+            handle_output(output)
+            return output
+
+        return cast(F, async_wrapper)
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        output = func(*args, **kwargs)
+        handle_output(output)
+        return output
+
+    return cast(F, wrapper)
+
+
+def resolve(value: Union[str, Callable[[R], str]], output: R) -> str:
+    """
+    If the value is a constant, returns it as-is. If it's a function, it needs to be called with the output.
+    """
+    return value if isinstance(value, str) else value(output)
+
+
+def resolve_dimensions(
+    default_dimensions: dict[str, str], dimensions: dict[str, Union[str, Callable[[R], str]]], output: R
+) -> Dimensions:
+    return (
+        *default_dimensions.items(),
+        *((dimension_name, resolve(dimension_value, output)) for dimension_name, dimension_value in dimensions.items()),
+    )
+
+
+def log_cloudwatch_metric(
+    name: Union[str, Callable[[R], str]],
+    value: float,
+    unit: MetricUnit,
+    dimensions: dict[str, Union[str, Callable[[R], str]]],
+    log_if_output_is_none: bool = False,
+    default_dimensions: dict[str, str] = metrics.default_dimensions,
+) -> Callable[[F], F]:
+    """
+    Wraps a function (sync or async) to log a CloudWatch metric. Like dimension values, the name can be
+    a function of the output of the wrapped function. The metric is buffered by metric_aggregator until
+    it's flushed.
+    """
+
+    def log_metric(output: R) -> None:
+        # If func returns None and we don't want to log any metric in this case,
+        # we're good to go
+        if output is None and not log_if_output_is_none:
+            return
+
+        try:
+            metric_aggregator.add(
+                name=resolve(name, output),
+                unit=unit,
+                value=value,
+                dimensions=resolve_dimensions(default_dimensions, dimensions, output),
+            )
+        except Exception:
+            logger.exception("Failed to log metric")
+
+    def decorator(func: F) -> F:
+        return call_with_output(func, log_metric)
+
+    return decorator
+
+
+def log_cloudwatch_metric_per_item(
+    name: Union[str, Callable[[R], str]],
+    value: float,
+    unit: MetricUnit,
+    dimensions: dict[str, Union[str, Callable[[R], str]]],
+    default_dimensions: dict[str, str] = metrics.default_dimensions,
+) -> Callable[[F], F]:
+    """
+    Wraps a function (sync or async) that returns a list to log a CloudWatch metric for each item of the list.
+    Metrics with the same name and dimensions are summed by metric_aggregator until it's flushed.
+    """
+
+    def log_metrics(output: list[R]) -> None:
+        try:
+            for item in output:
+                metric_aggregator.add(
+                    name=resolve(name, item),
+                    unit=unit,
+                    value=value,
+                    dimensions=resolve_dimensions(default_dimensions, dimensions, item),
+                )
+        except Exception:
+            logger.exception("Failed to log metric")
+
+    def decorator(func: F) -> F:
+        return call_with_output(func, log_metrics)
+
+    return decorator
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100_000, help="Number of calls per variant")
+    parser.add_argument("--batch", type=int, default=1000, help="Number of calls per timed sample")
+    args = parser.parse_args()
+
+    result = PrescriptionResult(
+        UserGroup(user_id=uuid4(), site_name="afro-la", group=Group.A, last_updated=datetime.now()), created=False
+    )
+    exception = HTTPException(status_code=500)
+
+    async def get_or_create() -> PrescriptionResult:
+        return result
+
+    stacked = log_cloudwatch_metric(
+        name=get_result_metric_name, value=1, unit=MetricUnit.Count, dimensions=RESULT_DIMENSIONS
+    )(raise_exception(exception=exception, logger=logger)(get_or_create))
+    composed = instrument(
+        name=get_result_metric_name, value=1, unit=MetricUnit.Count, dimensions=RESULT_DIMENSIONS, exception=exception
+    )(get_or_create)
+
+    async def measure(func: Callable[[], Awaitable[Any]]) -> list[float]:
+        samples = []
+        for _ in range(args.calls // args.batch):
+            start = time.perf_counter()
+            for _ in range(args.batch):
+                await func()
+            # In microseconds per call
+            samples.append((time.perf_counter() - start) * 1_000_000 / args.batch)
+        return samples
+
+    variants = {"undecorated": get_or_create, "stacked decorators (before)": stacked, "instrument": composed}
+    means = {}
+    print(f"Per call (batches of {args.batch}):")
+    for label, func in variants.items():
+        summary = LatencySummary.from_samples(asyncio.run(measure(func)))
+        means[label] = summary.mean
+        print(f"{label:<40} mean={summary.mean:7.2f}us p50={summary.p50:7.2f}us p99={summary.p99:7.2f}us")
+
+    for label in list(variants)[1:]:
+        print(f"Overhead of {label}: {means[label] - means['undecorated']:.2f}us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Synthetic Lambda inputs for driving ata_api.main.handler outside of AWS.
+"""
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+
+def set_up_lambda_environment() -> None:
+    """
+    Sets the environment variables that Lambda and the ata-infrastructure repo would normally provide. Must be called
+    before importing ata_api.main.
+    """
+    os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "ata-api-benchmark")
+    os.environ.setdefault("POWERTOOLS_SERVICE_NAME", "ata-api-benchmark")
+    # Keep per-request logs out of the benchmark output (and timings)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+@dataclass
+class FakeLambdaContext:
+    """
+    The subset of the Lambda context object that powertools and Mangum read.
+    """
+
+    function_name: str = "ata-api-benchmark"
+    memory_limit_in_mb: int = 128
+    invoked_function_arn: str = "arn:aws:lambda:us-east-1:000000000000:function:ata-api-benchmark"
+    aws_request_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+
+
+def api_gateway_event(
+    path: str,
+    method: str = "GET",
+    headers: Optional[dict[str, str]] = None,
+    query: Optional[dict[str, str]] = None,
+    body: Optional[str] = None,
+) -> dict[str, Any]:
+    """
+    Builds an API Gateway (REST, proxy integration) event for the given request.
+    """
+    return {
+        "resource": "/{proxy+}",
+        "path": path,
+        "httpMethod": method,
+        "headers": headers or {},
+        "multiValueHeaders": {},
+        "queryStringParameters": query,
+        "multiValueQueryStringParameters": None,
+        "requestContext": {"identity": {"sourceIp": "127.0.0.1"}},
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def warmer_event() -> dict[str, Any]:
+    """
+    Builds the event lambdawarmer expects from the scheduled CloudWatch ping.
+    """
+    return {"warmer": True, "concurrency": 1}
@@ -0,0 +1,200 @@
+"""
+Throughput and latency of get_prescription under a mix of returning (cache/DB hit) and new (miss) users.
+
+Drives either the ASGI app in-process with concurrent clients ("app" target), or the Lambda entry point,
+ata_api.main.handler, one invocation at a time, as Lambda does ("handler" target). Prescriptions are written to the
+same local database as the integration tests; its tables are created if needed.
+
+Results can be saved as a baseline and later runs compared against it, failing if they regress by more than the
+tolerance.
+
+Usage: python -m benchmarks.load [--target app] [--requests 2000] [--concurrency 16] [--hit-ratio 0.8]
+                                 [--save-baseline FILE] [--baseline FILE] [--tolerance 0.1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from benchmarks.lambda_events import (
+    FakeLambdaContext,
+    api_gateway_event,
+    set_up_lambda_environment,
+)
+from benchmarks.stats import LatencySummary, compare
+
+SITE_NAME = "afro-la"
+
+# (is_hit, latency_ms, ok) of a request
+Sample = tuple[bool, float, bool]
+
+
+@dataclass
+class LoadResult:
+    target: str
+    concurrency: int
+    hit_ratio: float
+    requests_per_second: float
+    errors: int
+    latency: LatencySummary
+    hit_latency: LatencySummary
+    miss_latency: LatencySummary
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "LoadResult":
+        summaries = {key: LatencySummary(**data[key]) for key in ("latency", "hit_latency", "miss_latency")}
+        return cls(**{**data, **summaries})
+
+    def format(self) -> str:
+        return "\n".join(
+            [
+                f"target={self.target} concurrency={self.concurrency} hit_ratio={self.hit_ratio} "
+                + f"rps={self.requests_per_second:.1f} errors={self.errors}",
+                self.latency.format("all"),
+                self.hit_latency.format("hits (returning users)"),
+                self.miss_latency.format("misses (new users)"),
+            ]
+        )
+
+
+def build_plan(n: int, hit_ratio: float, returning_users: list[uuid.UUID]) -> list[tuple[bool, str]]:
+    """
+    Returns (is_hit, path) for each request, hits going to returning users and misses to new ones.
+    """
+    plan = []
+    for _ in range(n):
+        hit = random.random() < hit_ratio
+        user_id = random.choice(returning_users) if hit else uuid.uuid4()
+        plan.append((hit, f"/prescription/{SITE_NAME}/{user_id}"))
+    return plan
+
+
+async def run_app(
+    plan: list[tuple[bool, str]], returning_users: list[uuid.UUID], concurrency: int
+) -> tuple[list[Sample], float]:
+    """
+    Runs the plan against the ASGI app with concurrent clients, returning a sample per request and the total
+    duration in seconds.
+    """
+    import httpx
+
+    from ata_api.main import app
+
+    samples: list[Sample] = []
+    queue = iter(plan)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+            # Make sure returning users exist (and are cached) before timing
+            for user_id in returning_users:
+                await client.get(f"/prescription/{SITE_NAME}/{user_id}")
+
+            async def worker() -> None:
+                for hit, path in queue:
+                    start = time.perf_counter()
+                    response = await client.get(path)
+                    samples.append((hit, (time.perf_counter() - start) * 1000, response.status_code == 200))
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            duration = time.perf_counter() - start
+
+    return samples, duration
+
+
+def run_handler(plan: list[tuple[bool, str]], returning_users: list[uuid.UUID]) -> tuple[list[Sample], float]:
+    """
+    Runs the plan against the Lambda handler, sequentially, returning the same as run_app.
+    """
+    from ata_api.main import handler
+
+    for user_id in returning_users:
+        handler(api_gateway_event(f"/prescription/{SITE_NAME}/{user_id}"), FakeLambdaContext())
+
+    samples: list[Sample] = []
+    start = time.perf_counter()
+    for hit, path in plan:
+        request_start = time.perf_counter()
+        response = handler(api_gateway_event(path), FakeLambdaContext())
+        samples.append((hit, (time.perf_counter() - request_start) * 1000, response["statusCode"] == 200))
+    duration = time.perf_counter() - start
+
+    return samples, duration
+
+
+def summarize(samples: list[Sample], hit: bool) -> LatencySummary:
+    latencies = [latency for is_hit, latency, _ in samples if is_hit == hit]
+    # An all-hit or all-miss run has nothing to summarize on the other side
+    return LatencySummary.from_samples(latencies) if len(latencies) > 0 else LatencySummary(0, 0, 0, 0, 0, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["app", "handler"], default="app", help="What to drive (default: app)")
+    parser.add_argument("--requests", type=int, default=2000, help="Number of timed requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (app target only)")
+    parser.add_argument("--hit-ratio", type=float, default=0.8, help="Share of requests from returning users")
+    parser.add_argument("--returning-users", type=int, default=200, help="Number of distinct returning users")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the traffic mix")
+    parser.add_argument("--save-baseline", type=Path, help="Save results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed regression vs. baseline (default 10%%)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    set_up_lambda_environment()
+    from ata_db_models.models import SQLModel
+
+    from ata_api.db import get_engine
+
+    SQLModel.metadata.create_all(get_engine())
+
+    returning_users = [uuid.uuid4() for _ in range(args.returning_users)]
+    plan = build_plan(args.requests, args.hit_ratio, returning_users)
+    if args.target == "app":
+        samples, duration = asyncio.run(run_app(plan, returning_users, args.concurrency))
+        concurrency = args.concurrency
+    else:
+        samples, duration = run_handler(plan, returning_users)
+        concurrency = 1
+
+    result = LoadResult(
+        target=args.target,
+        concurrency=concurrency,
+        hit_ratio=args.hit_ratio,
+        requests_per_second=len(samples) / duration,
+        errors=sum(1 for _, _, ok in samples if not ok),
+        latency=LatencySummary.from_samples([latency for _, latency, _ in samples]),
+        hit_latency=summarize(samples, hit=True),
+        miss_latency=summarize(samples, hit=False),
+    )
+    print(result.format())
+
+    if args.save_baseline is not None:
+        args.save_baseline.write_text(json.dumps(asdict(result), indent=2))
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline is not None:
+        baseline = LoadResult.from_dict(json.loads(args.baseline.read_text()))
+        regressions = compare(
+            {
+                "rps": (baseline.requests_per_second, result.requests_per_second),
+                "p50": (baseline.latency.p50, result.latency.p50),
+                "p95": (baseline.latency.p95, result.latency.p95),
+                "p99": (baseline.latency.p99, result.latency.p99),
+            },
+            args.tolerance,
+            higher_is_better=frozenset({"rps"}),
+        )
+        if len(regressions) > 0:
+            sys.exit(f"Regressed vs. {args.baseline}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Cost of the logs a prescription request emits, per request: CPU time, and bytes of JSON written (which is what
+CloudWatch Logs bills for).
+
+Compares the logs requests used to emit (an info log on receipt, and an eagerly formatted one before reading the
+DB) with the current ones (debug logs through log_debug, which are neither formatted nor emitted at level INFO),
+unsampled and sampled for debug logs. Logs are written to a counting sink, rather than stdout.
+
+Usage: python -m benchmarks.logging_cost [--requests 20000] [--batch 100]
+"""
+import argparse
+import io
+import logging
+import os
+import time
+from collections.abc import Callable
+from uuid import uuid4
+
+from benchmarks.stats import LatencySummary
+
+
+class CountingSink(io.TextIOBase):
+    """
+    Stream that only counts what's written to it.
+    """
+
+    def __init__(self) -> None:
+        self.written = 0
+
+    def write(self, text: str) -> int:
+        self.written += len(text.encode())
+        return len(text)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20_000, help="Number of simulated requests per variant")
+    parser.add_argument("--batch", type=int, default=100, help="Number of requests per timed sample")
+    args = parser.parse_args()
+
+    # Like production, unless overridden
+    os.environ.setdefault("LOG_LEVEL", "INFO")
+    from ata_api.monitoring.logging import debug_sampled, log_debug, logger
+    from ata_api.site import SiteName
+
+    sink = CountingSink()
+    for handler in logger.handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sink)  # type: ignore
+
+    site_name = SiteName.AFRO_LA
+    user_id = uuid4()
+    route = "/prescription/{site_name}/{user_id}"
+    path = f"/prescription/{site_name}/{user_id}"
+
+    def eager() -> None:
+        logger.append_keys(fastapi={"path": path, "route": route, "method": "GET"})
+        logger.info("Received request")
+        logger.info(f"Getting prescription for user {user_id} at site {site_name}")
+
+    def lazy() -> None:
+        logger.append_keys(fastapi={"path": path, "route": route, "method": "GET"})
+        log_debug("Received request")
+        log_debug("Getting prescription for user %s at site %s", user_id, site_name)
+
+    def lazy_sampled() -> None:
+        token = debug_sampled.set(True)
+        try:
+            lazy()
+        finally:
+            debug_sampled.reset(token)
+
+    variants: dict[str, Callable[[], None]] = {
+        "eager info logs (before)": eager,
+        "lazy debug logs": lazy,
+        "lazy debug logs, sampled": lazy_sampled,
+    }
+    print(f"Log level: {logging.getLevelName(logger.log_level)}, per request (batches of {args.batch}):")
+    for label, request in variants.items():
+        sink.written = 0
+        samples = []
+        for _ in range(args.requests // args.batch):
+            start = time.perf_counter()
+            for _ in range(args.batch):
+                request()
+            samples.append((time.perf_counter() - start) * 1000 / args.batch)
+        print(LatencySummary.from_samples(samples).format(label))
+        print(f"{'':<40} {sink.written / (len(samples) * args.batch):.0f} bytes logged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class LatencySummary:
+    """
+    Summary statistics, in milliseconds, of a list of latency samples.
+    """
+
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+    @classmethod
+    def from_samples(cls, samples_ms: list[float]) -> "LatencySummary":
+        if len(samples_ms) == 0:
+            raise ValueError("Cannot summarize an empty list of samples")
+
+        ordered = sorted(samples_ms)
+        return cls(
+            count=len(ordered),
+            mean=sum(ordered) / len(ordered),
+            p50=percentile(ordered, 50),
+            p95=percentile(ordered, 95),
+            p99=percentile(ordered, 99),
+            max=ordered[-1],
+        )
+
+    def format(self, label: str) -> str:
+        return (
+            f"{label:<40} n={self.count:<6} mean={self.mean:8.3f}ms p50={self.p50:8.3f}ms "
+            + f"p95={self.p95:8.3f}ms p99={self.p99:8.3f}ms max={self.max:8.3f}ms"
+        )
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile of an already-sorted list.
+    """
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def compare(
+    metrics: dict[str, tuple[float, float]], tolerance: float, higher_is_better: frozenset[str] = frozenset()
+) -> list[str]:
+    """
+    Prints each metric's (baseline, current) values and relative change, and returns the names of those that
+    regressed by more than the tolerance (e.g., 0.1 for 10%). Metrics are lower-is-better unless named in
+    higher_is_better.
+    """
+    regressions = []
+    for name, (baseline, current) in metrics.items():
+        change = (current - baseline) / baseline if baseline != 0 else 0.0
+        regression = -change if name in higher_is_better else change
+        regressed = regression > tolerance
+        print(
+            f"{name:<6} baseline={baseline:10.3f} current={current:10.3f} change={change:+7.1%}"
+            + (" REGRESSED" if regressed else "")
+        )
+        if regressed:
+            regressions.append(name)
+    return regressions
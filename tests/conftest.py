@@ -0,0 +1,26 @@
+from typing import Generator
+
+import pytest
+from ata_db_models.models import SQLModel
+
+from ata_api.cache import prescription_cache
+from ata_api.db import get_engine
+from ata_api.stats import assignment_counts
+
+
+@pytest.fixture(scope="function")
+def create_and_drop_tables() -> Generator[None, None, None]:
+    """
+    Fixture responsible for creating tables before and dropping tables after
+    every test, ensuring a clean slate. (See: https://docs.pytest.org/en/6.2.x/fixture.html#:~:text=%E2%80%9CYield%E2%80%9D%20fixtures%20yield%20instead%20of,is%20swapped%20out%20for%20yield%20.)
+
+    If using a dedicated test DB instead of localhost, try the https://dev.to/jbrocher/fastapi-testing-a-database-5ao5 approach,
+    which right now is overkill.
+    """
+    SQLModel.metadata.create_all(get_engine())
+    yield
+    SQLModel.metadata.drop_all(get_engine())
+    prescription_cache.clear()
+    assignment_counts.invalidate()
+    # Not reconciled with the DB
+    assignment_counts.unpersisted.clear()
@@ -0,0 +1,149 @@
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Any
+from uuid import UUID, uuid4
+
+import pytest
+from ata_db_models.models import Group
+from pydantic import ValidationError
+
+from ata_api.assignment import (
+    AssignmentConfig,
+    AssignmentRegistry,
+    AssignmentStrategy,
+    CompiledAssignment,
+    PersistenceMode,
+    WeightTable,
+    hash_group,
+)
+from ata_api.site import SiteName
+
+
+class TestHashGroup:
+    @pytest.mark.unit
+    def test_deterministic(self) -> None:
+        user_id = UUID("3800ac11781a4cf2a6759bbaa9c0729b")
+        groups = {hash_group(SiteName.AFRO_LA, user_id, "salt", WeightTable([1, 1, 1])) for _ in range(10)}
+        assert len(groups) == 1
+
+    @pytest.mark.unit
+    def test_weights(self) -> None:
+        table = WeightTable([1, 0, 3])
+        counts = Counter(hash_group(SiteName.AFRO_LA, uuid4(), "salt", table) for _ in range(4000))
+        assert counts[Group.B] == 0
+        # Expect about 1000 users in A and 3000 in C
+        assert 800 < counts[Group.A] < 1200
+
+
+class TestAssignmentConfig:
+    @pytest.mark.unit
+    def test_random_assignments_are_persisted(self) -> None:
+        with pytest.raises(ValidationError):
+            AssignmentConfig(strategy=AssignmentStrategy.RANDOM, persistence=PersistenceMode.NONE)
+
+    @pytest.mark.unit
+    def test_unpersisted_hash_assignments_have_weights(self) -> None:
+        with pytest.raises(ValidationError):
+            AssignmentConfig(strategy=AssignmentStrategy.HASH, persistence=PersistenceMode.WRITE_BEHIND)
+        AssignmentConfig(strategy=AssignmentStrategy.HASH, persistence=PersistenceMode.SYNC)
+
+    @pytest.mark.unit
+    def test_reassigns(self) -> None:
+        config = AssignmentConfig(
+            strategy=AssignmentStrategy.HASH, persistence=PersistenceMode.NONE, weights={Group.A: 1, Group.B: 1}
+        )
+        assert not config.reassigns(config.copy(update={"persistence": PersistenceMode.SYNC}))
+        updates: list[dict[str, Any]] = [{"salt": "salt"}, {"weights": {Group.A: 1}}, {"enabled": False}]
+        for update in updates:
+            assert config.reassigns(config.copy(update=update))
+        # Random assignments are persisted, so they stick whatever the new config
+        assert not AssignmentConfig().reassigns(AssignmentConfig(enabled=False))
+
+    @pytest.mark.unit
+    def test_invalid_weights(self) -> None:
+        with pytest.raises(ValidationError):
+            AssignmentConfig(weights={Group.A: 0, Group.B: -1})
+
+
+class TestWeightTable:
+    @pytest.mark.unit
+    def test_no_positive_weight(self) -> None:
+        with pytest.raises(ValueError):
+            WeightTable([0, 0, 0])
+
+    @pytest.mark.unit
+    def test_pick(self) -> None:
+        table = WeightTable([1, 0, 3])
+        assert [table.pick(point) for point in (0, 0.99, 1, 3.99)] == [Group.A, Group.A, Group.C, Group.C]
+
+
+class TestCompiledAssignment:
+    @pytest.mark.unit
+    def test_site_weights(self) -> None:
+        assignment = CompiledAssignment(AssignmentConfig(weights={Group.C: 1}))
+        assert {assignment.assign(SiteName.AFRO_LA, uuid4(), (1, 1, 0)) for _ in range(100)} == {Group.C}
+
+    @pytest.mark.unit
+    def test_disabled(self) -> None:
+        assignment = CompiledAssignment(AssignmentConfig(enabled=False, control_group=Group.B))
+        assert {assignment.assign(SiteName.AFRO_LA, uuid4(), (1, 1, 1)) for _ in range(100)} == {Group.B}
+
+    @pytest.mark.unit
+    def test_hash_matches_hash_group(self) -> None:
+        user_id = uuid4()
+        assignment = CompiledAssignment(
+            AssignmentConfig(
+                strategy=AssignmentStrategy.HASH,
+                salt="salt",
+                persistence=PersistenceMode.NONE,
+                weights={Group.A: 1, Group.B: 2, Group.C: 3},
+            )
+        )
+        assert assignment.assign(SiteName.AFRO_LA, user_id, (1, 2, 3)) == hash_group(
+            SiteName.AFRO_LA, user_id, "salt", WeightTable([1, 2, 3])
+        )
+
+
+class TestAssignmentRegistry:
+    @pytest.mark.unit
+    def test_reload_on_new_version(self, tmp_path: Path) -> None:
+        path = tmp_path / "assignments.json"
+        path.write_text(json.dumps({"version": "1", "sites": {"afro-la": {"weights": {"A": 1}}}}))
+        registry = AssignmentRegistry({}, str(path), reload_interval=0)
+        assert registry.get(SiteName.AFRO_LA).assign(SiteName.AFRO_LA, uuid4(), (1, 1, 1)) == Group.A
+
+        path.write_text(json.dumps({"version": "2", "sites": {"afro-la": {"weights": {"B": 1}}}}))
+        # Make sure the modification time changes, even on filesystems with coarse timestamps
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        assert registry.get(SiteName.AFRO_LA).assign(SiteName.AFRO_LA, uuid4(), (1, 1, 1)) == Group.B
+        assert registry.version == "2"
+
+    @pytest.mark.unit
+    def test_keep_configs_on_invalid_file(self, tmp_path: Path) -> None:
+        path = tmp_path / "assignments.json"
+        path.write_text(json.dumps({"version": "1", "sites": {"afro-la": {"weights": {"C": 1}}}}))
+        registry = AssignmentRegistry({}, str(path), reload_interval=0)
+
+        path.write_text("{")
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        assert registry.get(SiteName.AFRO_LA).assign(SiteName.AFRO_LA, uuid4(), (1, 1, 1)) == Group.C
+
+    @pytest.mark.unit
+    def test_keep_unpersisted_hash_assignments(self, tmp_path: Path) -> None:
+        path = tmp_path / "assignments.json"
+        hash_config: dict[str, Any] = {"strategy": "hash", "persistence": "none", "weights": {"A": 1}}
+        path.write_text(json.dumps({"version": "1", "sites": {"afro-la": hash_config, "the-19th": {}}}))
+        registry = AssignmentRegistry({}, str(path), reload_interval=0)
+
+        sites = {"afro-la": {**hash_config, "weights": {"B": 1}}, "the-19th": {"weights": {"B": 1}}}
+        path.write_text(json.dumps({"version": "2", "sites": sites}))
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+        assert registry.get(SiteName.AFRO_LA).assign(SiteName.AFRO_LA, uuid4(), (1, 1, 1)) == Group.A
+        # Other sites still change
+        assert registry.get(SiteName.THE_19TH).assign(SiteName.THE_19TH, uuid4(), (1, 1, 1)) == Group.B
+        assert registry.version == "2"
@@ -0,0 +1,50 @@
+import asyncio
+from collections.abc import AsyncIterator
+from uuid import UUID
+
+import pytest
+from ata_db_models.models import Group
+
+from ata_api.bulk import BulkFormat, InvalidRowError, parse_prescriptions
+from ata_api.site import SiteName
+
+
+async def stream(chunks: list[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+async def parse(chunks: list[bytes], format: BulkFormat) -> list[tuple[UUID, Group]]:
+    return [prescription async for prescription in parse_prescriptions(stream(chunks), format, SiteName.AFRO_LA)]
+
+
+class TestParsePrescriptions:
+    @pytest.mark.unit
+    def test_lines_split_across_chunks(self) -> None:
+        body = f"site_name,user_id,group\nafro-la,{UUID(int=1)},A\nafro-la,{UUID(int=2)},C".encode()
+        chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+        assert asyncio.run(parse(chunks, BulkFormat.CSV)) == [(UUID(int=1), Group.A), (UUID(int=2), Group.C)]
+
+    @pytest.mark.unit
+    def test_other_site(self) -> None:
+        body = f'{{"site_name": "the-19th", "user_id": "{UUID(int=1)}", "group": "A"}}'.encode()
+        with pytest.raises(InvalidRowError):
+            asyncio.run(parse([body], BulkFormat.NDJSON))
+
+    @pytest.mark.unit
+    def test_invalid_utf8(self) -> None:
+        body = f'{{"user_id": "{UUID(int=1)}", "group": "A"}}\n{{"user_id": "\xff"}}'.encode("latin-1")
+        with pytest.raises(InvalidRowError, match="Line 2"):
+            asyncio.run(parse([body], BulkFormat.NDJSON))
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("user_id", ["5", "null", '["00000000-0000-0000-0000-000000000001"]'])
+    def test_invalid_json_types(self, user_id: str) -> None:
+        body = f'{{"user_id": {user_id}, "group": "A"}}'.encode()
+        with pytest.raises(InvalidRowError, match="Line 1"):
+            asyncio.run(parse([body], BulkFormat.NDJSON))
+
+    @pytest.mark.unit
+    def test_csv_leading_blank_lines(self) -> None:
+        body = f"\n\nuser_id,group\n{UUID(int=1)},B\n".encode()
+        assert asyncio.run(parse([body], BulkFormat.CSV)) == [(UUID(int=1), Group.B)]
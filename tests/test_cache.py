@@ -0,0 +1,162 @@
+import asyncio
+from typing import cast
+from uuid import UUID
+
+import fakeredis
+import pytest
+from ata_db_models.models import Group
+from fakeredis.aioredis import FakeRedis
+
+from ata_api.cache import (
+    PrescriptionCache,
+    PrescriptionKey,
+    RedisPrescriptionCache,
+    add_cache_metrics,
+    prescription_cache,
+)
+from ata_api.helpers.cache import CacheStats, LRUCache
+from ata_api.monitoring.metrics import CloudWatchMetric, metric_aggregator
+from ata_api.site import SiteName
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestLRUCache:
+    @pytest.mark.unit
+    def test_evicts_least_recently_used(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # Reading "a" makes "b" the least recently used entry
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats == CacheStats(hits=3, misses=1, evictions=1, expirations=0)
+
+    @pytest.mark.unit
+    def test_expires_entries(self) -> None:
+        clock = FakeClock()
+        cache: LRUCache[str, int] = LRUCache(max_size=2, ttl=10, clock=clock)
+        cache.set("a", 1)
+
+        clock.now = 9.9
+        assert cache.get("a") == 1
+        clock.now = 10
+        assert cache.get("a") is None
+        assert len(cache) == 0
+        assert cache.stats == CacheStats(hits=1, misses=1, evictions=0, expirations=1)
+
+    @pytest.mark.unit
+    def test_reset_stats(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(max_size=1)
+        cache.set("a", 1)
+        cache.get("a")
+        assert cache.reset_stats() == CacheStats(hits=1)
+        assert cache.stats == CacheStats()
+
+    @pytest.mark.unit
+    def test_disabled(self) -> None:
+        cache: LRUCache[str, int] = LRUCache(max_size=0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+
+class TestPrescriptionCache:
+    @pytest.fixture(scope="class")
+    def keys(self) -> list[PrescriptionKey]:
+        return [
+            (SiteName.AFRO_LA, UUID("3800ac11781a4cf2a6759bbaa9c0729b")),
+            (SiteName.THE_19TH, UUID("3800ac11781a4cf2a6759bbaa9c0729b")),
+        ]
+
+    @staticmethod
+    def create_cache(server: fakeredis.FakeServer) -> PrescriptionCache:
+        return PrescriptionCache(
+            local=LRUCache(max_size=10), shared=RedisPrescriptionCache(client=FakeRedis(server=server))
+        )
+
+    @pytest.mark.unit
+    def test_shared_across_caches(self, keys: list[PrescriptionKey]) -> None:
+        """
+        A write through one container's cache should be readable from another's, and then be cached locally.
+        """
+        server = fakeredis.FakeServer()
+        writer, reader = self.create_cache(server), self.create_cache(server)
+
+        async def run() -> None:
+            await writer.set(keys[0], Group.B)
+            assert await reader.get_many(keys) == [Group.B, None]
+
+        asyncio.run(run())
+        assert reader.local.get(keys[0]) == Group.B
+
+    @pytest.mark.unit
+    def test_shared_unavailable(self, keys: list[PrescriptionKey]) -> None:
+        """
+        Errors from the shared cache should be treated as misses.
+        """
+        server = fakeredis.FakeServer()
+        server.connected = False
+        shared = RedisPrescriptionCache(client=FakeRedis(server=server))
+        cache = PrescriptionCache(local=LRUCache(max_size=10), shared=shared)
+
+        async def run() -> None:
+            await cache.set(keys[0], Group.B)
+            assert await cache.get(keys[1]) is None
+
+        asyncio.run(run())
+        # The local tier keeps working
+        assert cache.local.get(keys[0]) == Group.B
+        # And the shared tier is left alone for a while
+        assert not shared.available
+
+    @pytest.mark.unit
+    def test_shared_invalid_value(self, keys: list[PrescriptionKey]) -> None:
+        """
+        Values in the shared cache that aren't groups should be treated as misses, without failing the others.
+        """
+        server = fakeredis.FakeServer()
+        cache = self.create_cache(server)
+        shared = cast(RedisPrescriptionCache, cache.shared)
+
+        async def run() -> None:
+            await cache.set(keys[0], Group.B)
+            await shared.client.set(shared.format_key(keys[1]), b"\xff")
+            cache.clear()
+            assert await cache.get_many(keys) == [Group.B, None]
+
+        asyncio.run(run())
+        assert shared.available
+
+
+@pytest.mark.unit
+def test_add_cache_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    The local tier's statistics since the last flush should be added to the flushed metrics.
+    """
+    added: dict[str, float] = {}
+    monkeypatch.setattr(metric_aggregator, "add", lambda name, unit, value, dimensions: added.update({name: value}))
+    monkeypatch.setattr(prescription_cache, "local", LRUCache(max_size=1))
+    key = (SiteName.AFRO_LA, UUID(int=1))
+    prescription_cache.local.get(key)
+    prescription_cache.local.set(key, Group.A)
+    prescription_cache.local.get(key)
+
+    add_cache_metrics()
+    assert added == {
+        CloudWatchMetric.PRESCRIPTION_CACHE_HITS: 1,
+        CloudWatchMetric.PRESCRIPTION_CACHE_MISSES: 1,
+        CloudWatchMetric.PRESCRIPTION_CACHE_EVICTIONS: 0,
+        CloudWatchMetric.PRESCRIPTION_CACHE_EXPIRATIONS: 0,
+    }
+    add_cache_metrics()
+    assert added[CloudWatchMetric.PRESCRIPTION_CACHE_HITS] == 0
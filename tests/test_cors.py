@@ -0,0 +1,44 @@
+import pytest
+
+from ata_api.cors import CORSPolicy, Headers, add_vary_origin, normalize_origin
+
+
+class TestCORSPolicy:
+    @pytest.mark.unit
+    def test_exact_origins(self) -> None:
+        policy = CORSPolicy({"https://Allowed.com/"})
+        assert policy.is_allowed("https://allowed.com")
+        assert not policy.is_allowed("http://allowed.com")
+        assert not policy.is_allowed("https://www.allowed.com")
+
+    @pytest.mark.unit
+    def test_wildcard_subdomains(self) -> None:
+        policy = CORSPolicy({"https://*.allowed.com"})
+        assert policy.is_allowed("https://www.allowed.com")
+        assert policy.is_allowed("https://a.b.allowed.com")
+        assert not policy.is_allowed("https://allowed.com")
+        assert not policy.is_allowed("https://notallowed.com")
+        assert not policy.is_allowed("http://www.allowed.com")
+
+    @pytest.mark.unit
+    def test_invalid_origin(self) -> None:
+        with pytest.raises(ValueError):
+            normalize_origin("allowed.com")
+        with pytest.raises(ValueError):
+            normalize_origin("https://allowed.com/path")
+
+
+@pytest.mark.unit
+def test_add_vary_origin() -> None:
+    headers: Headers = []
+    add_vary_origin(headers)
+    assert headers == [(b"vary", b"Origin")]
+
+    headers = [(b"vary", b"Accept-Encoding")]
+    add_vary_origin(headers)
+    assert headers == [(b"vary", b"Accept-Encoding, Origin")]
+
+    # Not duplicated, e.g., for prescriptions, which always vary on it
+    headers = [(b"vary", b"Accept-Encoding, origin")]
+    add_vary_origin(headers)
+    assert headers == [(b"vary", b"Accept-Encoding, origin")]
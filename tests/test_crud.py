@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
+from uuid import UUID
+
+import pytest
+from ata_db_models.models import Group, UserGroup
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from ata_api.crud import (
+    PrescriptionResult,
+    get_or_create_prescription,
+    get_or_create_prescription_async,
+    get_or_create_prescriptions_async,
+    read_prescription,
+    read_prescription_async,
+)
+from ata_api.db import get_async_conn_string, get_session_factory
+from ata_api.site import SiteName
+
+SITE_NAME = SiteName.AFRO_LA
+USER_ID = UUID("3800ac11781a4cf2a6759bbaa9c0729b")
+
+
+class TestGetOrCreatePrescription:
+    @pytest.mark.integration
+    def test_creates_then_reads(self, create_and_drop_tables: Generator[None, None, None]) -> None:
+        with get_session_factory()() as session:
+            created = get_or_create_prescription(session, SITE_NAME, USER_ID, Group.A)
+        with get_session_factory()() as session:
+            read = get_or_create_prescription(session, SITE_NAME, USER_ID, Group.B)
+
+        assert created.created is True
+        assert created.usergroup.group == Group.A
+        # The existing assignment wins over the one passed in
+        assert read.created is False
+        assert read.usergroup.group == Group.A
+
+    @pytest.mark.integration
+    def test_concurrent_calls(self, create_and_drop_tables: Generator[None, None, None]) -> None:
+        """
+        Concurrent calls for the same user should neither fail nor create duplicates, and should all
+        return the same assignment.
+        """
+        groups = [Group.A, Group.B, Group.C] * 4
+
+        def call(group: Group) -> PrescriptionResult:
+            with get_session_factory()() as session:
+                return get_or_create_prescription(session, SITE_NAME, USER_ID, group)
+
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            results = list(executor.map(call, groups))
+
+        assert sum(result.created for result in results) == 1
+        assert len({result.usergroup.group for result in results}) == 1
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 1
+
+    @pytest.mark.integration
+    def test_read_then_create(self, create_and_drop_tables: Generator[None, None, None]) -> None:
+        """
+        A prescription created on a session that already ran a query should be persisted once the session closes.
+        """
+        with get_session_factory()() as session:
+            assert read_prescription(session, SITE_NAME, USER_ID) is None
+            result = get_or_create_prescription(session, SITE_NAME, USER_ID, Group.A)
+
+        assert result.created is True
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 1
+
+    @pytest.mark.integration
+    def test_read_then_create_async(self, create_and_drop_tables: Generator[None, None, None]) -> None:
+        async def run() -> list[PrescriptionResult]:
+            engine = create_async_engine(get_async_conn_string())
+            try:
+                async with AsyncSession(engine) as session:
+                    assert await read_prescription_async(session, SITE_NAME, USER_ID) is None
+                    result = await get_or_create_prescription_async(session, SITE_NAME, USER_ID, Group.A)
+                async with AsyncSession(engine) as session:
+                    assert await read_prescription_async(session, SiteName.THE_19TH, USER_ID) is None
+                    results = await get_or_create_prescriptions_async(session, [(SiteName.THE_19TH, USER_ID, Group.B)])
+                return [result, *results]
+            finally:
+                await engine.dispose()
+
+        assert [result.created for result in asyncio.run(run())] == [True, True]
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 2
@@ -0,0 +1,70 @@
+import caseconverter
+import pytest
+from ata_db_models.helpers import Stage as DBStage
+from pydantic import BaseModel, ValidationError
+
+from ata_api.assignment import AssignmentStrategy, PersistenceMode
+from ata_api.bulk import BulkFormat
+from ata_api.helpers.enum import StrEnum, StrEnumKebab, StrEnumPascal, StrEnumSnake
+from ata_api.monitoring.metrics import CloudWatchMetric, CloudWatchMetricDimension
+from ata_api.pool import DBPoolClass
+from ata_api.replicas import ReplicaSelection
+from ata_api.settings import Settings, Stage
+from ata_api.site import SiteName
+
+ENUMS: list[type[StrEnum]] = [
+    AssignmentStrategy,
+    BulkFormat,
+    CloudWatchMetric,
+    CloudWatchMetricDimension,
+    DBPoolClass,
+    PersistenceMode,
+    ReplicaSelection,
+    SiteName,
+    Stage,
+]
+
+
+class SiteModel(BaseModel):
+    site_name: SiteName
+
+
+class TestStrEnum:
+    @pytest.mark.unit
+    @pytest.mark.parametrize("enum", ENUMS)
+    def test_values_match_caseconverter(self, enum: type[StrEnum]) -> None:
+        # Values used to be generated by caseconverter, which is now only a dev dependency
+        convert = {
+            StrEnumKebab: caseconverter.kebabcase,
+            StrEnumPascal: caseconverter.pascalcase,
+            StrEnumSnake: caseconverter.snakecase,
+        }[next(base for base in enum.__bases__ if issubclass(base, StrEnum))]
+        for member in enum:
+            assert member.value == convert(member.name)
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("enum", ENUMS)
+    def test_parse(self, enum: type[StrEnum]) -> None:
+        for member in enum:
+            assert enum.parse(member.value) is member
+            assert enum.parse(member) is member
+
+    @pytest.mark.unit
+    def test_validate(self) -> None:
+        assert SiteModel.parse_obj({"site_name": "afro-la"}).site_name is SiteName.AFRO_LA
+        for value in ["AFRO_LA", "nope", ["afro-la"]]:
+            with pytest.raises(ValidationError, match="type_error.enum"):
+                SiteModel.parse_obj({"site_name": value})
+
+    @pytest.mark.unit
+    def test_schema(self) -> None:
+        schema = SiteModel.schema()
+        assert schema["definitions"]["SiteName"]["enum"] == [member.value for member in SiteName]
+
+
+@pytest.mark.unit
+def test_stage() -> None:
+    assert [member.value for member in Stage] == [member.value for member in DBStage]
+    assert Settings.parse_obj({"stage": "prod"}).stage is Stage.PROD
+    with pytest.raises(ValidationError, match="type_error.enum"):
+        Settings.parse_obj({"stage": "staging"})
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Optional
+
+import pytest
+from aws_lambda_powertools.metrics import MetricUnit
+
+from ata_api.monitoring.instrumentation import instrument
+from ata_api.monitoring.logging import logger
+from ata_api.monitoring.metrics import Dimensions, metric_aggregator
+from benchmarks.instrumentation import (
+    log_cloudwatch_metric,
+    log_cloudwatch_metric_per_item,
+    raise_exception,
+)
+
+
+def get_group(item: tuple[str, str]) -> str:
+    return item[1]
+
+
+DIMENSIONS: dict[str, Any] = {"site_name": lambda output: output[0], "group": lambda output: output[1], "env": "test"}
+
+
+@pytest.fixture
+def added(monkeypatch: pytest.MonkeyPatch) -> list[tuple[Any, ...]]:
+    """
+    Fixture responsible for recording the metrics added, instead of buffering them.
+    """
+    added: list[tuple[Any, ...]] = []
+
+    def add(name: str, unit: MetricUnit, value: float, dimensions: Dimensions = ()) -> None:
+        added.append((name, unit, value, dimensions))
+
+    monkeypatch.setattr(metric_aggregator, "add", add)
+    return added
+
+
+class TestInstrument:
+    @pytest.mark.unit
+    def test_same_metrics_as_stack(self, added: list[tuple[Any, ...]]) -> None:
+        """
+        The composed decorator should log the same metrics as the stack of decorators it replaced.
+        """
+        exception = ValueError("Failed")
+
+        @log_cloudwatch_metric(name="Read", value=1, unit=MetricUnit.Count, dimensions=DIMENSIONS)
+        @raise_exception(exception=exception, logger=logger)
+        async def stacked(output: Optional[tuple[str, str]]) -> Optional[tuple[str, str]]:
+            return output
+
+        @instrument(name="Read", value=1, unit=MetricUnit.Count, dimensions=DIMENSIONS, exception=exception)
+        async def composed(output: Optional[tuple[str, str]]) -> Optional[tuple[str, str]]:
+            return output
+
+        for func in (stacked, composed):
+            assert asyncio.run(func(("afro-la", "A"))) == ("afro-la", "A")
+            assert asyncio.run(func(None)) is None
+        assert len(added) == 2
+        assert added[0] == added[1]
+
+    @pytest.mark.unit
+    def test_per_item(self, added: list[tuple[Any, ...]]) -> None:
+        exception = ValueError("Failed")
+
+        @log_cloudwatch_metric_per_item(name=get_group, value=1, unit=MetricUnit.Count, dimensions={})
+        def stacked(output: list[tuple[str, str]]) -> list[tuple[str, str]]:
+            return output
+
+        @instrument(name=get_group, value=1, unit=MetricUnit.Count, dimensions={}, exception=exception, per_item=True)
+        def composed(output: list[tuple[str, str]]) -> list[tuple[str, str]]:
+            return output
+
+        for func in (stacked, composed):
+            func([("afro-la", "A"), ("the-19th", "B")])
+        assert added[:2] == added[2:]
+        assert [args[0] for args in added[2:]] == ["A", "B"]
+
+    @pytest.mark.unit
+    def test_exception(self, added: list[tuple[Any, ...]]) -> None:
+        exception = ValueError("Failed")
+
+        @instrument(name="Read", value=1, unit=MetricUnit.Count, dimensions=DIMENSIONS, exception=exception)
+        async def fail() -> None:
+            raise KeyError("Internal")
+
+        try:
+            asyncio.run(fail())
+        except ValueError as raised:
+            assert raised is exception
+            assert isinstance(raised.__cause__, KeyError)
+        else:
+            pytest.fail("Expected the given exception")
+        assert added == []
@@ -0,0 +1,31 @@
+import logging
+
+import pytest
+
+from ata_api.monitoring.logging import debug_sampled, log_debug, logger
+
+
+class Unformattable:
+    def __str__(self) -> str:
+        raise AssertionError("Formatted a message that isn't emitted")
+
+
+class TestLogDebug:
+    @pytest.mark.unit
+    def test_not_emitted(self, caplog: pytest.LogCaptureFixture) -> None:
+        assert logger.log_level > logging.DEBUG
+        log_debug("Not emitted: %s", Unformattable())
+        assert caplog.records == []
+
+    @pytest.mark.unit
+    def test_sampled(self, caplog: pytest.LogCaptureFixture) -> None:
+        token = debug_sampled.set(True)
+        try:
+            log_debug("Emitted for %s", "sampled requests")
+        finally:
+            debug_sampled.reset(token)
+
+        [record] = caplog.records
+        assert record.levelno == logging.DEBUG
+        assert record.getMessage() == "Emitted for sampled requests"
+        assert record.funcName == "test_sampled"
@@ -1,22 +1,69 @@
-from collections.abc import Callable
+import asyncio
+import atexit
+import json
+from collections import Counter
+from collections.abc import Awaitable, Callable
 from contextlib import contextmanager
+from functools import lru_cache
 from typing import Any, Generator, Tuple
 from uuid import UUID
 
 import pytest
 from ata_db_models.models import Group, SQLModel, UserGroup
+from aws_lambda_powertools.metrics import MetricUnit
 from fastapi import status
 from fastapi.testclient import TestClient
+from mangum.protocols import LifespanCycle
 from pydantic import HttpUrl
-
-from ata_api.db import engine, session_factory
-from ata_api.main import app
-from ata_api.settings import Settings, get_settings
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import Session, create_engine
+
+from ata_api import db, main, write_behind
+from ata_api.assignment import (
+    AssignmentConfig,
+    AssignmentStrategy,
+    CompiledAssignment,
+    PersistenceMode,
+    WeightTable,
+    hash_group,
+)
+from ata_api.cors import CORSPolicy
+from ata_api.db import (
+    get_async_conn_string,
+    get_engine,
+    get_read_engine,
+    get_session_factory,
+)
+from ata_api.main import GroupLookup, app, handler, look_up_group, prescription_lookups
+from ata_api.monitoring.metrics import (
+    CloudWatchMetric,
+    CloudWatchMetricDimension,
+    metric_aggregator,
+    metrics,
+)
+from ata_api.settings import Settings, get_settings, settings
 from ata_api.site import SiteName
+from ata_api.stats import assignment_counts
+from ata_api.write_behind import write_behind_queue
+from benchmarks.lambda_events import FakeLambdaContext, api_gateway_event, warmer_event
 
 client = TestClient(app)
 
 
+@pytest.fixture(scope="module", autouse=True)
+def run_app() -> Generator[None, None, None]:
+    """
+    Fixture responsible for running the app, lifespan included, on a single event loop for all tests,
+    as a deployed container would. Otherwise, TestClient starts a new event loop per request, which
+    pooled async DB connections can't be shared across.
+    """
+    with client:
+        yield
+
+
 @contextmanager
 def override_dependencies(override_dict: dict[Callable[..., Any], Callable[..., Any]]) -> Generator[None, None, None]:
     """
@@ -29,22 +76,21 @@ def override_dependencies(override_dict: dict[Callable[..., Any], Callable[...,
         app.dependency_overrides = {}
 
 
-@pytest.fixture(scope="function")
-def create_and_drop_tables() -> Generator[None, None, None]:
+@contextmanager
+def override_cors_policy(policy: CORSPolicy) -> Generator[None, None, None]:
     """
-    Fixture responsible for creating tables before and dropping tables after
-    every test, ensuring a clean slate. (See: https://docs.pytest.org/en/6.2.x/fixture.html#:~:text=%E2%80%9CYield%E2%80%9D%20fixtures%20yield%20instead%20of,is%20swapped%20out%20for%20yield%20.)
-
-    If using a dedicated test DB instead of localhost, try the https://dev.to/jbrocher/fastapi-testing-a-database-5ao5 approach,
-    which right now is overkill.
+    Fixture responsible for overriding the CORS policy for the duration of a test.
     """
-    SQLModel.metadata.create_all(engine)
-    yield
-    SQLModel.metadata.drop_all(engine)
+    original_policy = app.state.cors_policy
+    try:
+        app.state.cors_policy = policy
+        yield
+    finally:
+        app.state.cors_policy = original_policy
 
 
 def _test_cors_origin_allowed(endpoint: str, origin_allowed: HttpUrl) -> None:
-    with override_dependencies({get_settings: lambda: Settings(cors_allowed_origins={origin_allowed})}):
+    with override_cors_policy(CORSPolicy({origin_allowed})):
         response = client.get(endpoint, headers={"Origin": origin_allowed})
         assert response.status_code == status.HTTP_200_OK
         assert response.headers["access-control-allow-origin"] == origin_allowed
@@ -52,13 +98,64 @@ def _test_cors_origin_allowed(endpoint: str, origin_allowed: HttpUrl) -> None:
 
 
 def _test_cors_origin_denied(endpoint: str, origin_allowed: HttpUrl, origin_denied: HttpUrl) -> None:
-    with override_dependencies({get_settings: lambda: Settings(cors_allowed_origins={origin_allowed})}):
+    with override_cors_policy(CORSPolicy({origin_allowed})):
         response = client.get(endpoint, headers={"Origin": origin_denied})
         assert response.status_code == status.HTTP_200_OK
         assert "access-control-allow-origin" not in response.headers
         assert "vary" not in response.headers or "Origin" not in response.headers["vary"]
 
 
+@pytest.fixture
+def replica_sync_engine(create_and_drop_tables: Generator[None, None, None]) -> Generator[Engine, None, None]:
+    """
+    Fixture responsible for creating a DB, on the same server, to stand in for a read replica. It starts empty, as
+    a replica that lags behind the primary would.
+    """
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("CREATE DATABASE replica"))
+    engine = create_engine(make_url(get_engine().url).set(database="replica"))
+    SQLModel.metadata.create_all(engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("DROP DATABASE replica"))
+
+
+@pytest.fixture
+def replica_engine(replica_sync_engine: Engine) -> Generator[AsyncEngine, None, None]:
+    engine = create_async_engine(make_url(get_async_conn_string()).set(database="replica"))
+    yield engine
+    # Connections are attached to the app's event loop
+    assert client.portal is not None
+    client.portal.call(engine.dispose)
+
+
+@contextmanager
+def override_read_session(engine: AsyncEngine) -> Generator[None, None, None]:
+    """
+    Fixture responsible for routing reads to the engine for the duration of a test.
+    """
+
+    with override_dependencies({get_read_engine: lambda: engine}):
+        yield
+
+
+@contextmanager
+def unreachable_replica() -> Generator[None, None, None]:
+    """
+    Fixture responsible for routing reads to a replica that can't be connected to, for the duration of a test.
+    """
+    engine = create_async_engine(make_url(get_async_conn_string()).set(database="missing_replica"))
+    try:
+        with override_read_session(engine):
+            yield
+    finally:
+        assert client.portal is not None
+        client.portal.call(engine.dispose)
+
+
 @pytest.fixture(scope="module")
 def origin_allowed() -> HttpUrl:
     return "https://allowed.com"  # type: ignore
@@ -88,6 +185,41 @@ class TestRoot:
     def test_cors_origin_denied(self, endpoint: str, origin_allowed: HttpUrl, origin_denied: HttpUrl) -> None:
         _test_cors_origin_denied(endpoint, origin_allowed, origin_denied)
 
+    @pytest.mark.unit
+    def test_cors_preflight(self, endpoint: str, origin_allowed: HttpUrl, origin_denied: HttpUrl) -> None:
+        with override_cors_policy(CORSPolicy({origin_allowed}, max_age=60)):
+            response = client.options(
+                endpoint, headers={"Origin": origin_allowed, "Access-Control-Request-Method": "GET"}
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response.headers["access-control-allow-origin"] == origin_allowed
+            assert response.headers["access-control-max-age"] == "60"
+
+            response = client.options(
+                endpoint, headers={"Origin": origin_denied, "Access-Control-Request-Method": "GET"}
+            )
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert "access-control-allow-origin" not in response.headers
+
+
+class TestHealth:
+    @pytest.mark.unit
+    def test_live(self) -> None:
+        response = client.get("/health/live")
+        assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.unit
+    def test_ready(self) -> None:
+        response = client.get("/health/ready")
+        assert response.status_code == status.HTTP_200_OK
+
+        app.state.ready = False
+        try:
+            response = client.get("/health/ready")
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        finally:
+            app.state.ready = True
+
 
 class TestPrescription:
     @pytest.fixture(scope="class")
@@ -128,10 +260,84 @@ class TestPrescription:
         assert data["group"] in {*Group}  # A, B or C
 
         # Check user is written to table
-        with session_factory() as session:
+        with get_session_factory()() as session:
             count = session.query(UserGroup).count()
             assert count == 1
 
+    @pytest.mark.integration
+    def test_server_timing(
+        self,
+        endpoint: str,
+        monkeypatch: pytest.MonkeyPatch,
+        create_and_drop_tables: Generator[None, None, None],
+    ) -> None:
+        """
+        Requests sampled for timing should report the duration of each stage.
+        """
+        monkeypatch.setattr(settings, "request_timing_sample_rate", 1)
+        response = client.get(endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        stages = [timing.split(";")[0] for timing in response.headers["Server-Timing"].split(", ")]
+        assert stages == ["cache", "db", "total"]
+
+        monkeypatch.setattr(settings, "request_timing_sample_rate", 0)
+        response = client.get(endpoint)
+        assert "Server-Timing" not in response.headers
+
+    @pytest.mark.integration
+    def test_etag(
+        self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        Clients that already have the prescription should get a 304 without a body, with the configured caching.
+        """
+        cache_control = "public, max-age=60, s-maxage=3600"
+        with override_dependencies(
+            {get_settings: lambda: Settings(site_cache_control={SiteName(user[0]): cache_control})}
+        ):
+            response = client.get(endpoint)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.headers["cache-control"] == cache_control
+            # Even without an Origin
+            assert response.headers["vary"] == "Origin"
+            etag = response.headers["etag"]
+
+            response = client.get(endpoint, headers={"If-None-Match": f'"other", {etag}'})
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response.content == b""
+            assert response.headers["etag"] == etag
+            assert response.headers["cache-control"] == cache_control
+
+            response = client.get(endpoint, headers={"If-None-Match": '"other"'})
+            assert response.status_code == status.HTTP_200_OK
+
+    @pytest.mark.integration
+    def test_cache_hit_metrics(
+        self,
+        user: Tuple[str, str],
+        endpoint: str,
+        monkeypatch: pytest.MonkeyPatch,
+        create_and_drop_tables: Generator[None, None, None],
+    ) -> None:
+        """
+        Prescriptions served from the cache should still count as reads.
+        """
+        group = client.get(endpoint).json()["group"]
+        added: list[tuple[Any, ...]] = []
+        monkeypatch.setattr(metric_aggregator, "add", lambda *args: added.append(args))
+
+        assert client.get(endpoint).status_code == status.HTTP_200_OK
+        response = client.post(
+            "/prescriptions:batch", json={"prescriptions": [{"site_name": user[0], "user_id": user[1]}]}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        dimensions = (
+            *metrics.default_dimensions.items(),
+            (CloudWatchMetricDimension.SITE_NAME, user[0]),
+            (CloudWatchMetricDimension.GROUP, group),
+        )
+        assert added == [(CloudWatchMetric.PRESCRIPTIONS_READ, MetricUnit.Count, 1, dimensions)] * 2
+
     @pytest.mark.integration
     def test_user_exists(
         self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
@@ -141,7 +347,7 @@ class TestPrescription:
         simply be returned.
         """
         # First, write user to DB
-        with session_factory() as session:
+        with get_session_factory()() as session:
             usergroup = UserGroup(site_name=user[0], user_id=user[1], group=Group.A)
             session.add(usergroup)
             session.commit()
@@ -161,6 +367,208 @@ class TestPrescription:
         assert UUID(data["user_id"]) == UUID(user[1])
         assert data["group"] in {*Group}  # A, B or C
 
+    @pytest.mark.integration
+    def test_hash_assignment_not_persisted(
+        self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        With hash-based assignment and no persistence, new users should be served without writing to the DB.
+        """
+        config = AssignmentConfig(
+            strategy=AssignmentStrategy.HASH,
+            salt="salt",
+            persistence=PersistenceMode.NONE,
+            weights={Group.A: 1, Group.B: 1, Group.C: 1},
+        )
+        unpersisted = assignment_counts.unpersisted.copy()
+        with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName(user[0]): config})}):
+            response = client.get(endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        group = response.json()["group"]
+        assert group == hash_group(SiteName(user[0]), UUID(user[1]), "salt", WeightTable([1, 1, 1]))
+        # Still counted
+        assert assignment_counts.unpersisted - unpersisted == Counter({(user[0], group): 1})
+
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 0
+
+    @pytest.mark.integration
+    def test_read_from_replica(
+        self, user: Tuple[str, str], endpoint: str, replica_sync_engine: Engine, replica_engine: AsyncEngine
+    ) -> None:
+        """
+        Prescriptions should be read from a replica, without touching the primary.
+        """
+        with Session(replica_sync_engine) as session:
+            session.add(UserGroup(site_name=user[0], user_id=UUID(user[1]), group=Group.C))
+            session.commit()
+
+        with override_read_session(replica_engine):
+            response = client.get(endpoint)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["group"] == Group.C
+
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 0
+
+    @pytest.mark.integration
+    def test_read_your_writes(self, user: Tuple[str, str], endpoint: str, replica_engine: AsyncEngine) -> None:
+        """
+        If the replica lags behind, the existing prescription should be read from the primary.
+        """
+        with get_session_factory()() as session:
+            session.add(UserGroup(site_name=user[0], user_id=UUID(user[1]), group=Group.B))
+            session.commit()
+
+        with override_read_session(replica_engine):
+            response = client.get(endpoint, params={"wa": 1, "wb": 0, "wc": 0})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["group"] == Group.B
+
+    @pytest.mark.integration
+    def test_replica_down(
+        self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        If the replica can't be read, the prescription should be read from, and created on, the primary.
+        """
+        with unreachable_replica():
+            response = client.get(endpoint, params={"wa": 0, "wb": 1, "wc": 0})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["group"] == Group.B
+
+        with get_session_factory()() as session:
+            assert [usergroup.group for usergroup in session.query(UserGroup)] == [Group.B]
+
+    @pytest.mark.integration
+    def test_lookup_outlives_cancelled_request(
+        self, user: Tuple[str, str], create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        A lookup shared by concurrent requests should complete for the others if the first one is cancelled.
+        """
+        key = (SiteName(user[0]), UUID(user[1]))
+        assignment = CompiledAssignment(AssignmentConfig(weights={Group.C: 1}))
+
+        async def run() -> Group:
+            def look_up() -> Awaitable[GroupLookup]:
+                return look_up_group(None, assignment, *key, (1, 1, 1))
+
+            first = asyncio.create_task(prescription_lookups.run(key, look_up))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(prescription_lookups.run(key, look_up))
+            await asyncio.sleep(0)
+            first.cancel()
+            return (await second).group
+
+        # On the app's event loop, which DB connections are attached to
+        assert client.portal is not None
+        assert client.portal.call(run) == Group.C
+        with get_session_factory()() as session:
+            assert [usergroup.group for usergroup in session.query(UserGroup)] == [Group.C]
+
+    @pytest.mark.integration
+    def test_site_weights(
+        self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        Weights configured for a site should override the weights requests send.
+        """
+        config = AssignmentConfig(weights={Group.B: 1})
+        with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName(user[0]): config})}):
+            response = client.get(endpoint, params={"wa": 1, "wb": 0, "wc": 0})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["group"] == Group.B
+
+    @pytest.mark.integration
+    def test_write_behind(
+        self, user: Tuple[str, str], endpoint: str, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        With write-behind persistence, new users should be served before their prescription is persisted, and
+        keep their group once it is.
+        """
+        config = AssignmentConfig(persistence=PersistenceMode.WRITE_BEHIND)
+        with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName(user[0]): config})}):
+            response = client.get(endpoint)
+            assert response.status_code == status.HTTP_200_OK
+            group = response.json()["group"]
+            assert write_behind_queue.get((SiteName(user[0]), UUID(user[1]))) == group
+
+            with get_session_factory()() as session:
+                assert session.query(UserGroup).count() == 0
+
+            # Flush on the app's event loop, which DB connections are attached to
+            assert client.portal is not None
+            client.portal.call(write_behind_queue.flush)
+
+        assert len(write_behind_queue) == 0
+        with get_session_factory()() as session:
+            assert [usergroup.group for usergroup in session.query(UserGroup)] == [group]
+
+    @pytest.mark.integration
+    def test_write_behind_full(
+        self,
+        user: Tuple[str, str],
+        endpoint: str,
+        create_and_drop_tables: Generator[None, None, None],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        When the write-behind queue is full, the prescription should be persisted before responding, on the same
+        session the existing prescription was looked up on.
+        """
+        # As if write_behind_max_size were 0: the queue was built from settings on import
+        monkeypatch.setattr(write_behind_queue, "max_size", 0)
+        config = AssignmentConfig(persistence=PersistenceMode.WRITE_BEHIND)
+        with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName(user[0]): config})}):
+            response = client.get(endpoint)
+            assert response.status_code == status.HTTP_200_OK
+            group = response.json()["group"]
+
+        assert len(write_behind_queue) == 0
+        with get_session_factory()() as session:
+            assert [usergroup.group for usergroup in session.query(UserGroup)] == [group]
+
+    @pytest.mark.integration
+    def test_write_behind_full_single_connection(
+        self,
+        user: Tuple[str, str],
+        endpoint: str,
+        create_and_drop_tables: Generator[None, None, None],
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """
+        With a single connection, as in Lambda, flushing a full write-behind queue shouldn't wait on the connection
+        the existing prescription was looked up on.
+        """
+        engine = create_async_engine(get_async_conn_string(), pool_size=1, max_overflow=0, pool_timeout=1)
+        session_factory = sessionmaker(expire_on_commit=False, bind=engine, class_=AsyncSession)
+        monkeypatch.setattr(db, "get_async_session_factory", lambda: session_factory)
+        monkeypatch.setattr(write_behind, "get_async_session_factory", lambda: session_factory)
+        monkeypatch.setattr(write_behind_queue, "max_size", 1)
+        queued_key = (SiteName(user[0]), UUID(int=1))
+        write_behind_queue.pending[queued_key] = Group.A
+        config = AssignmentConfig(persistence=PersistenceMode.WRITE_BEHIND)
+        try:
+            with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName(user[0]): config})}):
+                response = client.get(endpoint)
+                assert response.status_code == status.HTTP_200_OK
+                group = response.json()["group"]
+
+            # The queued prescription was persisted by the flush, rather than put back after the pool timed out
+            assert write_behind_queue.get(queued_key) is None
+            assert write_behind_queue.get((SiteName(user[0]), UUID(user[1]))) == group
+            assert client.portal is not None
+            client.portal.call(write_behind_queue.flush)
+        finally:
+            assert client.portal is not None
+            client.portal.call(engine.dispose)
+
+        with get_session_factory()() as session:
+            groups = {usergroup.user_id: usergroup.group for usergroup in session.query(UserGroup)}
+        assert groups == {UUID(int=1): Group.A, UUID(user[1]): group}
+
     @pytest.mark.integration
     def test_cors_origin_allowed(
         self, endpoint: str, origin_allowed: HttpUrl, create_and_drop_tables: Generator[None, None, None]
@@ -176,3 +584,259 @@ class TestPrescription:
         create_and_drop_tables: Generator[None, None, None],
     ) -> None:
         _test_cors_origin_denied(endpoint, origin_allowed, origin_denied)
+
+
+class TestBatchPrescriptions:
+    @pytest.fixture(scope="class")
+    def endpoint(self) -> str:
+        return "/prescriptions:batch"
+
+    @pytest.mark.unit
+    def test_empty_batch(self, endpoint: str) -> None:
+        response = client.post(endpoint, json={"prescriptions": []})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @pytest.mark.integration
+    def test_batch(self, endpoint: str, create_and_drop_tables: Generator[None, None, None]) -> None:
+        """
+        Existing users should be returned and missing ones created, in the order requested.
+        """
+        existing = (SiteName.AFRO_LA, UUID("3800ac11781a4cf2a6759bbaa9c0729b"))
+        missing = (SiteName.THE_19TH, UUID("3800ac11781a4cf2a6759bbaa9c0729b"))
+        with get_session_factory()() as session:
+            session.add(UserGroup(site_name=existing[0], user_id=existing[1], group=Group.A))
+            session.commit()
+
+        # Weights force the missing user into group C; the existing user's group shouldn't change
+        requested = [missing, existing, missing]
+        response = client.post(
+            endpoint,
+            json={
+                "prescriptions": [
+                    {"site_name": site_name, "user_id": str(user_id), "wa": 0, "wb": 0, "wc": 1}
+                    for site_name, user_id in requested
+                ]
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        data = response.json()["prescriptions"]
+        assert [(item["site_name"], UUID(item["user_id"])) for item in data] == requested
+        assert [item["group"] for item in data] == [Group.C, Group.A, Group.C]
+
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 2
+
+    @pytest.mark.integration
+    def test_batch_replica_down(self, endpoint: str, create_and_drop_tables: Generator[None, None, None]) -> None:
+        """
+        If the replica can't be read, existing prescriptions should be read from the primary.
+        """
+        existing = (SiteName.AFRO_LA, UUID("3800ac11781a4cf2a6759bbaa9c0729b"))
+        with get_session_factory()() as session:
+            session.add(UserGroup(site_name=existing[0], user_id=existing[1], group=Group.A))
+            session.commit()
+
+        with unreachable_replica():
+            response = client.post(
+                endpoint,
+                json={"prescriptions": [{"site_name": existing[0], "user_id": str(existing[1]), "wa": 0, "wb": 1}]},
+            )
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["group"] for item in response.json()["prescriptions"]] == [Group.A]
+
+
+class TestBulkPrescriptions:
+    @pytest.fixture(scope="class")
+    def api_key(self) -> str:
+        return "key"
+
+    @pytest.fixture
+    def bulk_enabled(self, api_key: str) -> Generator[None, None, None]:
+        with override_dependencies({get_settings: lambda: Settings(bulk_api_key=api_key)}):
+            yield
+
+    @pytest.mark.unit
+    def test_disabled(self) -> None:
+        response = client.get(f"/prescriptions/{SiteName.AFRO_LA}/export")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.unit
+    def test_invalid_api_key(self, bulk_enabled: None) -> None:
+        response = client.get(f"/prescriptions/{SiteName.AFRO_LA}/export", headers={"X-API-Key": "wrong"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    @pytest.mark.integration
+    def test_import_then_export(
+        self, api_key: str, bulk_enabled: None, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        Imported prescriptions should be created unless they exist, and exported as they were imported.
+        """
+        user_ids = [UUID(int=i) for i in range(3)]
+        body = "user_id,group\n" + "".join(f"{user_id},B\n" for user_id in user_ids)
+        url = f"/prescriptions/{SiteName.AFRO_LA}/import?format=csv"
+        response = client.post(url, content=body, headers={"X-API-Key": api_key})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"created": 3}
+
+        response = client.post(url, content=body, headers={"X-API-Key": api_key})
+        assert response.json() == {"created": 0}
+
+        response = client.get(f"/prescriptions/{SiteName.AFRO_LA}/export", headers={"X-API-Key": api_key})
+        assert response.status_code == status.HTTP_200_OK
+        exported = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(UUID(row["user_id"]) for row in exported) == user_ids
+        assert {(row["site_name"], row["group"]) for row in exported} == {(SiteName.AFRO_LA, Group.B)}
+
+    @pytest.mark.integration
+    def test_import_invalid_row(
+        self, api_key: str, bulk_enabled: None, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        An invalid row should fail the whole import.
+        """
+        body = f'{{"user_id": "{UUID(int=1)}", "group": "A"}}\n{{"user_id": "{UUID(int=2)}", "group": "D"}}\n'
+        response = client.post(
+            f"/prescriptions/{SiteName.AFRO_LA}/import", content=body, headers={"X-API-Key": api_key}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"].startswith("Line 2")
+
+        with get_session_factory()() as session:
+            assert session.query(UserGroup).count() == 0
+
+
+class TestStats:
+    @pytest.fixture(scope="class")
+    def api_key(self) -> str:
+        return "key"
+
+    @pytest.fixture
+    def stats_enabled(self, api_key: str) -> Generator[None, None, None]:
+        with override_dependencies({get_settings: lambda: Settings(bulk_api_key=api_key)}):
+            yield
+
+    @pytest.mark.unit
+    def test_disabled(self) -> None:
+        response = client.get("/stats")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.integration
+    def test_stats(
+        self, api_key: str, stats_enabled: None, create_and_drop_tables: Generator[None, None, None]
+    ) -> None:
+        """
+        Prescriptions created here should be counted as they're created, and those created elsewhere once counts are
+        reconciled.
+        """
+        with get_session_factory()() as session:
+            session.add(UserGroup(site_name=SiteName.AFRO_LA, user_id=UUID(int=1), group=Group.A))
+            session.commit()
+
+        def get_counts() -> dict[str, dict[str, int]]:
+            response = client.get("/stats", headers={"X-API-Key": api_key})
+            assert response.status_code == status.HTTP_200_OK
+            return {
+                site["site_name"]: {group["group"]: group["count"] for group in site["groups"]}
+                for site in response.json()["sites"]
+            }
+
+        async def reconciled() -> None:
+            if assignment_counts.reconciliation is not None:
+                await assignment_counts.reconciliation
+
+        # Reconciled in the background
+        get_counts()
+        assert client.portal is not None
+        client.portal.call(reconciled)
+        assert get_counts()[SiteName.AFRO_LA] == {Group.A: 1, Group.B: 0, Group.C: 0}
+
+        # Created here
+        response = client.get(f"/prescription/{SiteName.AFRO_LA}/{UUID(int=2)}?wa=0&wb=0&wc=1")
+        assert response.json()["group"] == Group.C
+        # Created elsewhere
+        with get_session_factory()() as session:
+            session.add(UserGroup(site_name=SiteName.AFRO_LA, user_id=UUID(int=3), group=Group.B))
+            session.commit()
+        assert get_counts()[SiteName.AFRO_LA] == {Group.A: 1, Group.B: 0, Group.C: 1}
+
+        assignment_counts.invalidate()
+        get_counts()
+        client.portal.call(reconciled)
+        assert get_counts()[SiteName.AFRO_LA] == {Group.A: 1, Group.B: 1, Group.C: 1}
+
+
+class TestHandler:
+    @pytest.fixture
+    def container(self, monkeypatch: pytest.MonkeyPatch) -> Generator[list[LifespanCycle], None, None]:
+        """
+        Fixture responsible for running handler as a new Lambda container would: on an event loop of its own, with
+        engines of its own (those of the app's loop are kept for other tests), and with its lifespan shut down
+        afterwards. Yields the lifespan cycles started.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        monkeypatch.setattr(settings, "aws_lambda_function_name", "ata-api")
+        monkeypatch.setattr(metrics, "namespace", "test")
+        engine_factory = lru_cache(db.get_async_engine.__wrapped__)
+        session_factory = lru_cache(db.get_async_session_factory.__wrapped__)
+        monkeypatch.setattr(db, "get_async_engine", engine_factory)
+        for module in (db, main, write_behind):
+            monkeypatch.setattr(module, "get_async_session_factory", session_factory)
+        cycles: list[LifespanCycle] = []
+
+        def create_lifespan_cycle(*args: Any) -> LifespanCycle:
+            cycles.append(LifespanCycle(*args))
+            return cycles[-1]
+
+        monkeypatch.setattr(main, "LifespanCycle", create_lifespan_cycle)
+        monkeypatch.setattr(main, "lifespan_cycle", None)
+        ready = app.state.ready
+        try:
+            yield cycles
+        finally:
+            for cycle in cycles:
+                atexit.unregister(cycle.__exit__)
+                cycle.__exit__(None, None, None)
+            app.state.ready = ready
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    @pytest.mark.unit
+    def test_warmer_ping(self, container: list[LifespanCycle]) -> None:
+        """
+        Pings should return before the app's lifespan is started, without setting up the DB.
+        """
+        assert handler(warmer_event(), FakeLambdaContext()) is None
+        assert main.lifespan_cycle is None
+        assert db.get_async_engine.cache_info().currsize == 0
+
+    @pytest.mark.integration
+    def test_invocations(
+        self,
+        container: list[LifespanCycle],
+        monkeypatch: pytest.MonkeyPatch,
+        create_and_drop_tables: Generator[None, None, None],
+    ) -> None:
+        """
+        The lifespan should start once per container, the adapter be reused, and prescriptions queued during an
+        invocation be persisted by its end.
+        """
+        adapters = []
+        monkeypatch.setattr(main, "Mangum", lambda *args, **kwargs: adapters.append(args))
+        config = AssignmentConfig(persistence=PersistenceMode.WRITE_BEHIND)
+        with override_dependencies({get_settings: lambda: Settings(site_assignments={SiteName.AFRO_LA: config})}):
+            for user_id in [UUID(int=1), UUID(int=2)]:
+                response = handler(
+                    api_gateway_event(f"/prescription/{SiteName.AFRO_LA}/{user_id}"), FakeLambdaContext()
+                )
+                assert response["statusCode"] == status.HTTP_200_OK
+
+                assert len(write_behind_queue) == 0
+                with get_session_factory()() as session:
+                    assert user_id in {usergroup.user_id for usergroup in session.query(UserGroup)}
+
+        assert len(container) == 1
+        assert main.lifespan_cycle is container[0]
+        assert adapters == []
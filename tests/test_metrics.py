@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from aws_lambda_powertools.metrics import MetricUnit
+
+from ata_api.monitoring.metrics import MetricAggregator
+
+
+class TestMetricAggregator:
+    @pytest.mark.unit
+    def test_flush(self, capsys: pytest.CaptureFixture[str]) -> None:
+        """
+        Metrics should be summed by name and dimensions, and logged as one EMF document per set of dimensions.
+        """
+        aggregator = MetricAggregator(namespace="test", service="ata-api")
+        for _ in range(3):
+            aggregator.add("Read", MetricUnit.Count, 1, dimensions=(("site_name", "afro-la"),))
+        aggregator.add("Created", MetricUnit.Count, 1, dimensions=(("site_name", "afro-la"),))
+        aggregator.add("Read", MetricUnit.Count, 1, dimensions=(("site_name", "the-19th"),))
+        aggregator.flush()
+
+        documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert len(documents) == 2
+        afro_la = next(document for document in documents if document["site_name"] == "afro-la")
+        assert afro_la["Read"] == 3
+        assert afro_la["Created"] == 1
+        assert afro_la["service"] == "ata-api"
+        assert afro_la["_aws"]["CloudWatchMetrics"] == [
+            {
+                "Namespace": "test",
+                "Dimensions": [["site_name", "service"]],
+                "Metrics": [{"Name": "Read", "Unit": "Count"}, {"Name": "Created", "Unit": "Count"}],
+            }
+        ]
+
+        # Flushing empties the buffer
+        aggregator.flush()
+        assert capsys.readouterr().out == ""
+
+    @pytest.mark.unit
+    def test_flush_callback(self, capsys: pytest.CaptureFixture[str]) -> None:
+        """
+        Flush callbacks should be able to add metrics to the flush they're called on.
+        """
+        aggregator = MetricAggregator(namespace="test")
+        aggregator.add_flush_callback(lambda: aggregator.add("CheckedOut", MetricUnit.Count, 2))
+        aggregator.flush()
+
+        documents = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [document["CheckedOut"] for document in documents] == [2]
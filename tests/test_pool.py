@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from ata_api.pool import (
+    DBPoolClass,
+    PoolStats,
+    TimedPool,
+    pool_stats,
+    resolve_pool_class,
+)
+
+
+class TestResolvePoolClass:
+    @pytest.mark.unit
+    def test_auto(self) -> None:
+        assert resolve_pool_class(DBPoolClass.AUTO, in_lambda=False, rds_proxy=True) == DBPoolClass.QUEUE
+        assert resolve_pool_class(DBPoolClass.AUTO, in_lambda=True, rds_proxy=False) == DBPoolClass.SINGLE
+        assert resolve_pool_class(DBPoolClass.AUTO, in_lambda=True, rds_proxy=True) == DBPoolClass.NULL
+
+    @pytest.mark.unit
+    def test_explicit(self) -> None:
+        assert resolve_pool_class(DBPoolClass.QUEUE, in_lambda=True, rds_proxy=True) == DBPoolClass.QUEUE
+
+
+class TestPoolStats:
+    @pytest.mark.unit
+    def test_reset(self) -> None:
+        stats = PoolStats()
+        stats.record_checkout(1.0, timed_out=False)
+        stats.record_checkout(3.0, timed_out=True)
+        stats.on_checkout()
+
+        assert stats.reset() == {
+            "checked_out": 1,
+            "checkouts": 2,
+            "wait_duration": 4.0,
+            "max_wait_duration": 3.0,
+            "timeouts": 1,
+        }
+        # Connections checked out are a point-in-time value, so they aren't reset
+        assert stats.snapshot()["checkouts"] == 0
+        assert stats.snapshot()["checked_out"] == 1
+
+
+class TimedSyncQueuePool(TimedPool, QueuePool):
+    """
+    Sync counterpart of TimedQueuePool, which can only wait for a connection on an event loop.
+    """
+
+
+class TestTimedPool:
+    @pytest.mark.unit
+    def test_records_checkouts_and_timeouts(self) -> None:
+        pool = TimedSyncQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.01)
+        event.listen(pool, "checkout", pool_stats.on_checkout)
+        event.listen(pool, "checkin", pool_stats.on_checkin)
+        pool_stats.reset()
+
+        connection = pool.connect()
+        assert pool_stats.snapshot()["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            pool.connect()
+        connection.close()
+
+        stats = pool_stats.reset()
+        assert stats["checked_out"] == 0
+        assert stats["checkouts"] == 2
+        assert stats["timeouts"] == 1
+        assert stats["max_wait_duration"] >= 10
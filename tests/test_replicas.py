@@ -0,0 +1,27 @@
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from ata_api.replicas import ReplicaSelection, ReplicaSet
+
+
+@pytest.fixture
+def replica_set() -> ReplicaSet:
+    # Engines don't connect until they're used
+    engines = [create_async_engine(f"postgresql+asyncpg://postgres@replica-{i}/postgres") for i in range(3)]
+    return ReplicaSet(engines)
+
+
+class TestReplicaSet:
+    @pytest.mark.unit
+    def test_round_robin(self, replica_set: ReplicaSet) -> None:
+        assert [replica_set.pick() for _ in range(6)] == replica_set.engines * 2
+
+    @pytest.mark.unit
+    def test_least_connections(self, replica_set: ReplicaSet) -> None:
+        replica_set.selection = ReplicaSelection.LEAST_CONNECTIONS
+        replica_set.checked_out = [2, 0, 1]
+        assert replica_set.pick() == replica_set.engines[1]
+
+        # Ties are broken in turn
+        replica_set.checked_out = [0, 0, 1]
+        assert {replica_set.pick() for _ in range(2)} == set(replica_set.engines[:2])
@@ -0,0 +1,39 @@
+from uuid import uuid4
+
+import pytest
+from ata_db_models.models import Group
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from ata_api.models import BatchPrescriptionResponse, PrescriptionResponse
+from ata_api.responses import ROOT_BODY, render_prescription, render_prescriptions
+from ata_api.site import SiteName
+
+
+class TestRender:
+    """
+    Precomputed responses should render the same bytes as FastAPI's default serialization.
+    """
+
+    @pytest.mark.unit
+    def test_prescription(self) -> None:
+        for site_name in SiteName:
+            for group in Group:
+                user_id = uuid4()
+                model = PrescriptionResponse(site_name=site_name, user_id=user_id, group=group)
+                assert render_prescription(site_name, user_id, group) == JSONResponse(jsonable_encoder(model)).body
+
+    @pytest.mark.unit
+    def test_prescriptions(self) -> None:
+        prescriptions = [(site_name, uuid4(), Group.B) for site_name in SiteName]
+        model = BatchPrescriptionResponse(
+            prescriptions=[
+                PrescriptionResponse(site_name=site_name, user_id=user_id, group=group)
+                for site_name, user_id, group in prescriptions
+            ]
+        )
+        assert render_prescriptions(prescriptions) == JSONResponse(jsonable_encoder(model)).body
+
+    @pytest.mark.unit
+    def test_root(self) -> None:
+        assert ROOT_BODY == JSONResponse({"message": "This is the root endpoint for the AtA API."}).body
@@ -0,0 +1,38 @@
+import asyncio
+import signal
+
+import pytest
+from uvicorn import Config
+
+from ata_api.app import app
+from ata_api.server import APP, DrainingServer
+
+
+class TestDrainingServer:
+    @pytest.mark.unit
+    def test_drains_on_sigterm(self) -> None:
+        """
+        SIGTERM should fail readiness checks right away, and only shut the server down after the drain delay.
+        """
+        server = DrainingServer(Config(APP), drain_delay=0.05)
+
+        async def run() -> None:
+            server.handle_exit(signal.SIGTERM, None)
+            assert server.draining
+            assert not app.state.ready
+            assert not server.should_exit
+            await asyncio.sleep(0.1)
+            assert server.should_exit
+
+        ready = app.state.ready
+        try:
+            asyncio.run(run())
+        finally:
+            app.state.ready = ready
+
+    @pytest.mark.unit
+    def test_sigint_skips_drain(self) -> None:
+        server = DrainingServer(Config(APP), drain_delay=60)
+        server.handle_exit(signal.SIGINT, None)
+        assert not server.draining
+        assert server.should_exit
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from ata_api.helpers.single_flight import SingleFlight
+
+
+class TestSingleFlight:
+    @pytest.mark.unit
+    def test_coalesces_concurrent_calls(self) -> None:
+        flights: SingleFlight[str, int] = SingleFlight()
+        calls = 0
+
+        async def call() -> int:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return calls
+
+        async def run() -> list[int]:
+            return await asyncio.gather(*(flights.run("key", call) for _ in range(5)))
+
+        assert asyncio.run(run()) == [1] * 5
+        assert calls == 1
+        assert flights.stats.coalesced == 4
+        # Completed calls are forgotten
+        assert len(flights) == 0
+        assert asyncio.run(flights.run("key", call)) == 2
+
+    @pytest.mark.unit
+    def test_shares_exceptions(self) -> None:
+        flights: SingleFlight[str, int] = SingleFlight()
+
+        async def call() -> int:
+            await asyncio.sleep(0.01)
+            raise ValueError("Failed")
+
+        async def run() -> list[object]:
+            return await asyncio.gather(*(flights.run("key", call) for _ in range(2)), return_exceptions=True)
+
+        assert [type(result) for result in asyncio.run(run())] == [ValueError, ValueError]
+        assert len(flights) == 0
+
+    @pytest.mark.unit
+    def test_timeout(self) -> None:
+        """
+        Callers that time out waiting on the call in flight should run their own.
+        """
+        flights: SingleFlight[str, str] = SingleFlight(timeout=0.01)
+
+        async def slow_call() -> str:
+            await asyncio.sleep(0.1)
+            return "slow"
+
+        async def fast_call() -> str:
+            return "fast"
+
+        async def run() -> list[str]:
+            slow = asyncio.ensure_future(flights.run("key", slow_call))
+            await asyncio.sleep(0)
+            return [await flights.run("key", fast_call), await slow]
+
+        assert asyncio.run(run()) == ["fast", "slow"]
+        assert flights.stats.timeouts == 1
+
+    @pytest.mark.unit
+    def test_cancelled_caller(self) -> None:
+        """
+        Cancelling the first caller shouldn't cancel the call for the others.
+        """
+        flights: SingleFlight[str, str] = SingleFlight()
+
+        async def call() -> str:
+            await asyncio.sleep(0.01)
+            return "done"
+
+        async def run() -> str:
+            first = asyncio.ensure_future(flights.run("key", call))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(flights.run("key", call))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(run()) == "done"
@@ -0,0 +1,167 @@
+import asyncio
+from collections import Counter
+from uuid import UUID
+
+import fakeredis
+import pytest
+from ata_db_models.models import Group
+from fakeredis.aioredis import FakeRedis
+
+from ata_api.assignment import GROUPS, AssignmentConfig, AssignmentRegistry
+from ata_api.site import SiteName
+from ata_api.stats import (
+    AssignmentCounts,
+    AssignmentKey,
+    RedisAssignmentCounts,
+    get_expected_ratios,
+    get_stats,
+)
+
+
+class TestAssignmentCounts:
+    @pytest.mark.unit
+    def test_reconcile(self) -> None:
+        counts = AssignmentCounts(reconcile_interval=60)
+        assert counts.stale
+        counts.add(SiteName.AFRO_LA, Group.A)
+        counts.add(SiteName.AFRO_LA, Group.A)
+
+        counts.reconcile(Counter({(SiteName.AFRO_LA, Group.A): 3, (SiteName.AFRO_LA, Group.B): 1}))
+        assert not counts.stale
+        assert counts.reconciled_at is not None
+        counts.add(SiteName.AFRO_LA, Group.B)
+        assert counts.counts == {(SiteName.AFRO_LA, Group.A): 3, (SiteName.AFRO_LA, Group.B): 2}
+
+        counts.invalidate()
+        assert counts.stale
+
+    @pytest.mark.unit
+    def test_refresh(self) -> None:
+        """
+        Refreshes should reconcile in the background, serving the last counts meanwhile, with a single count at a
+        time, and fresh counts shouldn't be counted again.
+        """
+        counts = AssignmentCounts(reconcile_interval=60)
+        calls = 0
+
+        async def count() -> Counter[AssignmentKey]:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return Counter({(SiteName.THE_19TH, Group.C): 5})
+
+        async def run() -> None:
+            await asyncio.gather(*(counts.refresh(count) for _ in range(3)))
+            assert counts.counts[(SiteName.THE_19TH, Group.C)] == 0
+            assert counts.reconciliation is not None
+            await counts.reconciliation
+            await counts.refresh(count)
+
+        asyncio.run(run())
+        assert calls == 1
+        assert counts.counts[(SiteName.THE_19TH, Group.C)] == 5
+
+    @pytest.mark.unit
+    def test_unpersisted(self) -> None:
+        """
+        Unpersisted assignments should be counted, and kept on reconciliation, which only counts prescriptions.
+        """
+        counts = AssignmentCounts()
+        counts.add(SiteName.AFRO_LA, Group.A)
+        counts.add_unpersisted(SiteName.AFRO_LA, Group.A, UUID(int=1))
+        counts.reconcile(Counter({(SiteName.AFRO_LA, Group.A): 2}))
+        assert counts.total((SiteName.AFRO_LA, Group.A)) == 3
+
+    @pytest.mark.unit
+    def test_shared(self) -> None:
+        """
+        Counts added by one container should be counted by another, and unpersisted assignments of the same user only
+        once.
+        """
+        server = fakeredis.FakeServer()
+        first, second = (
+            AssignmentCounts(reconcile_interval=60, shared=RedisAssignmentCounts(FakeRedis(server=server)))
+            for _ in range(2)
+        )
+        calls = 0
+
+        async def count() -> Counter[AssignmentKey]:
+            nonlocal calls
+            calls += 1
+            return Counter({(SiteName.AFRO_LA, Group.A): 2})
+
+        async def run() -> None:
+            await first.refresh(count)
+            assert first.reconciliation is not None
+            await first.reconciliation
+
+            first.add(SiteName.AFRO_LA, Group.B)
+            for counts in (first, second):
+                counts.add_unpersisted(SiteName.AFRO_LA, Group.C, UUID(int=1))
+                await counts.flush()
+            assert not first.needs_flush
+
+            # Already reconciled by the first
+            await second.refresh(count)
+            assert second.reconciliation is None
+
+        asyncio.run(run())
+        assert calls == 1
+        assert second.reconciled_at == first.reconciled_at
+        assert [second.total((SiteName.AFRO_LA, group)) for group in GROUPS] == [2, 1, 1]
+
+    @pytest.mark.unit
+    def test_shared_unavailable(self) -> None:
+        """
+        Counts should be served from memory while shared storage is down, and added to it once it's back.
+        """
+        server = fakeredis.FakeServer()
+        server.connected = False
+        counts = AssignmentCounts(shared=RedisAssignmentCounts(FakeRedis(server=server)))
+        counts.reconcile(Counter())
+        counts.add(SiteName.AFRO_LA, Group.A)
+
+        async def count() -> Counter[AssignmentKey]:
+            raise AssertionError("Not stale")
+
+        asyncio.run(counts.refresh(count))
+        assert counts.counts[(SiteName.AFRO_LA, Group.A)] == 1
+        assert counts.needs_flush
+
+        server.connected = True
+        asyncio.run(counts.flush())
+        assert not counts.needs_flush
+
+
+class TestStats:
+    @pytest.mark.unit
+    def test_expected_ratios(self) -> None:
+        assert get_expected_ratios(AssignmentConfig()) is None
+        assert get_expected_ratios(AssignmentConfig(weights={Group.A: 1, Group.B: 3})) == {
+            Group.A: 0.25,
+            Group.B: 0.75,
+            Group.C: 0,
+        }
+        assert get_expected_ratios(AssignmentConfig(enabled=False, control_group=Group.B)) == {
+            Group.A: 0,
+            Group.B: 1,
+            Group.C: 0,
+        }
+
+    @pytest.mark.unit
+    def test_stats(self) -> None:
+        counts = AssignmentCounts()
+        counts.reconcile(Counter({(SiteName.AFRO_LA, Group.A): 1, (SiteName.AFRO_LA, Group.B): 3}))
+        assignments = AssignmentRegistry({SiteName.AFRO_LA: AssignmentConfig(weights={Group.A: 1, Group.B: 1})})
+
+        stats = {site.site_name: site for site in get_stats(counts, assignments).sites}
+        assert set(stats) == set(SiteName)
+        afro_la = stats[SiteName.AFRO_LA]
+        assert afro_la.total == 4
+        assert [(group.group, group.count, group.ratio, group.expected_ratio) for group in afro_la.groups] == [
+            (Group.A, 1, 0.25, 0.5),
+            (Group.B, 3, 0.75, 0.5),
+            (Group.C, 0, 0.0, 0.0),
+        ]
+        assert stats[SiteName.THE_19TH].total == 0
+        assert all(group.expected_ratio is None for group in stats[SiteName.THE_19TH].groups)
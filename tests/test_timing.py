@@ -0,0 +1,30 @@
+import pytest
+
+from ata_api.monitoring.timing import RequestTimer, request_timer, timed_stage
+
+
+class TestTimedStage:
+    @pytest.mark.unit
+    def test_untimed(self) -> None:
+        with timed_stage("db"):
+            pass
+        assert request_timer.get() is None
+
+    @pytest.mark.unit
+    def test_adds_up_stages(self) -> None:
+        timer = RequestTimer()
+        token = request_timer.set(timer)
+        try:
+            with timed_stage("cache"):
+                pass
+            with timed_stage("db"):
+                pass
+            with timed_stage("cache"):
+                pass
+        finally:
+            request_timer.reset(token)
+        timer.finish()
+
+        assert list(timer.durations) == ["cache", "db", "total"]
+        assert all(duration >= 0 for duration in timer.durations.values())
+        assert timer.server_timing().startswith("cache;dur=")
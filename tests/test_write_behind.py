@@ -0,0 +1,42 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from ata_db_models.models import Group
+
+from ata_api.cache import PrescriptionCache, PrescriptionKey
+from ata_api.helpers.cache import LRUCache
+from ata_api.site import SiteName
+from ata_api.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def keys() -> list[PrescriptionKey]:
+    return [(SiteName.AFRO_LA, uuid4()) for _ in range(3)]
+
+
+@pytest.fixture
+def queue() -> WriteBehindQueue:
+    return WriteBehindQueue(PrescriptionCache(LRUCache(max_size=0)), max_size=2, batch_size=10, max_attempts=2)
+
+
+class TestWriteBehindQueue:
+    @pytest.mark.unit
+    def test_keeps_first_group(self, queue: WriteBehindQueue, keys: list[PrescriptionKey]) -> None:
+        async def run() -> None:
+            assert await queue.put(keys[0], Group.A) is True
+            assert await queue.put(keys[0], Group.B) is True
+
+        asyncio.run(run())
+        assert queue.get(keys[0]) == Group.A
+        assert len(queue) == 1
+
+    @pytest.mark.unit
+    def test_retries_at_front_then_drops(self, queue: WriteBehindQueue, keys: list[PrescriptionKey]) -> None:
+        asyncio.run(queue.put(keys[0], Group.A))
+        queue.retry({keys[1]: Group.B})
+        assert list(queue.pending) == [keys[1], keys[0]]
+
+        del queue.pending[keys[1]]
+        queue.retry({keys[1]: Group.B})
+        assert queue.get(keys[1]) is None